@@ -4,7 +4,7 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import format_html
 from simple_history.admin import SimpleHistoryAdmin
 from .models import (
-    Centre, School, Grade, Category, Subject, Book, BookIDSequence,
+    Centre, School, Grade, Category, Subject, Book, BookCopy, BookIDSequence, BookCodeSequence,
     CustomUser, Student, Borrow, Reservation, Notification,
     TeacherBookIssue, Catalogue
 )
@@ -29,6 +29,13 @@ class ReservationInline(admin.TabularInline):
     can_delete = False
 
 
+class BookCopyInline(admin.TabularInline):
+    model = BookCopy
+    extra = 0
+    fields = ('copy_number', 'barcode', 'condition', 'status', 'added_date')
+    readonly_fields = ('added_date',)
+
+
 class CatalogueInline(admin.TabularInline):
     model = Catalogue
     extra = 0
@@ -152,7 +159,7 @@ class BookAdmin(SimpleHistoryAdmin):
         'school', 'centre', 'isbn', 'is_active', 'is_available'
     )
     list_filter = (
-        'is_active', 'available_copies', 'school__centre', 'subject__category',
+        'is_active', 'school__centre', 'subject__category',
         'subject__grade', 'year_of_publication'
     )
     search_fields = (
@@ -160,8 +167,8 @@ class BookAdmin(SimpleHistoryAdmin):
         'subject__name', 'subject__grade__name', 'subject__category__name'
     )
     autocomplete_fields = ('subject', 'school', 'added_by')
-    readonly_fields = ('book_id', 'centre')
-    inlines = [BorrowInline, ReservationInline, CatalogueInline]
+    readonly_fields = ('book_id', 'centre', 'copies_total', 'copies_available')
+    inlines = [BookCopyInline, BorrowInline, ReservationInline, CatalogueInline]
 
     fieldsets = (
         ('Basic Information', {
@@ -171,7 +178,7 @@ class BookAdmin(SimpleHistoryAdmin):
             'fields': ('subject', 'school', 'centre')
         }),
         ('Status', {
-            'fields': ('is_active', 'available_copies')
+            'fields': ('is_active', 'copies_total', 'copies_available')
         }),
         ('Metadata', {
             'fields': ('book_id', 'added_by'),
@@ -188,8 +195,8 @@ class BookAdmin(SimpleHistoryAdmin):
     grade_display.short_description = 'Grade'
 
     def is_available(self, obj):
-        status = "Available" if obj.available_copies else "Borrowed"
-        color = "green" if obj.available_copies else "red"
+        status = f"{obj.copies_available}/{obj.copies_total} Available" if obj.copies_available else "Borrowed"
+        color = "green" if obj.copies_available else "red"
         return format_html(f'<span style="color: {color};">{status}</span>')
     is_available.short_description = 'Status'
 
@@ -199,6 +206,14 @@ class BookAdmin(SimpleHistoryAdmin):
         super().save_model(request, obj, form, change)
 
 
+@admin.register(BookCopy)
+class BookCopyAdmin(SimpleHistoryAdmin):
+    list_display = ('barcode', 'book', 'copy_number', 'condition', 'status', 'added_date')
+    list_filter = ('status', 'condition', 'book__centre')
+    search_fields = ('barcode', 'book__title', 'book__book_id')
+    autocomplete_fields = ('book',)
+
+
 @admin.register(Student)
 class StudentAdmin(admin.ModelAdmin):
     list_display = ('name', 'child_ID', 'user_email', 'school', 'grade')
@@ -273,6 +288,16 @@ class BookIDSequenceAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None): return request.user.is_superuser
 
 
+@admin.register(BookCodeSequence)
+class BookCodeSequenceAdmin(admin.ModelAdmin):
+    list_display = ('prefix', 'last_number')
+    search_fields = ('prefix',)
+
+    def has_add_permission(self, request): return request.user.is_superuser
+    def has_change_permission(self, request, obj=None): return request.user.is_superuser
+    def has_delete_permission(self, request, obj=None): return request.user.is_superuser
+
+
 # =============================================================================
 # Register CustomUser with fixed admin
 # =============================================================================
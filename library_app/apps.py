@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class LibraryAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'library_app'
+
+    def ready(self):
+        # Registers the search/autocomplete index, librarian roster, reference data and notification receivers
+        from .utils import search, autocomplete, notifications, refdata, stats, trends, rankings, widget_cache  # noqa: F401
+        from . import signals  # noqa: F401
@@ -0,0 +1,94 @@
+# library_app/management/commands/collapse_book_copies.py
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Lower, Trim
+
+from library_app.models import (
+    Book, BookCopy, Borrow, Reservation, TeacherBookIssue, Notification, Catalogue
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold duplicate Book rows (one row per physical copy) into a single title "
+        "with BookCopy rows. Books match on school, subject, title, author and ISBN."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--centre', type=int, help="Only collapse books in this centre (id)")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be merged without writing")
+
+    def handle(self, *args, **options):
+        books = Book.objects.annotate(
+            title_key=Lower(Trim('title')),
+            author_key=Lower(Trim('author')),
+            isbn_key=Trim('isbn'),
+        )
+        if options['centre']:
+            books = books.filter(centre_id=options['centre'])
+
+        key_fields = ('school_id', 'subject_id', 'title_key', 'author_key', 'isbn_key')
+        duplicate_keys = (
+            books.values(*key_fields)
+            .annotate(n=Count('id'))
+            .filter(n__gt=1)
+        )
+
+        groups = defaultdict(list)
+        for key in duplicate_keys:
+            filters = {f: key[f] for f in key_fields}
+            ids = books.filter(**filters).order_by('id').values_list('id', flat=True)
+            groups[tuple(key[f] for f in key_fields)] = list(ids)
+
+        merged_rows = 0
+        for ids in groups.values():
+            survivor_id, duplicate_ids = ids[0], ids[1:]
+            merged_rows += len(duplicate_ids)
+            if options['dry_run']:
+                self.stdout.write(f"Would merge books {duplicate_ids} into {survivor_id}")
+                continue
+            self.merge(survivor_id, duplicate_ids)
+
+        verb = "Would fold" if options['dry_run'] else "Folded"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {merged_rows} duplicate book rows into {len(groups)} titles"
+        ))
+
+    @transaction.atomic
+    def merge(self, survivor_id, duplicate_ids):
+        survivor = Book.objects.select_for_update().get(pk=survivor_id)
+
+        # Renumber the incoming copies after the survivor's own
+        next_number = (survivor.copies.aggregate(n=Max('copy_number'))['n'] or 0) + 1
+        incoming = BookCopy.objects.filter(book_id__in=duplicate_ids).order_by('book_id', 'copy_number')
+        for copy in incoming:
+            BookCopy.objects.filter(pk=copy.pk).update(book=survivor, copy_number=next_number)
+            next_number += 1
+
+        for model in (Borrow, Reservation, TeacherBookIssue, Notification):
+            model.objects.filter(book_id__in=duplicate_ids).update(book=survivor)
+
+        # Catalogue is unique per (book, centre): keep the survivor's shelf entry
+        survivor_centres = survivor.catalogue_entries.values_list('centre_id', flat=True)
+        Catalogue.objects.filter(book_id__in=duplicate_ids, centre_id__in=survivor_centres).delete()
+        for entry in Catalogue.objects.filter(book_id__in=duplicate_ids).order_by('id'):
+            if not Catalogue.objects.filter(book=survivor, centre_id=entry.centre_id).exists():
+                Catalogue.objects.filter(pk=entry.pk).update(book=survivor)
+        Catalogue.objects.filter(book_id__in=duplicate_ids).delete()
+
+        Book.objects.filter(pk__in=duplicate_ids).delete()
+
+        # One-off recount — the counters are maintained incrementally from here on.
+        # Applied as a delta so the catalogue rollup moves with it.
+        counts = survivor.copies.aggregate(
+            total=Count('id', filter=Q(status__in=BookCopy.IN_CIRCULATION)),
+            available=Count('id', filter=Q(status='available')),
+        )
+        Book.move_copy_counters(
+            survivor.pk,
+            total=counts['total'] - survivor.copies_total,
+            available=counts['available'] - survivor.copies_available,
+        )
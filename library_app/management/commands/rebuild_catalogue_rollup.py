@@ -0,0 +1,12 @@
+# library_app/management/commands/rebuild_catalogue_rollup.py
+from django.core.management.base import BaseCommand
+
+from library_app.models import CatalogueRollup
+
+
+class Command(BaseCommand):
+    help = "Recount the catalogue rollup (book counts per centre/school/subject) from the Book table."
+
+    def handle(self, *args, **options):
+        rows = CatalogueRollup.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} catalogue rollup rows"))
@@ -0,0 +1,22 @@
+# library_app/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+
+from library_app.utils.search import rebuild_book_index, rebuild_trigram_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the book full-text index and the trigram index used for fuzzy "
+        "title/author/student name search (needed after raw SQL imports or restores)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-trigrams', action='store_true', help="Only rebuild the full-text index")
+
+    def handle(self, *args, **options):
+        count = rebuild_book_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} books for full-text search"))
+
+        if not options['skip_trigrams']:
+            for kind, count in rebuild_trigram_index().items():
+                self.stdout.write(self.style.SUCCESS(f"Indexed {kind} trigrams for {count} rows"))
@@ -0,0 +1,26 @@
+# library_app/management/commands/reconcile_stats.py
+from django.core.management.base import BaseCommand
+
+from library_app.utils.stats import reconcile_copy_counters, reconcile_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount each book's copy counters and the dashboard statistics from the "
+        "source tables and correct any counter that drifted. Meant for cron, e.g. nightly."
+    )
+
+    def handle(self, *args, **options):
+        books = reconcile_copy_counters()
+        for book_id, (total, available), (counted_total, counted_available) in books:
+            self.stdout.write(
+                f"  book {book_id}: {available}/{total} -> {counted_available}/{counted_total} copies available"
+            )
+        if books:
+            self.stdout.write(self.style.SUCCESS(f"Corrected the copy counters of {len(books)} book(s)"))
+
+        corrections = reconcile_stats()
+        for scope, name, stored, counted in corrections:
+            where = 'system-wide' if scope == 0 else f'centre {scope}'
+            self.stdout.write(f"  {name} ({where}): {stored} -> {counted}")
+        self.stdout.write(self.style.SUCCESS(f"Corrected {len(corrections)} counter(s)"))
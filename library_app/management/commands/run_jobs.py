@@ -0,0 +1,62 @@
+# library_app/management/commands/run_jobs.py
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from library_app.models import BackgroundJob
+from library_app.utils.jobs import run_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (book/student imports, full exports). Start a "
+        "few of these next to the web workers; each runs one job at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run the jobs queued right now, then exit")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument('--max-jobs', type=int, default=0, help="Exit after this many jobs (0 = no limit)")
+        parser.add_argument(
+            '--stale-after', type=int, default=900,
+            help="Requeue running jobs with no progress report for this many seconds",
+        )
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.stdout.write(f"Worker {worker} waiting for jobs")
+
+        done = 0
+        while not self.stopping:
+            close_old_connections()
+            requeued, failed = BackgroundJob.requeue_stale(options['stale_after'])
+            if requeued or failed:
+                self.stdout.write(self.style.WARNING(f"Requeued {requeued} and failed {failed} stale job(s)"))
+
+            job = BackgroundJob.claim_next(worker)
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            started = time.monotonic()
+            self.stdout.write(f"Running {job}")
+            run_job(job)
+            style = self.style.SUCCESS if job.status == 'done' else self.style.ERROR
+            self.stdout.write(style(f"Finished {job} in {time.monotonic() - started:.1f}s"))
+
+            done += 1
+            if options['max_jobs'] and done >= options['max_jobs']:
+                break
+
+    def stop(self, signum, frame):
+        # Finish the current job, then exit
+        self.stopping = True
@@ -0,0 +1,25 @@
+# library_app/management/commands/sweep_circulation_windows.py
+from django.core.management.base import BaseCommand
+
+from library_app.utils.rankings import rebuild_circulation_windows, sweep_circulation_windows
+
+
+class Command(BaseCommand):
+    help = (
+        "Take each past day's issues out of the 30/90/365-day \"most borrowed\" windows "
+        "they have left. Meant for cron, e.g. daily just after midnight."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help="Recount every book's counters from the Borrow table instead",
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rows = rebuild_circulation_windows()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} book circulation counter(s)"))
+            return
+        days = sweep_circulation_windows()
+        self.stdout.write(self.style.SUCCESS(f"Aged the circulation windows by {days} day(s)"))
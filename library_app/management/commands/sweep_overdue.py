@@ -0,0 +1,25 @@
+# library_app/management/commands/sweep_overdue.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from library_app.utils.reminders import sweep_reminders, DUE_SOON_WINDOW
+
+
+class Command(BaseCommand):
+    help = (
+        "Send overdue and due-soon reminders for loans that fell due since the last run. "
+        "Meant for cron, e.g. every 15 minutes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--due-soon-hours', type=float, default=DUE_SOON_WINDOW.total_seconds() / 3600,
+            help="Remind borrowers this many hours before a loan is due",
+        )
+
+    def handle(self, *args, **options):
+        counts = sweep_reminders(window=timedelta(hours=options['due_soon_hours']))
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {counts['overdue']} overdue and {counts['due_soon']} due-soon reminder(s)"
+        ))
@@ -0,0 +1,17 @@
+# library_app/management/commands/sweep_reservations.py
+from django.core.management.base import BaseCommand
+
+from library_app.utils.holds import expire_holds
+
+
+class Command(BaseCommand):
+    help = (
+        "Expire reservations past their expiry date and pass freed copies to the "
+        "next reservation in each queue. Meant for cron, e.g. hourly."
+    )
+
+    def handle(self, *args, **options):
+        expired, promoted = expire_holds()
+        self.stdout.write(self.style.SUCCESS(
+            f"Expired {expired} reservation(s); promoted {promoted} waiting reservation(s)"
+        ))
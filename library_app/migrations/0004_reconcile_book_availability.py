@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def reconcile_availability(apps, schema_editor):
+    """One-off sync of the maintained flag with currently issued borrows."""
+    Book = apps.get_model('library_app', 'Book')
+    Borrow = apps.get_model('library_app', 'Borrow')
+
+    issued_book_ids = Borrow.objects.filter(status='issued').values('book_id')
+    Book.objects.filter(id__in=issued_book_ids).update(available_copies=False)
+    Book.objects.exclude(id__in=issued_book_ids).update(available_copies=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0003_customuser_is_other_alter_customuser_email'),
+    ]
+
+    operations = [
+        migrations.RunPython(reconcile_availability, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,131 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:08
+
+import django.db.models.deletion
+import simple_history.models
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def create_initial_copies(apps, schema_editor):
+    """Every existing Book row was one physical copy — give it a BookCopy."""
+    Book = apps.get_model('library_app', 'Book')
+    BookCopy = apps.get_model('library_app', 'BookCopy')
+    Borrow = apps.get_model('library_app', 'Borrow')
+
+    copies = [
+        BookCopy(
+            book_id=pk,
+            copy_number=1,
+            barcode=f"{book_id or f'BOOK{pk}'}-C01",
+            status='available' if available else 'issued',
+        )
+        for pk, book_id, available in Book.objects.values_list('id', 'book_id', 'available_copies').iterator()
+    ]
+    BookCopy.objects.bulk_create(copies, batch_size=1000)
+
+    Book.objects.update(copies_total=1)
+    Book.objects.filter(available_copies=True).update(copies_available=1)
+
+    Borrow.objects.filter(status='issued').update(
+        copy=Subquery(BookCopy.objects.filter(book_id=OuterRef('book_id')).values('id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0004_reconcile_book_availability'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='copies_available',
+            field=models.PositiveIntegerField(default=0, help_text='Copies currently on the shelf'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_total',
+            field=models.PositiveIntegerField(default=0, help_text='Copies in circulation (excludes lost/withdrawn)'),
+        ),
+        migrations.AddField(
+            model_name='historicalbook',
+            name='copies_available',
+            field=models.PositiveIntegerField(default=0, help_text='Copies currently on the shelf'),
+        ),
+        migrations.AddField(
+            model_name='historicalbook',
+            name='copies_total',
+            field=models.PositiveIntegerField(default=0, help_text='Copies in circulation (excludes lost/withdrawn)'),
+        ),
+        migrations.CreateModel(
+            name='BookCopy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('copy_number', models.PositiveIntegerField(help_text='Copy number within the title (1, 2, 3 ...)')),
+                ('barcode', models.CharField(blank=True, max_length=120, unique=True)),
+                ('condition', models.CharField(choices=[('new', 'New'), ('good', 'Good'), ('fair', 'Fair'), ('poor', 'Poor'), ('damaged', 'Damaged')], default='good', max_length=20)),
+                ('status', models.CharField(choices=[('available', 'Available'), ('issued', 'Issued'), ('lost', 'Lost'), ('withdrawn', 'Withdrawn')], default='available', max_length=20)),
+                ('added_date', models.DateTimeField(auto_now_add=True)),
+                ('notes', models.TextField(blank=True, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='copies', to='library_app.book')),
+            ],
+            options={
+                'verbose_name_plural': 'Book Copies',
+                'ordering': ['book', 'copy_number'],
+            },
+        ),
+        migrations.AddField(
+            model_name='borrow',
+            name='copy',
+            field=models.ForeignKey(blank=True, help_text='The physical copy handed out.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='borrows', to='library_app.bookcopy'),
+        ),
+        migrations.AddField(
+            model_name='historicalborrow',
+            name='copy',
+            field=models.ForeignKey(blank=True, db_constraint=False, help_text='The physical copy handed out.', null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='library_app.bookcopy'),
+        ),
+        migrations.CreateModel(
+            name='HistoricalBookCopy',
+            fields=[
+                ('id', models.BigIntegerField(auto_created=True, blank=True, db_index=True, verbose_name='ID')),
+                ('copy_number', models.PositiveIntegerField(help_text='Copy number within the title (1, 2, 3 ...)')),
+                ('barcode', models.CharField(blank=True, db_index=True, max_length=120)),
+                ('condition', models.CharField(choices=[('new', 'New'), ('good', 'Good'), ('fair', 'Fair'), ('poor', 'Poor'), ('damaged', 'Damaged')], default='good', max_length=20)),
+                ('status', models.CharField(choices=[('available', 'Available'), ('issued', 'Issued'), ('lost', 'Lost'), ('withdrawn', 'Withdrawn')], default='available', max_length=20)),
+                ('added_date', models.DateTimeField(blank=True, editable=False)),
+                ('notes', models.TextField(blank=True, null=True)),
+                ('history_id', models.AutoField(primary_key=True, serialize=False)),
+                ('history_date', models.DateTimeField(db_index=True)),
+                ('history_change_reason', models.CharField(max_length=100, null=True)),
+                ('history_type', models.CharField(choices=[('+', 'Created'), ('~', 'Changed'), ('-', 'Deleted')], max_length=1)),
+                ('book', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='library_app.book')),
+                ('history_user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'historical book copy',
+                'verbose_name_plural': 'historical Book Copies',
+                'ordering': ('-history_date', '-history_id'),
+                'get_latest_by': ('history_date', 'history_id'),
+            },
+            bases=(simple_history.models.HistoricalChanges, models.Model),
+        ),
+        migrations.AddIndex(
+            model_name='bookcopy',
+            index=models.Index(fields=['book', 'status'], name='library_app_book_id_5d00ca_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='bookcopy',
+            unique_together={('book', 'copy_number')},
+        ),
+        migrations.RunPython(create_initial_copies, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='book',
+            name='available_copies',
+        ),
+        migrations.RemoveField(
+            model_name='historicalbook',
+            name='available_copies',
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+SEARCH_COLUMNS = 'title, author, isbn, book_id, book_code'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE library_app_book_fts USING fts5("
+            f"{SEARCH_COLUMNS}, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO library_app_book_fts (rowid, {SEARCH_COLUMNS}) "
+            f"SELECT id, title, author, isbn, book_id, COALESCE(book_code, '') FROM library_app_book"
+        )
+    elif vendor == 'mysql':
+        schema_editor.execute(
+            f"ALTER TABLE library_app_book ADD FULLTEXT INDEX library_app_book_fulltext ({SEARCH_COLUMNS})"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS library_app_book_fts")
+    elif vendor == 'mysql':
+        schema_editor.execute("ALTER TABLE library_app_book DROP INDEX library_app_book_fulltext")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0005_book_copies'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
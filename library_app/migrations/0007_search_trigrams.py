@@ -0,0 +1,65 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:12
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+def trigrams(text):
+    # Frozen copy of utils.search.make_trigrams at the time of this migration
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    grams = set()
+    for word in re.findall(r'\w+', text):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def populate_trigrams(apps, schema_editor):
+    Book = apps.get_model('library_app', 'Book')
+    Student = apps.get_model('library_app', 'Student')
+    SearchTrigram = apps.get_model('library_app', 'SearchTrigram')
+
+    sources = [
+        ('book_title', Book.objects.values_list('id', 'title')),
+        ('book_author', Book.objects.values_list('id', 'author')),
+        ('student_name', Student.objects.values_list('id', 'name')),
+    ]
+    rows = []
+    for kind, values in sources:
+        for object_id, text in values.iterator(chunk_size=2000):
+            grams = trigrams(text)
+            rows.extend(
+                SearchTrigram(kind=kind, trigram=gram, object_id=object_id, gram_count=len(grams))
+                for gram in grams
+            )
+            if len(rows) >= 5000:
+                SearchTrigram.objects.bulk_create(rows)
+                rows = []
+    SearchTrigram.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0006_book_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('book_title', 'Book title'), ('book_author', 'Book author'), ('student_name', 'Student name')], max_length=20)),
+                ('trigram', models.CharField(max_length=3)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('gram_count', models.PositiveSmallIntegerField(help_text='Distinct trigrams in the indexed text')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'trigram', 'object_id'], name='library_app_kind_d12b21_idx'), models.Index(fields=['kind', 'object_id'], name='library_app_kind_37e5fd_idx')],
+            },
+        ),
+        migrations.RunPython(populate_trigrams, migrations.RunPython.noop),
+    ]
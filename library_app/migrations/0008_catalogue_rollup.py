@@ -0,0 +1,60 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum, Q
+
+
+def populate_rollup(apps, schema_editor):
+    Book = apps.get_model('library_app', 'Book')
+    CatalogueRollup = apps.get_model('library_app', 'CatalogueRollup')
+
+    groups = (
+        Book.objects.values('centre_id', 'school_id', 'subject_id', 'subject__grade_id', 'subject__category_id')
+        .annotate(
+            n_books=Count('id'),
+            n_available=Count('id', filter=Q(copies_available__gt=0)),
+            n_copies=Sum('copies_total'),
+            n_on_shelf=Sum('copies_available'),
+        )
+        .order_by()
+    )
+    CatalogueRollup.objects.bulk_create([
+        CatalogueRollup(
+            centre_id=g['centre_id'], school_id=g['school_id'], subject_id=g['subject_id'],
+            grade_id=g['subject__grade_id'], category_id=g['subject__category_id'],
+            book_count=g['n_books'], available_count=g['n_available'],
+            copies_total=g['n_copies'] or 0, copies_available=g['n_on_shelf'] or 0,
+        )
+        for g in groups
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0007_search_trigrams'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book_count', models.IntegerField(default=0, help_text='Titles')),
+                ('available_count', models.IntegerField(default=0, help_text='Titles with at least one copy on the shelf')),
+                ('copies_total', models.IntegerField(default=0)),
+                ('copies_available', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='catalogue_rollups', to='library_app.category')),
+                ('centre', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='catalogue_rollups', to='library_app.centre')),
+                ('grade', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='catalogue_rollups', to='library_app.grade')),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalogue_rollups', to='library_app.school')),
+                ('subject', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='catalogue_rollups', to='library_app.subject')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['school', 'grade'], name='library_app_school__3daa8f_idx'), models.Index(fields=['school', 'category'], name='library_app_school__798eca_idx')],
+                'unique_together': {('centre', 'school', 'subject')},
+            },
+        ),
+        migrations.RunPython(populate_rollup, migrations.RunPython.noop),
+    ]
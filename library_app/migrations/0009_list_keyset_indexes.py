@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0008_catalogue_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['school', 'title'], name='library_app_school__965022_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['centre', 'request_date'], name='library_app_centre__6d91d8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['centre', 'status', 'due_date'], name='library_app_centre__128edc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at'], name='library_app_user_id_0fe9c6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['centre', 'name'], name='library_app_centre__df7aec_idx'),
+        ),
+    ]
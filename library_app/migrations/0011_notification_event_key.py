@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0010_background_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='event_key',
+            field=models.CharField(blank=True, editable=False, help_text='Identifies the event this notification is for, so it is only sent once', max_length=150, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0011_notification_event_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SweepMark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('high_water', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('borrow_request', 'Borrow Request'), ('borrow_approved', 'Borrow Approved'), ('borrow_rejected', 'Borrow Rejected'), ('book_issued', 'Book Issued'), ('book_returned', 'Book Returned'), ('book_available', 'Book Available'), ('reservation_fulfilled', 'Reservation Fulfilled'), ('teacher_bulk_request', 'Teacher Bulk Request'), ('overdue_reminder', 'Overdue Reminder'), ('due_soon', 'Due Soon')], default='borrow_request', max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['status', 'due_date'], name='library_app_status_7bbadb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teacherbookissue',
+            index=models.Index(fields=['status', 'expected_return_date'], name='library_app_status_2032c1_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0012_overdue_sweep'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['book', 'status', 'reservation_date'], name='library_app_book_id_ffc7c8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['status', 'expiry_date'], name='library_app_status_07ebc4_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:53
+
+import re
+
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    """Start each prefix after the highest number already used (numerically, so MAT-10000 beats MAT-9999)."""
+    Book = apps.get_model('library_app', 'Book')
+    BookCodeSequence = apps.get_model('library_app', 'BookCodeSequence')
+
+    last = {}
+    codes = Book.objects.exclude(book_code__isnull=True).exclude(book_code='').values_list('book_code', flat=True)
+    for code in codes.iterator(chunk_size=2000):
+        match = re.match(r'^([A-Z]{1,10})-(\d+)$', code)
+        if match:
+            prefix, number = match.group(1), int(match.group(2))
+            last[prefix] = max(last.get(prefix, 0), number)
+    BookCodeSequence.objects.bulk_create(
+        [BookCodeSequence(prefix=prefix, last_number=number) for prefix, number in last.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0013_reservation_hold_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookCodeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=10, unique=True)),
+                ('last_number', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
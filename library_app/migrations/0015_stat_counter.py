@@ -0,0 +1,68 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:08
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def seed_counters(apps, schema_editor):
+    get = lambda name: apps.get_model('library_app', name)
+    centre_counters = (
+        'books', 'available_books', 'students', 'borrows', 'active_borrows',
+        'pending_requests', 'teacher_issues', 'reservations',
+    )
+    counts = {0: dict.fromkeys(centre_counters, 0)}
+    for centre_id in get('Centre').objects.values_list('pk', flat=True):
+        counts[centre_id] = dict.fromkeys(centre_counters, 0)
+
+    def add(queryset, centre_field, **aggregates):
+        for row in queryset.values(centre_field).annotate(**aggregates).order_by():
+            for scope in {0, row[centre_field]}:
+                if scope in counts:
+                    for name in aggregates:
+                        counts[scope][name] += row[name]
+
+    add(get('Book').objects, 'centre_id', books=Count('id'), available_books=Count('id', filter=Q(copies_available__gt=0)))
+    add(get('Student').objects, 'centre_id', students=Count('id'))
+    add(
+        get('Borrow').objects, 'centre_id', borrows=Count('id'),
+        active_borrows=Count('id', filter=Q(status='issued')),
+        pending_requests=Count('id', filter=Q(status='requested')),
+    )
+    add(get('TeacherBookIssue').objects, 'teacher__centre_id', teacher_issues=Count('id'))
+    add(get('Reservation').objects, 'centre_id', reservations=Count('id'))
+    counts[0].update(
+        centres=len(counts) - 1,
+        users=get('CustomUser').objects.count(),
+        grades=get('Grade').objects.count(),
+        subjects=get('Subject').objects.count(),
+    )
+
+    StatCounter = get('StatCounter')
+    StatCounter.objects.bulk_create([
+        StatCounter(scope=scope, name=name, value=value)
+        for scope, values in counts.items()
+        for name, value in values.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0014_book_code_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.PositiveIntegerField(help_text='Centre id, or 0 for system-wide totals')),
+                ('name', models.CharField(max_length=30)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('scope', 'name')},
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+
+
+def seed_days(apps, schema_editor):
+    Borrow = apps.get_model('library_app', 'Borrow')
+    CirculationDay = apps.get_model('library_app', 'CirculationDay')
+    SweepMark = apps.get_model('library_app', 'SweepMark')
+
+    # Overdues only up to the overdue sweep's mark; the sweep counts the rest
+    swept_until = SweepMark.objects.filter(name='overdue_reminders').values_list('high_water', flat=True).first()
+    queries = {
+        'requests': ('request_date', Q()),
+        'issues': ('issue_date', Q()),
+        'returns': ('return_date', Q()),
+    }
+    if swept_until:
+        queries['overdues'] = ('due_date', Q(status__in=['issued', 'returned'], due_date__lte=swept_until) & (
+            Q(return_date__isnull=True) | Q(return_date__gt=F('due_date'))
+        ))
+    facts = {}
+    for fact, (field, condition) in queries.items():
+        groups = (
+            Borrow.objects.filter(condition, **{f'{field}__isnull': False})
+            .values('centre_id', local_day=TruncDate(field))
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+        for group in groups:
+            facts.setdefault((group['centre_id'], group['local_day']), {})[fact] = group['n']
+    CirculationDay.objects.bulk_create([
+        CirculationDay(centre_id=centre_id, day=day, **row) for (centre_id, day), row in facts.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0015_stat_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('issues', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('overdues', models.PositiveIntegerField(default=0, help_text='Loans whose due date fell on this day and were not back by then')),
+                ('centre', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='circulation_days', to='library_app.centre')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='library_app_day_1c864d_idx')],
+                'unique_together': {('centre', 'day')},
+            },
+        ),
+        migrations.RunPython(seed_days, migrations.RunPython.noop),
+    ]
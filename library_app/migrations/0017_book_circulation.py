@@ -0,0 +1,103 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:20
+
+import django.db.models.deletion
+from datetime import datetime, time, timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+WINDOWS = {'all': None, '30d': 30, '90d': 90, '365d': 365}
+
+
+def seed_counters(apps, schema_editor):
+    Borrow = apps.get_model('library_app', 'Borrow')
+    Book = apps.get_model('library_app', 'Book')
+    BookCirculation = apps.get_model('library_app', 'BookCirculation')
+    SweepMark = apps.get_model('library_app', 'SweepMark')
+
+    today = timezone.localdate()
+    aggregates = {'n_all': Count('id')}
+    for window, days in WINDOWS.items():
+        if days is not None:
+            since = timezone.make_aware(datetime.combine(today - timedelta(days=days - 1), time.min))
+            aggregates[f'n_{window}'] = Count('id', filter=Q(issue_date__gte=since))
+    counts = {
+        row.pop('book_id'): row
+        for row in Borrow.objects.filter(issue_date__isnull=False).values('book_id').annotate(**aggregates).order_by()
+    }
+    scopes = Book.objects.filter(pk__in=list(counts)).values('pk', 'centre_id', 'school_id', grade_id=F('subject__grade_id'))
+    BookCirculation.objects.bulk_create([
+        BookCirculation(
+            book_id=scope['pk'], window=window, issues=counts[scope['pk']][f'n_{window}'],
+            centre_id=scope['centre_id'], school_id=scope['school_id'], grade_id=scope['grade_id'],
+        )
+        for scope in scopes
+        for window in WINDOWS
+    ], batch_size=1000)
+    SweepMark.objects.update_or_create(
+        name='circulation_windows', defaults={'high_water': timezone.make_aware(datetime.combine(today, time.min))}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0016_circulation_day'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookCirculation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(choices=[('all', 'all'), ('30d', '30d'), ('90d', '90d'), ('365d', '365d')], max_length=4)),
+                ('issues', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['issue_date'], name='library_app_issue_d_309f51_idx'),
+        ),
+        migrations.AddField(
+            model_name='bookcirculation',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='circulation', to='library_app.book'),
+        ),
+        migrations.AddField(
+            model_name='bookcirculation',
+            name='centre',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='library_app.centre'),
+        ),
+        migrations.AddField(
+            model_name='bookcirculation',
+            name='grade',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='library_app.grade'),
+        ),
+        migrations.AddField(
+            model_name='bookcirculation',
+            name='school',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='library_app.school'),
+        ),
+        migrations.AddIndex(
+            model_name='bookcirculation',
+            index=models.Index(fields=['window', '-issues'], name='library_app_window_d81b7e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookcirculation',
+            index=models.Index(fields=['window', 'centre', '-issues'], name='library_app_window_f8ad45_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookcirculation',
+            index=models.Index(fields=['window', 'school', '-issues'], name='library_app_window_b4bfec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookcirculation',
+            index=models.Index(fields=['window', 'grade', '-issues'], name='library_app_window_dd2101_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='bookcirculation',
+            unique_together={('book', 'window')},
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
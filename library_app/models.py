@@ -1,8 +1,11 @@
 from simple_history.models import HistoricalRecords
+from simple_history.utils import bulk_create_with_history
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser, PermissionsMixin, Group, Permission
 from django.contrib.auth.base_user import BaseUserManager
 from django.db import models, transaction
-from django.db.models import F
+from django.db.models import F, Max, Count, Sum, Q, Case, When, Value
+from django.db.models.functions import TruncDate
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
@@ -10,7 +13,10 @@ from datetime import timedelta
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
+import functools
 import re
+import threading
+from collections import Counter
 from datetime import datetime
 
 from django.db import models
@@ -110,6 +116,173 @@ class BookIDSequence(models.Model):
     def __str__(self):
         return f"{self.centre} - {self.subject or 'General'} #{self.last_number}"
 
+    @classmethod
+    def reserve(cls, centre, subject, count=1):
+        """
+        Claim `count` consecutive numbers for (centre, subject) and return
+        them as a range. Bulk imports reserve their whole block at once.
+
+        SQLite/PostgreSQL bump the counter with UPDATE ... RETURNING, and MySQL
+        with UPDATE ... LAST_INSERT_ID(), so the row is only locked for that
+        one statement. Other backends fall back to SELECT ... FOR UPDATE.
+        """
+        connection = transaction.get_connection()
+        if connection.vendor in ('sqlite', 'postgresql', 'mysql'):
+            where = {'centre_id': getattr(centre, 'pk', centre), 'subject_id': getattr(subject, 'pk', subject)}
+            while True:
+                last = bump_counter(connection, cls, where, count)
+                if last is not None:
+                    return range(last - count + 1, last + 1)
+                # First book for this centre+subject: create the row, then bump it
+                cls.objects.get_or_create(centre=centre, subject=subject)
+
+        with transaction.atomic():
+            seq, _ = cls.objects.select_for_update().get_or_create(
+                centre=centre,
+                subject=subject,
+                defaults={'last_number': 0}
+            )
+            first = seq.last_number + 1
+            seq.last_number += count
+            seq.save(update_fields=['last_number'])
+        return range(first, first + count)
+
+    @classmethod
+    def next_number(cls, centre, subject):
+        """
+        One number for a new book, from a block of settings.BOOK_ID_BLOCK_SIZE
+        reserved by this process. Books saved at once by several processes take
+        numbers from different blocks, so book_ids are unique but not in
+        creation order, and numbers left in a block when a process exits are
+        skipped.
+        """
+        key = (getattr(centre, 'pk', centre), getattr(subject, 'pk', subject))
+        with _book_number_lock:
+            block = _book_number_blocks.get(key)
+            if block:
+                return block.pop(0)
+
+        block_size = max(getattr(settings, 'BOOK_ID_BLOCK_SIZE', 1), 1)
+        numbers = list(cls.reserve(centre, subject, block_size))
+        number, rest = numbers[0], numbers[1:]
+        if rest:
+            # A block reserved inside a transaction that rolls back is given out again; only keep committed ones
+            transaction.on_commit(lambda: _stash_book_numbers(key, rest))
+        return number
+
+
+def bump_counter(connection, model, where, count):
+    """
+    Add `count` to the last_number of the `model` row matching `where`
+    ({column: value}) in one statement, returning the new value, or None if
+    there is no such row. SQLite/PostgreSQL use UPDATE ... RETURNING, MySQL
+    UPDATE ... LAST_INSERT_ID(); the caller checks connection.vendor.
+    """
+    qn = connection.ops.quote_name
+    conditions, params = [], [count]
+    for name, value in where.items():
+        if value is None:
+            # NULL never matches a unique key, which is why this isn't an ON CONFLICT upsert
+            conditions.append(f"{qn(name)} IS NULL")
+        else:
+            conditions.append(f"{qn(name)} = %s")
+            params.append(value)
+    where_sql = "WHERE " + " AND ".join(conditions)
+    table, column = qn(model._meta.db_table), qn('last_number')
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                f"UPDATE {table} SET {column} = LAST_INSERT_ID({column} + %s) {where_sql}", params
+            )
+            if not cursor.rowcount:
+                return None
+            cursor.execute("SELECT LAST_INSERT_ID()")
+        else:
+            cursor.execute(
+                f"UPDATE {table} SET {column} = {column} + %s {where_sql} RETURNING {column}", params
+            )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+# Numbers reserved but not yet used by this process, per (centre_id, subject_id)
+_book_number_blocks = {}
+_book_number_lock = threading.Lock()
+
+
+def _stash_book_numbers(key, numbers):
+    with _book_number_lock:
+        _book_number_blocks.setdefault(key, []).extend(numbers)
+
+
+_BOOK_ID_PREFIX_STRIP = re.compile(r'[^A-Z0-9]')
+
+
+@functools.lru_cache(maxsize=1024)
+def book_id_prefix(name):
+    """'St. Mary's' -> 'STMA': the 4-character centre/subject part of a book_id."""
+    return _BOOK_ID_PREFIX_STRIP.sub('', name.upper())[:4].ljust(4, 'X')
+
+
+@functools.lru_cache(maxsize=1024)
+def book_code_prefix(name):
+    """'Mathematics' -> 'MAT': the letters part of a subject's book_codes ('MISC' if it has none)."""
+    return re.sub(r'[^A-Z]', '', name.upper())[:3] or "MISC"
+
+
+class BookCodeSequence(models.Model):
+    """
+    Last number used per book_code prefix (MAT-0001, MAT-0002, ...), so the
+    next code is one indexed lookup instead of a scan over Book.book_code.
+    """
+    CODE_RE = re.compile(r'^([A-Z]+)-(\d+)$')
+
+    prefix = models.CharField(max_length=10, unique=True)
+    last_number = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.prefix} #{self.last_number}"
+
+    @staticmethod
+    def make_code(prefix, number):
+        return f"{prefix}-{number:04d}"
+
+    @classmethod
+    def peek(cls, prefix):
+        """The code the next book with this prefix will get (nothing is reserved)."""
+        last = cls.objects.filter(prefix=prefix).values_list('last_number', flat=True).first() or 0
+        return cls.make_code(prefix, last + 1)
+
+    @classmethod
+    def reserve(cls, prefix, count=1):
+        """Claim `count` consecutive codes for `prefix` and return them as a list."""
+        connection = transaction.get_connection()
+        if connection.vendor in ('sqlite', 'postgresql', 'mysql'):
+            while True:
+                last = bump_counter(connection, cls, {'prefix': prefix}, count)
+                if last is not None:
+                    break
+                cls.objects.get_or_create(prefix=prefix)
+        else:
+            with transaction.atomic():
+                seq, _ = cls.objects.select_for_update().get_or_create(prefix=prefix)
+                seq.last_number += count
+                seq.save(update_fields=['last_number'])
+                last = seq.last_number
+        return [cls.make_code(prefix, number) for number in range(last - count + 1, last + 1)]
+
+    @classmethod
+    def claim(cls, code):
+        """Move the counter past a hand-entered code such as 'MAT-0150', so it is never generated again."""
+        match = cls.CODE_RE.match(code or '')
+        if not match or len(match.group(1)) > cls._meta.get_field('prefix').max_length:
+            return
+        prefix, number = match.group(1), int(match.group(2))
+        if not cls.objects.filter(prefix=prefix, last_number__lt=number).update(last_number=number):
+            cls.objects.get_or_create(prefix=prefix, defaults={'last_number': number})
+
+
 class CustomUserManager(BaseUserManager):
     def create_user(self, login_id, password=None, **extra_fields):
         if not login_id:
@@ -219,16 +392,24 @@ class Book(models.Model):
     book_id = models.CharField(max_length=100, unique=True, blank=True)
     book_code = models.CharField(max_length=50, blank=True, null=True)
     added_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='added_books')
-    available_copies = models.BooleanField(default=True)
+    # Maintained counters — moved by conditional UPDATEs, never recounted
+    copies_total = models.PositiveIntegerField(default=0, help_text="Copies in circulation (excludes lost/withdrawn)")
+    copies_available = models.PositiveIntegerField(default=0, help_text="Copies currently on the shelf")
     is_active = models.BooleanField(default=True)
     history = HistoricalRecords()
 
+    # (centre, school, subject) as last read from / written to the DB — the
+    # CatalogueRollup row this book is counted under
+    _persisted_rollup_key = None
+    _persisted_book_code = None
+
     class Meta:
         ordering = ['title']
         indexes = [
             models.Index(fields=['centre']),
             models.Index(fields=['subject']),
             models.Index(fields=['school']),
+            models.Index(fields=['school', 'title']),
         ]
 
     def clean(self):
@@ -261,20 +442,131 @@ class Book(models.Model):
 
         # ONLY generate book_id when creating a new book (not on update)
         if not self.pk and not self.book_id and self.centre:
+            number = BookIDSequence.next_number(self.centre, self.subject)
+            self.book_id = Book.make_book_id(self.centre, self.subject, number)
+
+        if not self.pk and not self.book_code and self.subject:
+            self.book_code = BookCodeSequence.reserve(book_code_prefix(self.subject.name))[0]
+        elif self.book_code and self.book_code != self._persisted_book_code:
+            BookCodeSequence.claim(self.book_code)
+
+        if self._state.adding:
+            super().save(*args, **kwargs)
+        else:
             with transaction.atomic():
-                seq, _ = BookIDSequence.objects.select_for_update().get_or_create(
-                    centre=self.centre,
-                    subject=self.subject,
-                    defaults={'last_number': 0}
+                # The copy counters only move by UPDATE (move_copy_counters): write
+                # back what is stored now, not what this instance loaded, so an
+                # issue or return since then isn't undone
+                counters = (
+                    Book.objects.select_for_update().filter(pk=self.pk)
+                    .values('copies_total', 'copies_available').first()
                 )
-                seq.last_number += 1
-                seq.save()
+                if counters:
+                    self.copies_total = counters['copies_total']
+                    self.copies_available = counters['copies_available']
+                super().save(*args, **kwargs)
+        self._persisted_rollup_key = self.rollup_key()
+        self._persisted_book_code = self.book_code
+
+    @staticmethod
+    def make_book_id(centre, subject, number, year=None):
+        """CENT/SUBJ/0001/2025 — the format every generated book_id follows"""
+        c_prefix = book_id_prefix(centre.name)
+        s_prefix = book_id_prefix(subject.name if subject else "GEN")
+        return f"{c_prefix}/{s_prefix}/{number:04d}/{year or timezone.now().year}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if {'centre_id', 'school_id', 'subject_id'} <= set(field_names):
+            instance._persisted_rollup_key = instance.rollup_key()
+        if 'book_code' in field_names:
+            instance._persisted_book_code = instance.book_code
+        return instance
+
+    def rollup_key(self):
+        return (self.centre_id, self.school_id, self.subject_id)
+
+    def is_available(self):
+        """Check availability from the maintained counter — no Borrow lookups"""
+        return self.is_active and self.copies_available > 0
+
+    def update_available_copies(self, delta):
+        """
+        Move the copies_available counter by one issue (-1) or return (+1).
+        Runs a single conditional UPDATE so the counter never drops below zero
+        or rises above copies_total. Returns True if the row changed.
+        """
+        if delta < 0:
+            guard = {'copies_available__gte': -delta}
+        else:
+            guard = {'copies_available__lte': F('copies_total') - delta}
+
+        updated = Book.move_copy_counters(self.pk, available=delta, **guard)
+        if updated:
+            self.copies_available += delta
+        return updated
+
+    @staticmethod
+    def move_copy_counters(book_id, total=0, available=0, **guard):
+        """
+        Shift one book's copy counters with an F() UPDATE (skipped unless the row
+        matches `guard`) and mirror the change into its CatalogueRollup row.
+        Returns True if the book row changed.
+        """
+        with transaction.atomic():
+            updated = Book.objects.filter(pk=book_id, **guard).update(
+                copies_total=F('copies_total') + total,
+                copies_available=F('copies_available') + available,
+            )
+            if not updated:
+                return False
+            # Our UPDATE holds the row, so this read sees exactly our change
+            row = Book.objects.values('centre_id', 'school_id', 'subject_id', 'copies_available').get(pk=book_id)
+            now_on_shelf = row['copies_available'] > 0
+            was_on_shelf = row['copies_available'] - available > 0
+            CatalogueRollup.bump(
+                (row['centre_id'], row['school_id'], row['subject_id']),
+                available_count=now_on_shelf - was_on_shelf,
+                copies_total=total,
+                copies_available=available,
+            )
+        return True
 
-                c_prefix = re.sub(r'[^A-Z0-9]', '', self.centre.name.upper())[:4].ljust(4, 'X')
-                s_prefix = re.sub(r'[^A-Z0-9]', '', (self.subject.name if self.subject else "GEN").upper())[:4].ljust(4, 'X')
-                self.book_id = f"{c_prefix}/{s_prefix}/{seq.last_number:04d}/{timezone.now().year}"
+    def claim_copy(self, copy_id=None):
+        """
+        Mark a shelf copy as issued and return its id (None if none is free).
+        If copy_id is given only that copy is tried, otherwise any available one.
+        Each attempt is a conditional UPDATE, so a copy can't be handed out twice.
+        """
+        if copy_id:
+            candidates = [copy_id]
+        else:
+            candidates = self.copies.filter(status='available').values_list('id', flat=True)[:5]
+
+        for candidate in candidates:
+            if BookCopy.objects.filter(pk=candidate, book=self, status='available').update(status='issued'):
+                return candidate
+        return None
+
+    def add_copies(self, count=1, condition='good'):
+        """Create `count` shelf copies and bump both counters in one UPDATE"""
+        last_number = self.copies.aggregate(n=Max('copy_number'))['n'] or 0
+        copies = [
+            BookCopy(
+                book=self,
+                copy_number=number,
+                barcode=BookCopy.make_barcode(self, number),
+                condition=condition,
+            )
+            for number in range(last_number + 1, last_number + count + 1)
+        ]
+        bulk_create_with_history(copies, BookCopy)
 
-        super().save(*args, **kwargs)
+        Book.move_copy_counters(self.pk, total=count, available=count)
+        self.copies_total += count
+        self.copies_available += count
+        return copies
 
     @property
     def category(self):
@@ -295,6 +587,67 @@ class Book(models.Model):
     def __str__(self):
         return f"{self.title} | {self.category_name} | {self.grade_name} | {self.school}"
 
+class BookCopy(models.Model):
+    """A physical copy of a Book title — the unit that actually circulates"""
+    CONDITION_CHOICES = [
+        ('new', 'New'),
+        ('good', 'Good'),
+        ('fair', 'Fair'),
+        ('poor', 'Poor'),
+        ('damaged', 'Damaged'),
+    ]
+    STATUS_CHOICES = [
+        ('available', 'Available'),
+        ('issued', 'Issued'),
+        ('lost', 'Lost'),
+        ('withdrawn', 'Withdrawn'),
+    ]
+    # Statuses counted in Book.copies_total
+    IN_CIRCULATION = ('available', 'issued')
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='copies')
+    copy_number = models.PositiveIntegerField(help_text="Copy number within the title (1, 2, 3 ...)")
+    barcode = models.CharField(max_length=120, unique=True, blank=True)
+    condition = models.CharField(max_length=20, choices=CONDITION_CHOICES, default='good')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='available')
+    added_date = models.DateTimeField(auto_now_add=True)
+    notes = models.TextField(blank=True, null=True)
+    history = HistoricalRecords()
+
+    # Status as last read from / written to the DB (see Borrow._persisted_status)
+    _persisted_status = None
+
+    class Meta:
+        unique_together = ('book', 'copy_number')
+        ordering = ['book', 'copy_number']
+        indexes = [
+            models.Index(fields=['book', 'status']),
+        ]
+        verbose_name_plural = "Book Copies"
+
+    @staticmethod
+    def make_barcode(book, copy_number):
+        return f"{book.book_id or f'BOOK{book.pk}'}-C{copy_number:02d}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._persisted_status = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if not self.copy_number:
+            last_number = BookCopy.objects.filter(book=self.book).aggregate(n=Max('copy_number'))['n'] or 0
+            self.copy_number = last_number + 1
+        if not self.barcode:
+            self.barcode = BookCopy.make_barcode(self.book, self.copy_number)
+        super().save(*args, **kwargs)
+        self._persisted_status = self.status
+
+    def __str__(self):
+        return f"{self.book.title} — copy {self.copy_number} ({self.barcode})"
+
+
 class Student(models.Model):
     GRADE_CHOICES = [
         ('K', 'Kindergarten'), ('1', 'Grade 1'), ('2', 'Grade 2'), ('3', 'Grade 3'),
@@ -314,6 +667,11 @@ class Student(models.Model):
     user = models.OneToOneField('CustomUser', on_delete=models.CASCADE, null=True, blank=True, related_name='student_profile')
     grade = models.CharField(max_length=2, choices=GRADE_CHOICES, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['centre', 'name']),
+        ]
+
     def __str__(self):
         return f"{self.name} (ID: {self.child_ID})"
 
@@ -433,6 +791,9 @@ class TeacherBookIssue(models.Model):
         ordering = ['-issue_date']
         verbose_name = "Teacher Book Issue"
         verbose_name_plural = "Teacher Book Issues"
+        indexes = [
+            models.Index(fields=['status', 'expected_return_date']),
+        ]
 
 
 class Reservation(models.Model):
@@ -442,6 +803,8 @@ class Reservation(models.Model):
         ('cancelled', 'Cancelled'),
         ('expired', 'Expired'),
     ]
+    # Days a promoted hold waits for its borrow request before it lapses
+    PICKUP_DAYS = 2
 
     book = models.ForeignKey(
         'Book',
@@ -476,10 +839,20 @@ class Reservation(models.Model):
     )
     history = HistoricalRecords()
 
+    # `notified` as last read from / written to the DB (see Borrow._persisted_status)
+    _persisted_notified = False
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._persisted_notified = instance.__dict__.get('notified')
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.expiry_date:
             self.expiry_date = timezone.now() + timedelta(days=7)
         super().save(*args, **kwargs)
+        self._persisted_notified = self.notified
         if self.pk is None:  # New reservation
             if self.user.is_student and self.user.borrows.filter(status='issued').count() >= 1:
                 raise ValueError("Students can only borrow one book at a time")
@@ -502,8 +875,78 @@ class Reservation(models.Model):
     def __str__(self):
         return f"{self.user.email} reserved {self.book.title} - {self.status}"
 
+    # ----- hold queue -----
+    # A book's queue is its pending reservations in reservation_date order.
+    # When a copy comes back the head is promoted: `notified` is set and
+    # expiry_date becomes the pickup deadline.
+    @classmethod
+    def promote_next(cls, book_id, count=1):
+        """
+        Promote up to `count` waiting holds at the head of the book's queue.
+        Each promotion is a conditional UPDATE, so concurrent returns never
+        promote the same hold twice. Returns the promoted reservations.
+        """
+        promoted = []
+        while len(promoted) < count:
+            head = list(
+                cls.objects.filter(book_id=book_id, status='pending', notified=False)
+                .order_by('reservation_date', 'pk').values_list('pk', flat=True)[:count - len(promoted)]
+            )
+            if not head:
+                break
+            deadline = timezone.now() + timedelta(days=cls.PICKUP_DAYS)
+            for pk in head:
+                if cls.objects.filter(pk=pk, status='pending', notified=False).update(notified=True, expiry_date=deadline):
+                    promoted.append(pk)
+        return list(cls.objects.filter(pk__in=promoted).select_related('book', 'user').order_by('reservation_date', 'pk'))
+
+    @classmethod
+    def expire_lapsed(cls, now=None):
+        """
+        Mark every pending hold past its expiry_date as expired, in one UPDATE.
+        Returns (expired count, {book_id: n}), n counting the ready holds
+        among them, whose copies should go to the next in line.
+        """
+        now = now or timezone.now()
+        with transaction.atomic():
+            lapsed = cls.objects.select_for_update().filter(status='pending', expiry_date__lte=now)
+            freed = Counter(lapsed.filter(notified=True).values_list('book_id', flat=True))
+            expired = lapsed.update(status='expired')
+        return expired, dict(freed)
+
+    def queue_position(self):
+        """1 for the head of the queue; counts every pending hold placed earlier."""
+        ahead = Reservation.objects.filter(book_id=self.book_id, status='pending').filter(
+            Q(reservation_date__lt=self.reservation_date)
+            | Q(reservation_date=self.reservation_date, pk__lt=self.pk)
+        )
+        return ahead.count() + 1
+
+    def estimated_ready_date(self):
+        """
+        When a copy should reach this hold: the due date of the n-th loan to
+        come back, n being the number of waiting holds up to and including
+        this one. None when more holds wait than copies are out.
+        """
+        if self.notified:
+            return timezone.now()
+        waiting = Reservation.objects.filter(book_id=self.book_id, status='pending', notified=False).filter(
+            Q(reservation_date__lt=self.reservation_date)
+            | Q(reservation_date=self.reservation_date, pk__lt=self.pk)
+        ).count()
+        due = (
+            Borrow.objects.filter(book_id=self.book_id, status='issued', due_date__isnull=False)
+            .order_by('due_date').values_list('due_date', flat=True)[waiting:waiting + 1]
+        )
+        due = list(due)
+        return max(due[0], timezone.now()) if due else None
+
     class Meta:
         ordering = ['reservation_date']
+        indexes = [
+            models.Index(fields=['book', 'status', 'reservation_date']),
+            models.Index(fields=['status', 'expiry_date']),
+        ]
 
 
 class Borrow(models.Model):
@@ -555,6 +998,14 @@ class Borrow(models.Model):
         blank=True,
         help_text="The date when the book was returned."
     )
+    copy = models.ForeignKey(
+        'BookCopy',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='borrows',
+        help_text="The physical copy handed out."
+    )
     renewals = models.PositiveIntegerField(
         default=0,
         help_text="The number of times the borrow has been renewed."
@@ -578,10 +1029,31 @@ class Borrow(models.Model):
     notes = models.TextField(blank=True, null=True)
     history = HistoricalRecords()
 
+    # Status as last read from / written to the DB, so receivers can tell
+    # a real transition (requested → issued) apart from a plain re-save
+    _persisted_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._persisted_status = instance.__dict__.get('status')
+        return instance
+
     def save(self, *args, **kwargs):
         if 'user' in kwargs:
             setattr(self, '_history_user', kwargs.pop('user'))
-        super().save(*args, **kwargs)
+        # Claim a physical copy in the same write that flips the status; with
+        # no copy left, nothing is saved (as utils.circulation does)
+        if self.status == 'issued' and self._persisted_status != 'issued':
+            with transaction.atomic():
+                copy_id = self.book.claim_copy(self.copy_id)
+                if copy_id is None:
+                    raise ValidationError(f"No copy of '{self.book.title}' is available to issue.")
+                self.copy_id = copy_id
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+        self._persisted_status = self.status
 
     def is_overdue(self):
         """Check if borrow is overdue"""
@@ -611,6 +1083,12 @@ class Borrow(models.Model):
 
     class Meta:
         ordering = ['-request_date']
+        indexes = [
+            models.Index(fields=['centre', 'request_date']),
+            models.Index(fields=['centre', 'status', 'due_date']),
+            models.Index(fields=['status', 'due_date']),
+            models.Index(fields=['issue_date']),
+        ]
 
 
 class Notification(models.Model):
@@ -624,6 +1102,7 @@ class Notification(models.Model):
         ('reservation_fulfilled', 'Reservation Fulfilled'),
         ('teacher_bulk_request', 'Teacher Bulk Request'),
         ('overdue_reminder', 'Overdue Reminder'),
+        ('due_soon', 'Due Soon'),
     ]
 
     user = models.ForeignKey(
@@ -666,9 +1145,31 @@ class Notification(models.Model):
         blank=True,
         help_text="Group ID for batched notifications"
     )
+    event_key = models.CharField(
+        max_length=150,
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+        help_text="Identifies the event this notification is for, so it is only sent once"
+    )
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+        ]
+
+    @staticmethod
+    def make_event_key(user_id, notification_type, event, borrow_id=None, reservation_id=None):
+        """e.g. '12:book_returned:borrow:345:returned' — one notification per user, subject and transition."""
+        if borrow_id:
+            subject = f"borrow:{borrow_id}"
+        elif reservation_id:
+            subject = f"reservation:{reservation_id}"
+        else:
+            subject = '-'
+        return f"{user_id}:{notification_type}:{subject}:{event}"
 
     def __str__(self):
         return f"{self.user.email}: {self.message[:50]}"
@@ -690,6 +1191,7 @@ class Notification(models.Model):
             'reservation_fulfilled': 'star',
             'teacher_bulk_request': 'books',
             'overdue_reminder': 'alert-circle',
+            'due_soon': 'clock',
         }
         return icons.get(self.notification_type, 'bell')
 
@@ -705,6 +1207,7 @@ class Notification(models.Model):
             'reservation_fulfilled': 'pink',
             'teacher_bulk_request': 'indigo',
             'overdue_reminder': 'orange',
+            'due_soon': 'yellow',
         }
         return colors.get(self.notification_type, 'gray')
 
@@ -728,14 +1231,96 @@ def create_student_user(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=Borrow)
 def update_book_availability(sender, instance, **kwargs):
-    """Update book's available_copies field when a borrow record is created or updated."""
-    instance.book.update_available_copies()
+    """Move the book's copies_available counter when a borrow enters or leaves 'issued'."""
+    was_issued = instance._persisted_status == 'issued'
+    is_issued = instance.status == 'issued'
+
+    if is_issued and not was_issued:
+        # Borrow.save() runs this inside its transaction: raising undoes the issue
+        if not instance.book.update_available_copies(-1):
+            raise ValidationError(f"No copy of '{instance.book.title}' is available to issue.")
+    elif was_issued and not is_issued:
+        _shelve_copy(instance)
 
 
 @receiver(post_delete, sender=Borrow)
-def update_book_availability_on_delete(sender, instance, **kwargs):
-    """Update book's available_copies field when a borrow record is deleted."""
-    instance.book.update_available_copies()
+def update_book_availability_on_delete(sender, instance, origin=None, **kwargs):
+    """Put the copy back on the shelf when an issued borrow record is deleted."""
+    if instance._persisted_status == 'issued' and not _deleting_book(origin):
+        _shelve_copy(instance)
+
+
+def _deleting_book(origin):
+    """True when a cascade started from deleting Book(s) — their counters go with them."""
+    if isinstance(origin, models.QuerySet):
+        return origin.model is Book
+    return isinstance(origin, Book)
+
+
+def _shelve_copy(borrow):
+    if borrow.copy_id:
+        BookCopy.objects.filter(pk=borrow.copy_id, status='issued').update(status='available')
+    borrow.book.update_available_copies(+1)
+
+
+def _copy_counter_deltas(old_status, new_status):
+    total = (new_status in BookCopy.IN_CIRCULATION) - (old_status in BookCopy.IN_CIRCULATION)
+    available = (new_status == 'available') - (old_status == 'available')
+    return total, available
+
+
+def _apply_copy_counter_deltas(book_id, old_status, new_status):
+    total, available = _copy_counter_deltas(old_status, new_status)
+    if total or available:
+        Book.move_copy_counters(book_id, total=total, available=available)
+
+
+@receiver(post_save, sender=BookCopy)
+def update_book_copy_counters(sender, instance, created, **kwargs):
+    """Keep Book.copies_total / copies_available in step with copy edits (admin, write-offs)."""
+    old_status = None if created else instance._persisted_status
+    _apply_copy_counter_deltas(instance.book_id, old_status, instance.status)
+
+
+@receiver(post_delete, sender=BookCopy)
+def update_book_copy_counters_on_delete(sender, instance, origin=None, **kwargs):
+    if not _deleting_book(origin):
+        _apply_copy_counter_deltas(instance.book_id, instance._persisted_status, None)
+
+
+def _rollup_counts(book, sign=1):
+    return {
+        'book_count': sign,
+        'available_count': sign * (book.copies_available > 0),
+        'copies_total': sign * book.copies_total,
+        'copies_available': sign * book.copies_available,
+    }
+
+
+@receiver(post_save, sender=Book)
+def update_catalogue_rollup(sender, instance, created, **kwargs):
+    """Count a new book in its rollup row, or move it when centre/school/subject change."""
+    old_key = None if created else instance._persisted_rollup_key
+    new_key = instance.rollup_key()
+    if created:
+        CatalogueRollup.bump(new_key, **_rollup_counts(instance))
+    elif old_key and old_key != new_key:
+        CatalogueRollup.bump(old_key, **_rollup_counts(instance, sign=-1))
+        CatalogueRollup.bump(new_key, **_rollup_counts(instance))
+
+
+@receiver(post_delete, sender=Book)
+def update_catalogue_rollup_on_delete(sender, instance, **kwargs):
+    key = instance._persisted_rollup_key or instance.rollup_key()
+    CatalogueRollup.bump(key, **_rollup_counts(instance, sign=-1))
+
+
+@receiver(post_save, sender=Subject)
+def update_catalogue_rollup_subject(sender, instance, **kwargs):
+    """Rollup rows copy the subject's grade and category; follow edits to them."""
+    CatalogueRollup.objects.filter(subject=instance).update(
+        grade=instance.grade, category=instance.category
+    )
 
 
 class Catalogue(models.Model):
@@ -793,4 +1378,530 @@ class Catalogue(models.Model):
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.book.title} - Shelf {self.shelf_number}"
\ No newline at end of file
+        return f"{self.book.title} - Shelf {self.shelf_number}"
+
+class SearchTrigram(models.Model):
+    """Trigram posting list behind the typo-tolerant search in utils.search."""
+    KIND_CHOICES = [
+        ('book_title', 'Book title'),
+        ('book_author', 'Book author'),
+        ('student_name', 'Student name'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    trigram = models.CharField(max_length=3)
+    object_id = models.PositiveBigIntegerField()
+    gram_count = models.PositiveSmallIntegerField(help_text="Distinct trigrams in the indexed text")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'trigram', 'object_id']),
+            models.Index(fields=['kind', 'object_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.trigram} -> {self.object_id}"
+
+
+class CatalogueRollup(models.Model):
+    """
+    Book counts per (centre, school, subject), with the subject's grade and
+    category copied in, so catalogue landing pages read a handful of small rows
+    instead of grouping the Book table. Maintained by the Book/Subject receivers
+    and Book.move_copy_counters(); rebuild with `manage.py rebuild_catalogue_rollup`.
+    """
+    centre = models.ForeignKey(Centre, on_delete=models.CASCADE, null=True, related_name='catalogue_rollups')
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='catalogue_rollups')
+    grade = models.ForeignKey(Grade, on_delete=models.CASCADE, null=True, related_name='catalogue_rollups')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, null=True, related_name='catalogue_rollups')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, related_name='catalogue_rollups')
+
+    book_count = models.IntegerField(default=0, help_text="Titles")
+    available_count = models.IntegerField(default=0, help_text="Titles with at least one copy on the shelf")
+    copies_total = models.IntegerField(default=0)
+    copies_available = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('centre', 'school', 'subject')
+        indexes = [
+            models.Index(fields=['school', 'grade']),
+            models.Index(fields=['school', 'category']),
+        ]
+
+    def __str__(self):
+        return f"{self.school} / {self.subject or 'No subject'}: {self.book_count} books"
+
+    @classmethod
+    def bump(cls, key, **deltas):
+        """Apply F() deltas to the row for key = (centre_id, school_id, subject_id), creating it if needed."""
+        changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        if not changes:
+            return
+        centre_id, school_id, subject_id = key
+        StatCounter.bump(
+            centre_id, books=deltas.get('book_count', 0), available_books=deltas.get('available_count', 0)
+        )
+        rows = cls.objects.filter(centre_id=centre_id, school_id=school_id, subject_id=subject_id)
+        if rows.update(**changes):
+            return
+        subject = Subject.objects.filter(pk=subject_id).values('grade_id', 'category_id').first() or {}
+        cls.objects.get_or_create(
+            centre_id=centre_id, school_id=school_id, subject_id=subject_id,
+            defaults={'grade_id': subject.get('grade_id'), 'category_id': subject.get('category_id')},
+        )
+        rows.update(**changes)
+
+    @classmethod
+    def rebuild(cls):
+        """Recount every row from the Book table. Returns the number of rows written."""
+        with transaction.atomic():
+            cls.objects.all().delete()
+            groups = (
+                Book.objects.values('centre_id', 'school_id', 'subject_id', 'subject__grade_id', 'subject__category_id')
+                .annotate(
+                    n_books=Count('id'),
+                    n_available=Count('id', filter=Q(copies_available__gt=0)),
+                    n_copies=Sum('copies_total'),
+                    n_on_shelf=Sum('copies_available'),
+                )
+                .order_by()
+            )
+            rows = [
+                cls(
+                    centre_id=g['centre_id'], school_id=g['school_id'], subject_id=g['subject_id'],
+                    grade_id=g['subject__grade_id'], category_id=g['subject__category_id'],
+                    book_count=g['n_books'], available_count=g['n_available'],
+                    copies_total=g['n_copies'] or 0, copies_available=g['n_on_shelf'] or 0,
+                )
+                for g in groups
+            ]
+            cls.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
+
+class BackgroundJob(models.Model):
+    """
+    Long-running work (CSV imports, full exports) queued by the web views and
+    executed by `manage.py run_jobs` workers, so it never runs inside a
+    request. Handlers live in utils.jobs; input and output files are kept in
+    the row itself so workers need no shared filesystem.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    MAX_ATTEMPTS = 3
+
+    kind = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='background_jobs')
+    params = models.JSONField(default=dict, blank=True)
+    input_name = models.CharField(max_length=255, blank=True)
+    input_data = models.BinaryField(null=True, blank=True)
+
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    result = models.JSONField(default=dict, blank=True)
+    result_name = models.CharField(max_length=255, blank=True)
+    result_content_type = models.CharField(max_length=100, blank=True)
+    result_data = models.BinaryField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+    @property
+    def progress_percent(self):
+        if self.status == 'done':
+            return 100
+        if not self.progress_total:
+            return 0
+        return min(99, int(100 * self.progress_done / self.progress_total))
+
+    @classmethod
+    def claim_next(cls, worker):
+        """
+        Take the oldest queued job for `worker`, or None. The claim is a
+        conditional UPDATE, so two workers can never run the same job.
+        """
+        candidates = cls.objects.filter(status='queued').order_by('created_at').values_list('pk', flat=True)[:10]
+        for pk in candidates:
+            now = timezone.now()
+            claimed = cls.objects.filter(pk=pk, status='queued').update(
+                status='running', worker=worker, attempts=F('attempts') + 1,
+                started_at=now, heartbeat_at=now,
+            )
+            if claimed:
+                return cls.objects.get(pk=pk)
+        return None
+
+    @classmethod
+    def requeue_stale(cls, timeout):
+        """
+        Jobs whose worker stopped sending heartbeats (killed or crashed) go back
+        on the queue, or fail for good after MAX_ATTEMPTS. Returns (requeued, failed).
+        """
+        stale = cls.objects.filter(status='running', heartbeat_at__lt=timezone.now() - timedelta(seconds=timeout))
+        failed = stale.filter(attempts__gte=cls.MAX_ATTEMPTS).update(
+            status='failed', error="Worker stopped responding", finished_at=timezone.now()
+        )
+        requeued = stale.update(status='queued', worker='')
+        return requeued, failed
+
+    def report(self, done, total=None):
+        """Record progress (also the worker's heartbeat)."""
+        self.progress_done = done
+        if total is not None:
+            self.progress_total = total
+        self.heartbeat_at = timezone.now()
+        BackgroundJob.objects.filter(pk=self.pk).update(
+            progress_done=self.progress_done,
+            progress_total=self.progress_total,
+            heartbeat_at=self.heartbeat_at,
+        )
+
+    def attach_result(self, name, content_type, data):
+        self.result_name = name
+        self.result_content_type = content_type
+        self.result_data = data
+
+
+class SweepMark(models.Model):
+    """
+    High-water mark of a periodic sweep (e.g. `manage.py sweep_overdue`): the
+    time up to which it has already processed rows, so the next run only
+    looks at what changed since.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    high_water = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.high_water}"
+
+    @classmethod
+    def get(cls, name):
+        """The mark for `name`, or None if the sweep has never run."""
+        return cls.objects.filter(name=name).values_list('high_water', flat=True).first()
+
+    @classmethod
+    def advance(cls, name, high_water):
+        cls.objects.update_or_create(name=name, defaults={'high_water': high_water})
+
+
+class VersionStamp(models.Model):
+    """
+    Version number of a data set that processes cache in memory (e.g. the
+    reference data behind the dropdowns). Bumped when the data changes, so
+    every process can tell that its copy is stale, whatever cache backend
+    it runs with.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+    @classmethod
+    def get(cls, name):
+        """The current version of `name` (0 if it was never bumped)."""
+        return cls.objects.filter(name=name).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, name):
+        if cls.objects.filter(name=name).update(version=F('version') + 1):
+            return
+        _, created = cls.objects.get_or_create(name=name, defaults={'version': 1})
+        if not created:  # another writer created it meanwhile
+            cls.objects.filter(name=name).update(version=F('version') + 1)
+
+
+class StatCounter(models.Model):
+    """
+    Running totals behind the dashboards: one row per (scope, name), scope
+    being a centre id or GLOBAL for the system-wide figures. Moved with F()
+    UPDATEs in the same transaction as the change they count (see
+    utils.stats and CatalogueRollup.bump), and recounted by
+    `manage.py reconcile_stats`, which corrects any drift.
+    """
+    GLOBAL = 0
+    BORROW_STATUS_COUNTERS = {'issued': 'active_borrows', 'requested': 'pending_requests'}
+
+    scope = models.PositiveIntegerField(help_text="Centre id, or 0 for system-wide totals")
+    name = models.CharField(max_length=30)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('scope', 'name')
+
+    def __str__(self):
+        return f"{self.scope or 'all'}:{self.name} = {self.value}"
+
+    @classmethod
+    def bump(cls, centre_id, **deltas):
+        """
+        Add each delta to counter `name` for the centre (if any) and
+        system-wide, in one UPDATE; rows are created on first use.
+        """
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        scopes = [cls.GLOBAL] + ([centre_id] if centre_id else [])
+        rows = cls.objects.filter(scope__in=scopes, name__in=list(deltas))
+        change = Case(
+            *[When(name=name, then=F('value') + Value(delta)) for name, delta in deltas.items()],
+            default=F('value'),
+            output_field=models.BigIntegerField(),
+        )
+        if rows.update(value=change) == len(scopes) * len(deltas):
+            return
+        existing = set(rows.values_list('scope', 'name'))
+        for scope in scopes:
+            for name, delta in deltas.items():
+                if (scope, name) in existing:
+                    continue
+                _, created = cls.objects.get_or_create(scope=scope, name=name, defaults={'value': delta})
+                if not created:  # another writer created it meanwhile
+                    cls.objects.filter(scope=scope, name=name).update(value=F('value') + delta)
+
+    @staticmethod
+    def borrow_status_deltas(old_status, new_status):
+        """Counter deltas for a borrow moving between statuses (None: not yet created / deleted)."""
+        deltas = {}
+        for status, sign in ((old_status, -1), (new_status, 1)):
+            name = StatCounter.BORROW_STATUS_COUNTERS.get(status)
+            if name:
+                deltas[name] = deltas.get(name, 0) + sign
+        return deltas
+
+    @classmethod
+    def read(cls, *scopes):
+        """{scope: {name: value}} for the given scopes (all of them if none given), in one query."""
+        rows = cls.objects.all()
+        if scopes:
+            rows = rows.filter(scope__in=scopes)
+        counters = {scope: {} for scope in scopes}
+        for scope, name, value in rows.values_list('scope', 'name', 'value'):
+            counters.setdefault(scope, {})[name] = value
+        return counters
+
+
+class CirculationDay(models.Model):
+    """
+    Daily circulation facts per centre: borrows requested, issued and
+    returned, and loans that fell overdue, on each local calendar day.
+    Appended as circulation happens (utils.trends, utils.circulation and the
+    overdue sweep); `manage.py backfill_circulation` rebuilds any range from
+    Borrow. Trend charts sum these rows instead of scanning Borrow.
+    """
+    FACTS = ('requests', 'issues', 'returns', 'overdues')
+
+    day = models.DateField()
+    centre = models.ForeignKey(Centre, on_delete=models.CASCADE, null=True, related_name='circulation_days')
+    requests = models.PositiveIntegerField(default=0)
+    issues = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    overdues = models.PositiveIntegerField(default=0, help_text="Loans whose due date fell on this day and were not back by then")
+
+    class Meta:
+        unique_together = ('centre', 'day')
+        indexes = [models.Index(fields=['day'])]
+
+    def __str__(self):
+        return f"{self.centre_id or '-'} {self.day}"
+
+    @classmethod
+    def bump(cls, centre_id, when, **deltas):
+        """Add deltas to the facts of the local day of `when` (a datetime or date), creating the row if needed."""
+        changes = {fact: F(fact) + delta for fact, delta in deltas.items() if delta}
+        if not changes or when is None:
+            return
+        day = timezone.localdate(when) if isinstance(when, datetime) else when
+        rows = cls.objects.filter(centre_id=centre_id, day=day)
+        if rows.update(**changes):
+            return
+        cls.objects.get_or_create(centre_id=centre_id, day=day)
+        rows.update(**changes)
+
+    @classmethod
+    def rebuild(cls, start=None, end=None, overdue_until=None):
+        """
+        Recount the days from `start` to `end` (inclusive dates, None for
+        unbounded) from the Borrow table. Overdues are counted for loans due
+        up to `overdue_until`: pass the overdue sweep's mark, as the sweep
+        counts the later ones itself (None: count none). Returns the number
+        of rows written.
+        """
+        def in_range(field):
+            lookups = {f'{field}__isnull': False}
+            if start:
+                lookups[f'{field}__date__gte'] = start
+            if end:
+                lookups[f'{field}__date__lte'] = end
+            return lookups
+
+        # Overdue: issued, and not back by the due date
+        overdue = (
+            Q(status__in=['issued', 'returned'], due_date__lte=overdue_until)
+            & (Q(return_date__isnull=True) | Q(return_date__gt=F('due_date')))
+        ) if overdue_until else Q(pk__in=[])
+        queries = {
+            'requests': ('request_date', Q()),
+            'issues': ('issue_date', Q()),
+            'returns': ('return_date', Q()),
+            'overdues': ('due_date', overdue),
+        }
+        facts = {}
+        for fact, (field, condition) in queries.items():
+            groups = (
+                Borrow.objects.filter(condition, **in_range(field))
+                .values('centre_id', local_day=TruncDate(field))
+                .annotate(n=Count('id'))
+                .order_by()
+            )
+            for group in groups:
+                row = facts.setdefault((group['centre_id'], group['local_day']), dict.fromkeys(cls.FACTS, 0))
+                row[fact] = group['n']
+
+        with transaction.atomic():
+            stale = cls.objects.all()
+            if start:
+                stale = stale.filter(day__gte=start)
+            if end:
+                stale = stale.filter(day__lte=end)
+            stale.delete()
+            cls.objects.bulk_create(
+                [cls(centre_id=centre_id, day=day, **row) for (centre_id, day), row in facts.items()],
+                batch_size=1000,
+            )
+        return len(facts)
+
+
+class BookCirculation(models.Model):
+    """
+    Per-book issue counters behind the "most borrowed" rankings: one row per
+    book and window (lifetime, and the last 30/90/365 days), with the book's
+    centre, school and grade copied in so each leaderboard reads the top of
+    one (window, scope, issues) index. Incremented as books are issued
+    (utils.rankings, utils.circulation); `manage.py sweep_circulation_windows`
+    takes each day's issues back out of the windows it leaves, and
+    `--rebuild` recounts everything from Borrow.
+    """
+    WINDOWS = {'all': None, '30d': 30, '90d': 90, '365d': 365}
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='circulation')
+    window = models.CharField(max_length=4, choices=[(name, name) for name in WINDOWS])
+    centre = models.ForeignKey(Centre, on_delete=models.CASCADE, null=True, related_name='+')
+    school = models.ForeignKey(School, on_delete=models.CASCADE, null=True, related_name='+')
+    grade = models.ForeignKey(Grade, on_delete=models.SET_NULL, null=True, related_name='+')
+    issues = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('book', 'window')
+        indexes = [
+            models.Index(fields=['window', '-issues']),
+            models.Index(fields=['window', 'centre', '-issues']),
+            models.Index(fields=['window', 'school', '-issues']),
+            models.Index(fields=['window', 'grade', '-issues']),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} {self.window}: {self.issues}"
+
+    @staticmethod
+    def windows_for(day, today):
+        """The windows an issue on local date `day` still falls in."""
+        return [
+            name for name, days in BookCirculation.WINDOWS.items()
+            if days is None or (today - day).days < days
+        ]
+
+    @classmethod
+    def _scope(cls, book_ids):
+        """{book_id: {'centre_id', 'school_id', 'grade_id'}} for the books."""
+        return {
+            row.pop('pk'): row
+            for row in Book.objects.filter(pk__in=book_ids)
+            .values('pk', 'centre_id', 'school_id', grade_id=F('subject__grade_id'))
+        }
+
+    @classmethod
+    def record_issue(cls, book_id, when):
+        """Count one issue of the book, made at `when`, into every window it falls in."""
+        windows = cls.windows_for(timezone.localdate(when), timezone.localdate())
+        rows = cls.objects.filter(book_id=book_id, window__in=windows)
+        if rows.update(issues=F('issues') + 1) == len(windows):
+            return
+        scope = cls._scope([book_id]).get(book_id)
+        if scope is None:
+            return
+        # First issue of the book: create its rows, then count the issue
+        cls.objects.bulk_create(
+            [cls(book_id=book_id, window=window, **scope) for window in cls.WINDOWS],
+            ignore_conflicts=True,
+        )
+        rows.update(issues=F('issues') + 1)
+
+    @classmethod
+    def age(cls, day):
+        """
+        Take the issues of local date `day` - N out of each N-day window, as
+        `day` begins. Run once per day, in order (see `sweep_circulation_windows`).
+        """
+        for window, days in cls.WINDOWS.items():
+            if days is None:
+                continue
+            leaving = day - timedelta(days=days)
+            start = timezone.make_aware(datetime.combine(leaving, datetime.min.time()))
+            counts = (
+                Borrow.objects.filter(issue_date__gte=start, issue_date__lt=start + timedelta(days=1))
+                .values('book_id').annotate(n=Count('id')).order_by()
+            )
+            for row in counts:
+                cls.objects.filter(book_id=row['book_id'], window=window, issues__gte=row['n']).update(
+                    issues=F('issues') - row['n']
+                )
+
+    @classmethod
+    def rebuild(cls, today=None):
+        """Recount every book's windows from Borrow. Returns the number of rows written."""
+        today = today or timezone.localdate()
+        aggregates = {'n_all': Count('id')}
+        for window, days in cls.WINDOWS.items():
+            if days is not None:
+                since = timezone.make_aware(datetime.combine(today - timedelta(days=days - 1), datetime.min.time()))
+                aggregates[f'n_{window}'] = Count('id', filter=Q(issue_date__gte=since))
+        counts = {
+            row.pop('book_id'): row
+            for row in Borrow.objects.filter(issue_date__isnull=False)
+            .values('book_id').annotate(**aggregates).order_by()
+        }
+        scopes = cls._scope(list(counts))
+        rows = [
+            cls(book_id=book_id, window=window, issues=counts[book_id][f'n_{window}'], **scope)
+            for book_id, scope in scopes.items()
+            for window in cls.WINDOWS
+        ]
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
@@ -3,10 +3,8 @@ Signal handlers for automatic notification creation
 """
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.utils import timezone
-from datetime import timedelta
-from .models import Borrow, Reservation, Notification, CustomUser, TeacherBookIssue
-import hashlib
+from .models import Borrow, Reservation
+from .utils.notifications import notify, notify_librarians
 
 
 @receiver(post_save, sender=Borrow)
@@ -15,23 +13,27 @@ def handle_borrow_notification(sender, instance, created, **kwargs):
     Create notifications when borrow status changes.
     - When issued: notify the borrower that their request was approved
     - When returned: notify the borrower with thank you message
+    Re-saves that leave the status alone (renewals, edits) notify nobody.
     """
-    if not created and instance.status == 'issued':
-        Notification.objects.create(
-            user=instance.user,
-            notification_type='book_issued',
-            message=(
-                f"Your request for '{instance.book.title}' has been approved! "
-                f"Due date: {instance.due_date.strftime('%Y-%m-%d')}"
-            ),
+    old_status = None if created else instance._persisted_status
+    if instance.status == old_status:
+        return
+    if instance.status == 'issued':
+        notify(
+            [instance.user_id],
+            'borrow_approved',
+            f"Your request for '{instance.book.title}' has been approved!"
+            + (f" Due date: {instance.due_date.strftime('%Y-%m-%d')}" if instance.due_date else ""),
+            event='issued',
             book=instance.book,
             borrow=instance,
         )
-    elif not created and instance.status == 'returned':
-        Notification.objects.create(
-            user=instance.user,
-            notification_type='book_returned',
-            message=f"Thank you for returning '{instance.book.title}'!",
+    elif instance.status == 'returned':
+        notify(
+            [instance.user_id],
+            'book_returned',
+            f"Thank you for returning '{instance.book.title}'!",
+            event='returned',
             book=instance.book,
             borrow=instance,
         )
@@ -45,96 +47,34 @@ def handle_reservation_notification(sender, instance, created, **kwargs):
     - When book available: notify both user and librarians
     """
     if created:
-        librarians = CustomUser.objects.filter(
-            is_librarian=True,
-            centre=instance.centre
+        notify_librarians(
+            instance.centre_id,
+            'borrow_request',
+            f"{instance.user.get_full_name() or instance.user.email} "
+            f"reserved '{instance.book.title}'",
+            event='reserved',
+            book=instance.book,
+            reservation=instance,
         )
-        for librarian in librarians:
-            Notification.objects.create(
-                user=librarian,
-                notification_type='borrow_request',
-                message=(
-                    f"{instance.user.get_full_name() or instance.user.email} "
-                    f"reserved '{instance.book.title}'"
-                ),
-                book=instance.book,
-                reservation=instance,
-            )
-    elif instance.notified and instance.status == 'pending':
+    elif instance.notified and not instance._persisted_notified and instance.status == 'pending':
         # Notify the user with reservation
-        Notification.objects.create(
-            user=instance.user,
-            notification_type='book_available',
-            message=(
-                f"'{instance.book.title}' is now available! "
-                f"Your reservation is ready. Please request to borrow within 2 days."
-            ),
+        notify(
+            [instance.user_id],
+            'book_available',
+            f"'{instance.book.title}' is now available! "
+            f"Your reservation is ready. Please request to borrow within 2 days.",
+            event='available',
             book=instance.book,
             reservation=instance,
         )
-        
-        # Notify librarians
-        librarians = CustomUser.objects.filter(
-            is_librarian=True,
-            centre=instance.centre
-        )
-        for librarian in librarians:
-            Notification.objects.create(
-                user=librarian,
-                notification_type='reservation_fulfilled',
-                message=(
-                    f"'{instance.book.title}' is available for "
-                    f"{instance.user.get_full_name() or instance.user.email}'s reservation"
-                ),
-                book=instance.book,
-                reservation=instance,
-            )
-
-
-def create_teacher_bulk_notification(librarian, teacher, books_list, centre):
-    """
-    Create a single grouped notification for teacher bulk requests
-    instead of multiple individual notifications. This batches all books
-    requested by a teacher into one notification per librarian per day.
-    """
-    group_id = hashlib.md5(
-        f"{teacher.id}-{timezone.now().date()}".encode()
-    ).hexdigest()
-    
-    book_titles = ", ".join([f"'{b.title}'" for b in books_list[:3]])
-    if len(books_list) > 3:
-        book_titles += f", and {len(books_list) - 3} more"
-    
-    message = (
-        f"{teacher.get_full_name() or teacher.email} requested "
-        f"{len(books_list)} book{'s' if len(books_list) != 1 else ''}: {book_titles}"
-    )
-    
-    Notification.objects.create(
-        user=librarian,
-        notification_type='teacher_bulk_request',
-        message=message,
-        group_id=group_id,
-    )
-
 
-def notify_librarians_of_borrow_request(borrow):
-    """
-    Notify librarians when a student/teacher makes a borrow request.
-    This is called from the borrow_request view for single requests.
-    """
-    librarians = CustomUser.objects.filter(
-        is_librarian=True,
-        centre=borrow.centre
-    )
-    for librarian in librarians:
-        Notification.objects.create(
-            user=librarian,
-            notification_type='borrow_request',
-            message=(
-                f"{borrow.user.get_full_name() or borrow.user.email} "
-                f"requested to borrow '{borrow.book.title}'"
-            ),
-            book=borrow.book,
-            borrow=borrow,
+        # Notify librarians
+        notify_librarians(
+            instance.centre_id,
+            'reservation_fulfilled',
+            f"'{instance.book.title}' is available for "
+            f"{instance.user.get_full_name() or instance.user.email}'s reservation",
+            event='available',
+            book=instance.book,
+            reservation=instance,
         )
@@ -1,4 +1,103 @@
-from django.test import TestCase
+import threading
+from unittest import skipUnless
 
-# Create your tests here.
-# test
\ No newline at end of file
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from .models import Book, BookCopy, Borrow, Centre, CustomUser, School
+from .utils.circulation import NotAvailable, issue_borrow, write_transaction
+
+
+class ConcurrentIssueTests(TransactionTestCase):
+    """Parallel librarians racing to issue the last copy of a book."""
+
+    ATTEMPTS = 8
+
+    def setUp(self):
+        centre = Centre.objects.create(name="Pangani", centre_code="C1")
+        school = School.objects.create(name="Pangani School", centre=centre)
+        self.librarian = CustomUser.objects.create_user(
+            "librarian@example.com", "pw", is_librarian=True, centre=centre
+        )
+        self.book = Book.objects.create(
+            title="Kifo Kisimani", author="Kithaka", year_of_publication=2020,
+            school=school, added_by=self.librarian,
+        )
+        self.book.add_copies(1)
+        self.borrows = [
+            Borrow.objects.create(
+                book=self.book,
+                user=CustomUser.objects.create_user(f"reader{i}@example.com", "pw", centre=centre),
+                centre=centre,
+            )
+            for i in range(self.ATTEMPTS)
+        ]
+
+    def test_one_copy_is_issued_once(self):
+        barrier = threading.Barrier(self.ATTEMPTS)
+        results = []
+
+        def attempt(borrow):
+            try:
+                barrier.wait()
+                issue_borrow(borrow, self.librarian, borrow.request_date)
+                results.append('issued')
+            except NotAvailable:
+                results.append('unavailable')
+            except Exception as e:
+                results.append(repr(e))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=attempt, args=(borrow,)) for borrow in self.borrows]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), ['issued'] + ['unavailable'] * (self.ATTEMPTS - 1))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 0)
+        self.assertEqual(Borrow.objects.filter(status='issued').count(), 1)
+        self.assertEqual(BookCopy.objects.filter(book=self.book, status='issued').count(), 1)
+
+
+class DriftedCounterIssueTests(TransactionTestCase):
+    """copies_available says a copy is free, but every BookCopy is out."""
+
+    def setUp(self):
+        centre = Centre.objects.create(name="Pangani", centre_code="C1")
+        school = School.objects.create(name="Pangani School", centre=centre)
+        self.librarian = CustomUser.objects.create_user(
+            "librarian@example.com", "pw", is_librarian=True, centre=centre
+        )
+        self.book = Book.objects.create(
+            title="Kifo Kisimani", author="Kithaka", year_of_publication=2020,
+            school=school, added_by=self.librarian,
+        )
+        self.book.add_copies(1)
+        BookCopy.objects.filter(book=self.book).update(status='issued')
+        self.borrow = Borrow.objects.create(book=self.book, user=self.librarian, centre=centre)
+
+    def test_issue_rolls_back(self):
+        with self.assertRaises(NotAvailable):
+            issue_borrow(self.borrow, self.librarian, self.borrow.request_date)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 1)
+        self.borrow.refresh_from_db()
+        self.assertEqual(self.borrow.status, 'requested')
+        self.assertIsNone(self.borrow.copy_id)
+
+
+@skipUnless(connection.vendor == 'sqlite', "SQLite lock mode")
+class WriteTransactionTests(TransactionTestCase):
+    """write_transaction() must take SQLite's write lock when it begins."""
+
+    def test_begins_immediate(self):
+        with CaptureQueriesContext(connection) as queries:
+            with write_transaction():
+                Centre.objects.count()
+        if connection.settings_dict.get('OPTIONS', {}).get('transaction_mode') == 'IMMEDIATE':
+            return  # Django >= 5.1 sends BEGIN IMMEDIATE itself
+        self.assertEqual(queries.captured_queries[0]['sql'], 'BEGIN IMMEDIATE')
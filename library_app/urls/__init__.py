@@ -4,8 +4,10 @@ from .student_urls import student_urlpatterns
 from .borrow_urls import borrow_urlpatterns
 from .notification_urls import notification_urlpatterns
 from .catalogue_urls import catalogue_urlpatterns
+from .autocomplete_urls import autocomplete_urlpatterns
+from .job_urls import job_urlpatterns
 
 
-urlpatterns = book_urlpatterns + auth_urlpatterns + student_urlpatterns + borrow_urlpatterns + notification_urlpatterns + catalogue_urlpatterns
+urlpatterns = book_urlpatterns + auth_urlpatterns + student_urlpatterns + borrow_urlpatterns + notification_urlpatterns + catalogue_urlpatterns + autocomplete_urlpatterns + job_urlpatterns
 
 
@@ -18,6 +18,9 @@ auth_urlpatterns = [
          name='password_reset_confirm'),
     path('logout/', views.logout_view, name='logout'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/widgets/<str:widget>/', views.dashboard_widget, name='dashboard_widget'),
+    path('dashboard/circulation-trend/', views.circulation_trend_data, name='circulation_trend_data'),
+    path('dashboard/leaderboard/', views.leaderboard_data, name='leaderboard_data'),
     path('profile/', views.profile, name='profile'),
     path('change-password/', views.change_password, name='change_password'),
     path('manage-users/', views.manage_users, name='manage_users'),
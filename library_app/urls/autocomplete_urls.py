@@ -0,0 +1,6 @@
+from django.urls import path
+from .. import views
+
+autocomplete_urlpatterns = [
+    path('api/autocomplete/<str:kind>/', views.autocomplete, name='autocomplete'),
+]
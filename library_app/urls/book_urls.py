@@ -18,5 +18,7 @@ book_urlpatterns = [
     path('books/sample-csv/',  views.sample_csv_download, name='sample_csv_download'),
     path('books/ajax/load-schools/',  views.ajax_load_schools, name='ajax_load_schools'),
     path('books/ajax/load-subjects/',  views.ajax_load_subjects, name='ajax_load_subjects'),
+    path('books/ajax/next-code/',  views.ajax_next_code, name='ajax_next_code'),
+    path('books/ajax/form-tree/',  views.ajax_book_form_tree, name='ajax_book_form_tree'),
     path('books/add/confirmation/', views.book_add_confirmation, name='book_add_confirmation'),
 ]
\ No newline at end of file
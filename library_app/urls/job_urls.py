@@ -0,0 +1,8 @@
+from django.urls import path
+from .. import views
+
+job_urlpatterns = [
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/download/', views.job_download, name='job_download'),
+    path('api/jobs/<int:job_id>/', views.job_progress, name='job_progress'),
+]
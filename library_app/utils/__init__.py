@@ -1 +1,18 @@
-from .emails import *
\ No newline at end of file
+from .emails import *
+from .search import *
+from .autocomplete import *
+from .pagination import *
+from .book_import import *
+from .exports import *
+from .student_import import *
+from .notifications import *
+from .reminders import *
+from .holds import *
+from .jobs import *
+from .circulation import *
+from .refdata import *
+from .stats import *
+from .trends import *
+from .rankings import *
+from .single_flight import *
+from .widget_cache import *
@@ -0,0 +1,196 @@
+"""
+In-memory prefix autocomplete for the book and student pickers.
+
+Each (kind, centre) scope is a sorted list of normalised keys with a parallel
+array of object ids, so a lookup is one bisect plus a short forward scan.
+Scopes are built lazily on first use, kept current in this process by the
+receivers below, and rebuilt after AUTOCOMPLETE_MAX_AGE seconds so writes
+made by other worker processes show up too. Callers confirm the returned ids
+against the database (see views.autocomplete_views), so a stale entry can
+never be offered.
+"""
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ..models import Book, Student
+
+__all__ = ['PrefixIndex', 'autocomplete_ids', 'clear_autocomplete', 'refresh_autocomplete']
+
+AUTOCOMPLETE_MAX_AGE = 300
+BULK_REBUILD_THRESHOLD = 500
+ALL_CENTRES = '*'
+
+
+def normalise(text):
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.lower().split())
+
+
+def _phrase_keys(text):
+    """Every word-suffix of a phrase, so 'kisi' finds 'Kifo Kisimani'."""
+    words = normalise(text).split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class PrefixIndex:
+    """Sorted keys + parallel id array. Not thread-safe; callers hold the lock."""
+
+    def __init__(self, entries=()):
+        pairs = sorted((key, obj_id) for obj_id, keys in entries for key in set(keys))
+        self.keys = [key for key, _ in pairs]
+        self.ids = array('q', (obj_id for _, obj_id in pairs))
+        self.keys_by_id = {}
+        for key, obj_id in pairs:
+            self.keys_by_id.setdefault(obj_id, []).append(key)
+
+    def __len__(self):
+        return len(self.keys_by_id)
+
+    def add(self, obj_id, keys):
+        self.remove(obj_id)
+        keys = sorted(set(keys))
+        for key in keys:
+            position = bisect_left(self.keys, key)
+            self.keys.insert(position, key)
+            self.ids.insert(position, obj_id)
+        if keys:
+            self.keys_by_id[obj_id] = keys
+
+    def remove(self, obj_id):
+        for key in self.keys_by_id.pop(obj_id, ()):
+            position = bisect_left(self.keys, key)
+            while position < len(self.keys) and self.keys[position] == key:
+                if self.ids[position] == obj_id:
+                    del self.keys[position]
+                    del self.ids[position]
+                    break
+                position += 1
+
+    def search(self, prefix, limit):
+        prefix = normalise(prefix)
+        if not prefix:
+            return []
+        found = []
+        seen = set()
+        position = bisect_left(self.keys, prefix)
+        while position < len(self.keys) and len(found) < limit:
+            if not self.keys[position].startswith(prefix):
+                break
+            obj_id = self.ids[position]
+            if obj_id not in seen:
+                seen.add(obj_id)
+                found.append(obj_id)
+            position += 1
+        return found
+
+
+# ==========================================================
+# Sources and per-process registry
+# ==========================================================
+def _book_keys(row):
+    return _phrase_keys(row['title']) + [normalise(row['book_id']), normalise(row['book_code'])]
+
+
+def _student_keys(row):
+    return _phrase_keys(row['name']) + [normalise(row['child_ID'])]
+
+
+SOURCES = {
+    'book': (Book, ('id', 'title', 'book_id', 'book_code', 'centre_id'), _book_keys),
+    'student': (Student, ('id', 'name', 'child_ID', 'centre_id'), _student_keys),
+}
+
+_lock = threading.Lock()
+_indexes = {}  # (kind, scope) -> (PrefixIndex, built_at)
+
+
+def _build(kind, scope):
+    model, fields, make_keys = SOURCES[kind]
+    rows = model.objects.values(*fields)
+    if scope != ALL_CENTRES:
+        rows = rows.filter(centre_id=scope)
+    entries = [(row['id'], [key for key in make_keys(row) if key]) for row in rows.iterator(chunk_size=5000)]
+    return PrefixIndex(entries)
+
+
+def _get_index(kind, scope):
+    with _lock:
+        cached = _indexes.get((kind, scope))
+        if cached and time.monotonic() - cached[1] < AUTOCOMPLETE_MAX_AGE:
+            return cached[0]
+    index = _build(kind, scope)
+    with _lock:
+        _indexes[(kind, scope)] = (index, time.monotonic())
+    return index
+
+
+def autocomplete_ids(kind, query, centre_id=None, limit=10):
+    """Ids of up to `limit` objects whose title/name/code starts with `query`, in key order."""
+    scope = centre_id if centre_id is not None else ALL_CENTRES
+    index = _get_index(kind, scope)
+    with _lock:
+        return index.search(query, limit)
+
+
+def clear_autocomplete():
+    with _lock:
+        _indexes.clear()
+
+
+def refresh_autocomplete(kind, instances):
+    """
+    Add/update entries for objects written without post_save (bulk imports).
+    Large batches just drop the kind's scopes so they rebuild on next use,
+    which is cheaper than thousands of sorted-list inserts.
+    """
+    instances = list(instances)
+    if len(instances) > BULK_REBUILD_THRESHOLD:
+        with _lock:
+            for key in [key for key in _indexes if key[0] == kind]:
+                del _indexes[key]
+        return
+    for instance in instances:
+        _refresh(kind, instance)
+
+
+def _refresh(kind, instance, deleted=False):
+    _, fields, make_keys = SOURCES[kind]
+    row = {field: getattr(instance, field) for field in fields}
+    row['id'] = instance.pk
+    keys = [key for key in make_keys(row) if key]
+    with _lock:
+        for (indexed_kind, scope), (index, _) in _indexes.items():
+            if indexed_kind != kind:
+                continue
+            if deleted or scope not in (ALL_CENTRES, row['centre_id']):
+                # Also drops the entry from its old centre after a move
+                index.remove(instance.pk)
+            else:
+                index.add(instance.pk, keys)
+
+
+@receiver(post_save, sender=Book)
+def update_book_autocomplete(sender, instance, **kwargs):
+    _refresh('book', instance)
+
+
+@receiver(post_delete, sender=Book)
+def remove_book_autocomplete(sender, instance, **kwargs):
+    _refresh('book', instance, deleted=True)
+
+
+@receiver(post_save, sender=Student)
+def update_student_autocomplete(sender, instance, **kwargs):
+    _refresh('student', instance)
+
+
+@receiver(post_delete, sender=Student)
+def remove_student_autocomplete(sender, instance, **kwargs):
+    _refresh('student', instance, deleted=True)
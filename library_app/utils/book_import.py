@@ -0,0 +1,183 @@
+"""
+Bulk book import engine for CSV deliveries.
+
+Rows are validated in memory against the school/subject chosen on the form,
+book_ids (and, for a subject, book_codes) come from one sequence block
+reserved per import, and books,
+their copies and both sets of history rows go in with batched bulk_create.
+bulk_create skips post_save, so the search indexes, autocomplete, the
+catalogue rollup and the dashboard widget cache are updated here explicitly.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from ..models import Book, BookCodeSequence, BookCopy, BookIDSequence, CatalogueRollup, book_code_prefix
+from .autocomplete import refresh_autocomplete
+from .search import index_books
+from .widget_cache import invalidate_widgets
+
+__all__ = ['import_books', 'parse_copy_count', 'MAX_COPIES_PER_TITLE']
+
+MAX_COPIES_PER_TITLE = 500
+IMPORT_BATCH_SIZE = 500
+DEFAULT_YEAR = 2025
+
+
+def parse_copy_count(value):
+    """Number of physical copies to create for a new title (defaults to 1)"""
+    try:
+        count = int(str(value or '').strip() or 1)
+    except ValueError:
+        raise ValidationError(f"Invalid number of copies: '{value}'")
+    if not 1 <= count <= MAX_COPIES_PER_TITLE:
+        raise ValidationError(f"Copies must be between 1 and {MAX_COPIES_PER_TITLE}")
+    return count
+
+
+def _error_text(error):
+    if isinstance(error, ValidationError):
+        return '; '.join(error.messages)
+    return str(error)
+
+
+def _placement_error(school, subject):
+    """Book.clean()'s textbook/grade rule, checked once for the whole import."""
+    if subject and subject.category.name.lower() == 'textbook':
+        if not subject.grade:
+            return "Textbook must have a Grade"
+        if not school.active_grades.filter(pk=subject.grade_id).exists():
+            return f"School '{school}' does not offer {subject.grade}"
+    return None
+
+
+def _clean_row(row):
+    """Validated field values for one CSV row, plus its copy count. Raises ValidationError."""
+    values = {
+        'title': row.get('title', '').strip(),
+        'author': row.get('author', '').strip(),
+        'isbn': row.get('isbn', '').strip(),
+        'publisher': row.get('publisher', '').strip() or "Unknown",
+    }
+    try:
+        values['year_of_publication'] = int(row.get('year_of_publication', DEFAULT_YEAR) or DEFAULT_YEAR)
+    except ValueError:
+        raise ValidationError(f"Invalid year of publication: '{row.get('year_of_publication')}'")
+
+    for name, value in values.items():
+        values[name] = Book._meta.get_field(name).clean(value, None)
+    if values['isbn'] and not (4 <= len(values['isbn']) <= 20):
+        raise ValidationError("ISBN must be 4–20 characters")
+    return values, parse_copy_count(row.get('copies'))
+
+
+def _reserve_book_ids(centre, subject, count):
+    """`count` unused book_ids from contiguous BookIDSequence blocks."""
+    book_ids = []
+    while len(book_ids) < count:
+        candidates = [
+            Book.make_book_id(centre, subject, number)
+            for number in BookIDSequence.reserve(centre, subject, count - len(book_ids))
+        ]
+        # Hand-entered ids can sit ahead of the sequence; skip past them
+        taken = set(Book.objects.filter(book_id__in=candidates).values_list('book_id', flat=True))
+        book_ids.extend(book_id for book_id in candidates if book_id not in taken)
+    return book_ids
+
+
+def _bulk_insert(model, objects, key, user, batch_size, progress=None):
+    """
+    bulk_create `objects` plus their history rows. Backends without
+    INSERT ... RETURNING (MySQL) get their pks back through the unique `key`.
+    """
+    for start in range(0, len(objects), batch_size):
+        batch = objects[start:start + batch_size]
+        model.objects.bulk_create(batch)
+        if batch[0].pk is None:
+            pks = dict(
+                model.objects.filter(**{f'{key}__in': [getattr(obj, key) for obj in batch]})
+                .values_list(key, 'pk')
+            )
+            for obj in batch:
+                obj.pk = pks[getattr(obj, key)]
+                obj._state.adding = False
+        model.history.bulk_history_create(batch, batch_size=batch_size, default_user=user)
+        if progress:
+            progress(start + len(batch))
+
+
+def import_books(rows, school, subject, added_by, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """
+    Create a Book (with its copies) for every valid row of `rows`, an iterable
+    of CSV dicts whose first data row is spreadsheet row 2. Returns
+    (books, errors), errors being "Row N ('title'): reason" strings.
+    `progress(done, total=None)` is told how many books have been inserted.
+    """
+    centre = school.centre
+    placement_error = _placement_error(school, subject)
+    pending = []
+    errors = []
+
+    for row_num, row in enumerate(rows, start=2):
+        title = row.get('title', '').strip()
+        author = row.get('author', '').strip()
+        if not title or not author:
+            errors.append(f"Row {row_num}: Missing title or author")
+            continue
+        try:
+            if placement_error:
+                raise ValidationError(placement_error)
+            values, copies = _clean_row(row)
+        except ValidationError as e:
+            errors.append(f"Row {row_num} ('{title}'): {_error_text(e)}")
+            continue
+        pending.append((values, copies))
+
+    if not pending:
+        return [], errors
+    if progress:
+        progress(0, len(pending))
+
+    with transaction.atomic():
+        book_ids = _reserve_book_ids(centre, subject, len(pending))
+        book_codes = (
+            BookCodeSequence.reserve(book_code_prefix(subject.name), len(pending)) if subject
+            else [None] * len(pending)
+        )
+        books = [
+            Book(
+                **values,
+                school=school,
+                centre=centre,
+                subject=subject,
+                added_by=added_by,
+                book_id=book_id,
+                book_code=book_code,
+                copies_total=copies,
+                copies_available=copies,
+            )
+            for (values, copies), book_id, book_code in zip(pending, book_ids, book_codes)
+        ]
+        _bulk_insert(Book, books, 'book_id', added_by, batch_size, progress)
+
+        copies = [
+            BookCopy(book=book, copy_number=number, barcode=BookCopy.make_barcode(book, number))
+            for book in books
+            for number in range(1, book.copies_total + 1)
+        ]
+        _bulk_insert(BookCopy, copies, 'barcode', added_by, batch_size * 4)
+
+        CatalogueRollup.bump(
+            (centre.pk, school.pk, subject.pk if subject else None),
+            book_count=len(books),
+            available_count=len(books),
+            copies_total=len(copies),
+            copies_available=len(copies),
+        )
+        transaction.on_commit(lambda: invalidate_widgets(centre.pk))
+        index_books(books)
+
+    for book in books:
+        book._persisted_rollup_key = book.rollup_key()
+        book._persisted_book_code = book.book_code
+    refresh_autocomplete('book', books)
+    return books, errors
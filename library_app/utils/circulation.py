@@ -0,0 +1,196 @@
+"""
+Contention-safe issue and return.
+
+Each operation runs in a write transaction that takes its locks before
+reading anything:
+  MySQL:  SELECT ... FOR UPDATE on the book (and borrow) row.
+  SQLite: BEGIN IMMEDIATE, which takes the database write lock up front.
+          A plain BEGIN takes it at the first write, and two readers that
+          both try to upgrade then fail with "database is locked".
+Inside the lock, the borrow's status flip is a single conditional UPDATE
+(WHERE status = 'requested' / 'issued'), and the copies_available counter
+moves through Book.update_available_copies()'s guarded UPDATE. Two
+librarians approving requests for the last copy cannot both succeed.
+Lock timeouts and deadlocks are retried with exponential backoff when the
+call owns the transaction.
+
+The status flips are UPDATEs, so Borrow's post_save receivers don't run:
+the counter, copy, dashboard statistics, daily circulation, ranking,
+widget cache and history changes are made here, and callers send their
+own notifications.
+"""
+import random
+import time
+from contextlib import contextmanager
+
+import django
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction, OperationalError
+from django.utils import timezone
+
+from ..models import Book, BookCirculation, BookCopy, Borrow, CirculationDay, StatCounter
+from .widget_cache import invalidate_widgets
+
+__all__ = [
+    'CirculationError', 'NotAvailable', 'AlreadyProcessed',
+    'write_transaction', 'issue_borrow', 'issue_new_borrow', 'return_borrow',
+]
+
+LOCK_RETRIES = 8
+LOCK_BACKOFF = 0.02  # seconds, doubled on every retry
+LOCK_BACKOFF_MAX = 1.0
+# MySQL: lock wait timeout, deadlock
+RETRYABLE_MYSQL_ERRORS = (1205, 1213)
+
+
+class CirculationError(Exception):
+    pass
+
+
+class NotAvailable(CirculationError):
+    """No copy of the book is left on the shelf."""
+
+
+class AlreadyProcessed(CirculationError):
+    """The borrow is no longer in the status the operation starts from."""
+
+
+def _begins_immediate(connection):
+    """True if Django itself opens this SQLite connection's transactions with BEGIN IMMEDIATE (5.1+)."""
+    return connection.settings_dict.get('OPTIONS', {}).get('transaction_mode') == 'IMMEDIATE'
+
+
+@contextmanager
+def write_transaction(using='default'):
+    """transaction.atomic() that takes the write lock when it begins (see module docstring)."""
+    connection = transaction.get_connection(using)
+    if connection.vendor != 'sqlite' or connection.in_atomic_block or _begins_immediate(connection):
+        with transaction.atomic(using=using):
+            yield
+        return
+    # Django 5.0 always opens SQLite transactions with a deferred BEGIN, so swap
+    # in IMMEDIATE for this one through the backend's private hook. From 5.1 the
+    # hook is not relied on: set OPTIONS['transaction_mode'] = 'IMMEDIATE' instead
+    # (see settings.DATABASES). tests.WriteTransactionTests checks the BEGIN sent.
+    if django.VERSION >= (5, 1) or not hasattr(connection, '_start_transaction_under_autocommit'):
+        raise ImproperlyConfigured(
+            "write_transaction() needs OPTIONS['transaction_mode'] = 'IMMEDIATE' on SQLite databases."
+        )
+    connection.ensure_connection()
+    connection._start_transaction_under_autocommit = lambda: connection.cursor().execute('BEGIN IMMEDIATE')
+    try:
+        with transaction.atomic(using=using):
+            del connection._start_transaction_under_autocommit
+            yield
+    finally:
+        connection.__dict__.pop('_start_transaction_under_autocommit', None)
+
+
+def _is_lock_error(error):
+    if error.args and error.args[0] in RETRYABLE_MYSQL_ERRORS:
+        return True
+    return 'locked' in str(error)  # SQLite: "database is locked" / "database table is locked"
+
+
+def _with_retry(func, *args, using='default'):
+    """Run func(*args), retrying lock timeouts unless an outer transaction is already open."""
+    can_retry = not transaction.get_connection(using).in_atomic_block
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            return func(*args)
+        except OperationalError as e:
+            if not (can_retry and attempt < LOCK_RETRIES and _is_lock_error(e)):
+                raise
+        delay = min(LOCK_BACKOFF * 2 ** attempt, LOCK_BACKOFF_MAX)
+        time.sleep(delay * random.uniform(0.5, 1.5))
+
+
+def _issue(borrow, issued_by, due_date, issue_date):
+    with write_transaction():
+        book = Book.objects.select_for_update().get(pk=borrow.book_id)
+        locked = Borrow.objects.select_for_update().filter(pk=borrow.pk).values('status', 'copy_id').first()
+        if locked is None or locked['status'] != 'requested':
+            raise AlreadyProcessed(f"Borrow {borrow.pk} has already been processed.")
+        if not book.is_active or not book.update_available_copies(-1):
+            raise NotAvailable(f"'{book.title}' is no longer available.")
+        copy_id = book.claim_copy(locked['copy_id'])
+        if copy_id is None:
+            # The counter said a copy was free but none is on the shelf: raising
+            # rolls the decrement back with the rest
+            raise NotAvailable(f"No copy of '{book.title}' is on the shelf.")
+
+        changes = {
+            'status': 'issued',
+            'issue_date': issue_date,
+            'due_date': due_date,
+            'issued_by': issued_by,
+            'copy_id': copy_id,
+        }
+        if not Borrow.objects.filter(pk=borrow.pk, status='requested').update(**changes):
+            raise AlreadyProcessed(f"Borrow {borrow.pk} has already been processed.")
+
+        for field, value in changes.items():
+            setattr(borrow, field, value)
+        borrow.book = book
+        borrow._persisted_status = 'issued'
+        StatCounter.bump(borrow.centre_id, **StatCounter.borrow_status_deltas('requested', 'issued'))
+        CirculationDay.bump(borrow.centre_id, issue_date, issues=1)
+        BookCirculation.record_issue(book.pk, issue_date)
+        transaction.on_commit(lambda: invalidate_widgets(borrow.centre_id))
+        Borrow.history.bulk_history_create([borrow], update=True, default_user=issued_by)
+    return borrow
+
+
+def issue_borrow(borrow, issued_by, due_date, issue_date=None):
+    """
+    Issue a requested borrow: take a copy off the shelf and flip the status
+    in one transaction. Raises AlreadyProcessed if the borrow isn't
+    'requested' any more, NotAvailable if no copy is left. Returns `borrow`,
+    updated in place.
+    """
+    return _with_retry(_issue, borrow, issued_by, due_date, issue_date or timezone.now())
+
+
+def _issue_new(book, user, issued_by, due_date, fields):
+    with write_transaction():
+        borrow = Borrow.objects.create(book=book, user=user, centre=book.centre, status='requested', **fields)
+        return _issue(borrow, issued_by, due_date, borrow.request_date)
+
+
+def issue_new_borrow(book, user, issued_by, due_date, **fields):
+    """
+    Record and issue a borrow in one go (desk issues). Nothing is saved if
+    the book turns out to be unavailable (NotAvailable).
+    """
+    return _with_retry(_issue_new, book, user, issued_by, due_date, fields)
+
+
+def _return(borrow, received_by, return_date):
+    with write_transaction():
+        locked = Borrow.objects.select_for_update().filter(pk=borrow.pk).values('status', 'copy_id').first()
+        if locked is None or locked['status'] != 'issued':
+            raise AlreadyProcessed(f"Borrow {borrow.pk} is not on loan.")
+        changes = {'status': 'returned', 'return_date': return_date, 'returned_to': received_by}
+        if not Borrow.objects.filter(pk=borrow.pk, status='issued').update(**changes):
+            raise AlreadyProcessed(f"Borrow {borrow.pk} is not on loan.")
+
+        if locked['copy_id']:
+            BookCopy.objects.filter(pk=locked['copy_id'], status='issued').update(status='available')
+        borrow.book.update_available_copies(+1)
+
+        for field, value in changes.items():
+            setattr(borrow, field, value)
+        borrow._persisted_status = 'returned'
+        StatCounter.bump(borrow.centre_id, **StatCounter.borrow_status_deltas('issued', 'returned'))
+        CirculationDay.bump(borrow.centre_id, return_date, returns=1)
+        transaction.on_commit(lambda: invalidate_widgets(borrow.centre_id))
+        Borrow.history.bulk_history_create([borrow], update=True, default_user=received_by)
+    return borrow
+
+
+def return_borrow(borrow, received_by, return_date=None):
+    """
+    Check an issued borrow back in and put its copy on the shelf. Raises
+    AlreadyProcessed if it isn't on loan. Returns `borrow`, updated in place.
+    """
+    return _with_retry(_return, borrow, received_by, return_date or timezone.now())
@@ -0,0 +1,87 @@
+"""
+Reservation hold queue.
+
+A book's pending reservations form a FIFO queue, served by the
+(book, status, reservation_date) index. When a copy comes back,
+advance_queue() promotes the head (Reservation.promote_next) and tells the
+reader and the centre's librarians. `manage.py sweep_reservations` runs
+expire_holds(), which lapses overdue holds with one UPDATE and hands each
+freed copy to the next reader in that book's queue.
+"""
+from ..models import Book, Reservation
+from .notifications import notify, notify_librarians
+
+__all__ = ['advance_queue', 'expire_holds', 'fulfil_hold', 'hold_status']
+
+
+def _announce(reservation):
+    book, user = reservation.book, reservation.user
+    notify(
+        [user],
+        'book_available',
+        f"'{book.title}' is now available! Your reservation is ready. "
+        f"Please request to borrow within {Reservation.PICKUP_DAYS} days.",
+        event='available',
+        book=book,
+        reservation=reservation,
+    )
+    notify_librarians(
+        reservation.centre_id,
+        'reservation_fulfilled',
+        f"'{book.title}' is available for {user.get_full_name() or user.email}'s reservation",
+        event='available',
+        book=book,
+        reservation=reservation,
+    )
+
+
+def advance_queue(book, count=1):
+    """Promote the next `count` holds for `book` and notify them. Returns the promoted reservations."""
+    promoted = Reservation.promote_next(getattr(book, 'pk', book), count)
+    for reservation in promoted:
+        _announce(reservation)
+    return promoted
+
+
+def expire_holds(now=None):
+    """
+    Expire every lapsed hold, then pass each freed copy down its book's
+    queue (while the book still has a copy on the shelf). Returns
+    (expired, promoted) counts.
+    """
+    expired, freed = Reservation.expire_lapsed(now)
+    on_shelf = dict(
+        Book.objects.filter(pk__in=list(freed), copies_available__gt=0).values_list('pk', 'copies_available')
+    )
+    promoted = 0
+    for book_id, count in freed.items():
+        if book_id in on_shelf:
+            promoted += len(advance_queue(book_id, min(count, on_shelf[book_id])))
+    return expired, promoted
+
+
+def fulfil_hold(user, book):
+    """Close `user`'s pending hold on `book` once they have requested or borrowed it."""
+    return Reservation.objects.filter(user=user, book=book, status='pending').update(status='fulfilled')
+
+
+def hold_status(user, book):
+    """
+    The user's pending hold on `book` with its queue position and estimated
+    ready date, for book_detail. None if they hold no reservation.
+    """
+    if not user.is_authenticated:
+        return None
+    reservation = (
+        Reservation.objects.filter(user=user, book=book, status='pending')
+        .order_by('reservation_date', 'pk').first()
+    )
+    if reservation is None:
+        return None
+    return {
+        'reservation': reservation,
+        'ready': reservation.notified,
+        'pickup_by': reservation.expiry_date if reservation.notified else None,
+        'position': reservation.queue_position(),
+        'eta': reservation.estimated_ready_date(),
+    }
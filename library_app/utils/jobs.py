@@ -0,0 +1,127 @@
+"""
+Database-backed job queue for imports and exports that are too slow for a
+web request. Views call enqueue_job() and redirect to the job status page;
+`manage.py run_jobs` workers claim queued BackgroundJob rows and run the
+handler registered for their kind. With settings.BACKGROUND_JOBS_INLINE the
+job runs straight away inside the request instead (development, tests).
+"""
+import csv
+import io
+import traceback
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import BackgroundJob, School, Subject, Grade, Centre
+from .book_import import import_books
+from .exports import filter_grade_books, write_grade_books_xlsx, XLSX_CONTENT_TYPE
+from .student_import import read_student_rows, import_students
+
+__all__ = ['job_handler', 'enqueue_job', 'run_job', 'JOB_HANDLERS']
+
+JOB_HANDLERS = {}
+MAX_ERRORS_KEPT = 200
+
+
+def job_handler(kind):
+    """Register `func(job)` as the handler for jobs of `kind`; it returns the result dict."""
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue_job(kind, user, params=None, upload=None):
+    """Queue a job (with an optional uploaded file) and return it."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = BackgroundJob.objects.create(
+        kind=kind,
+        created_by=user,
+        params=params or {},
+        input_name=upload.name if upload else '',
+        input_data=upload.read() if upload else None,
+    )
+    if getattr(settings, 'BACKGROUND_JOBS_INLINE', False):
+        job.status = 'running'
+        job.attempts = 1
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'started_at'])
+        run_job(job)
+    return job
+
+
+def run_job(job):
+    """Run a claimed job to completion and record its outcome."""
+    try:
+        job.result = JOB_HANDLERS[job.kind](job) or {}
+        job.status = 'done'
+    except Exception as e:
+        print(f"Background job {job} failed: {e}")
+        job.status = 'failed'
+        job.error = f"{e}\n\n{traceback.format_exc()}"
+    job.finished_at = timezone.now()
+    job.save(update_fields=[
+        'status', 'result', 'error', 'finished_at',
+        'result_name', 'result_content_type', 'result_data',
+    ])
+    return job
+
+
+# ==========================================================
+# Handlers
+# ==========================================================
+@job_handler('book_import')
+def import_books_job(job):
+    school = School.objects.select_related('centre').get(pk=job.params['school_id'])
+    subject_id = job.params.get('subject_id')
+    subject = Subject.objects.select_related('grade', 'category').get(pk=subject_id) if subject_id else None
+    rows = list(csv.DictReader(io.StringIO(bytes(job.input_data).decode('utf-8-sig'))))
+    job.report(0, len(rows))
+
+    books, errors = import_books(rows, school, subject, job.created_by, progress=job.report)
+    return {
+        'added': len(books),
+        'book_ids': [book.pk for book in books],
+        'errors': errors[:MAX_ERRORS_KEPT],
+        'error_count': len(errors),
+    }
+
+
+@job_handler('student_import')
+def import_students_job(job):
+    centre = Centre.objects.get(pk=job.params['centre_id'])
+    school = School.objects.get(pk=job.params['school_id'], centre=centre)
+    rows = read_student_rows(job.input_name, bytes(job.input_data))
+    if not rows:
+        raise ValueError("File is empty.")
+
+    created_count, errors = import_students(rows, centre, school, progress=job.report)
+    return {
+        'created': created_count,
+        'errors': errors[:MAX_ERRORS_KEPT],
+        'error_count': len(errors),
+    }
+
+
+@job_handler('grade_books_export')
+def export_grade_books_job(job):
+    params = job.params
+    school = School.objects.get(pk=params['school_id'])
+    grade = Grade.objects.get(pk=params['grade_id'])
+    books = filter_grade_books(
+        school, grade,
+        category_id=params.get('category', ''),
+        subject_id=params.get('subject', ''),
+        q=params.get('q', ''),
+        available=params.get('available', False),
+    )
+    total = books.count()
+    job.report(0, total)
+
+    output = io.BytesIO()
+    ordering = None if params.get('q') else ('title',)
+    write_grade_books_xlsx(books, output, ordering=ordering, progress=job.report)
+    job.attach_result(f"{grade.name}_books.xlsx", XLSX_CONTENT_TYPE, output.getvalue())
+    job.report(total)
+    return {'rows': total}
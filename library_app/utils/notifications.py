@@ -0,0 +1,198 @@
+"""
+Notification fan-out.
+
+Every event goes through notify() (or notify_librarians()), which writes all
+of its notifications with a single bulk_create. Librarian recipients come
+from a per-centre roster of user ids kept in the cache, so fanning out to a
+centre's librarians costs one cache read once the roster is warm. The
+rosters are versioned as a set: any CustomUser save that can change who is
+a librarian where bumps the version, which also covers a librarian moving
+centre. The version is a VersionStamp row, re-read at most every
+ROSTER_CHECK_INTERVAL seconds per process, so every worker process stops
+using a stale roster within that time.
+
+Notifications for a state transition (a borrow issued or returned, a
+reservation becoming available) pass `event`. Each recipient's copy then
+gets an event_key of (user, type, borrow/reservation, transition), which is
+unique in the database, so the view and the post_save receiver reporting
+the same transition produce one row between them. Keys written recently
+are also remembered in-process, so repeats are usually dropped before
+reaching the database at all.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from ..models import CustomUser, Notification, VersionStamp
+
+__all__ = [
+    'notify', 'notify_librarians', 'notify_librarians_of_borrow_request', 'notify_teacher_bulk_request',
+    'send_notifications',
+    'librarian_ids', 'invalidate_librarian_rosters',
+]
+
+ROSTER_TIMEOUT = 60 * 60
+ROSTER_CHECK_INTERVAL = 2
+ROSTER_STAMP = 'librarian-rosters'
+# CustomUser fields whose change can move someone on or off a roster
+ROSTER_FIELDS = {'is_librarian', 'is_student', 'centre', 'centre_id'}
+RECENT_KEYS_MAX = 10000
+
+_recent_keys = OrderedDict()
+_recent_lock = threading.Lock()
+_roster_checked = (None, None)  # (version read, time.monotonic() it was read at)
+
+
+def _remember(keys):
+    with _recent_lock:
+        for key in keys:
+            _recent_keys[key] = None
+            _recent_keys.move_to_end(key)
+        while len(_recent_keys) > RECENT_KEYS_MAX:
+            _recent_keys.popitem(last=False)
+
+
+def _seen(key):
+    with _recent_lock:
+        return key in _recent_keys
+
+
+def _roster_version():
+    global _roster_checked
+    version, checked_at = _roster_checked
+    if checked_at is None or time.monotonic() - checked_at >= ROSTER_CHECK_INTERVAL:
+        version = VersionStamp.get(ROSTER_STAMP)
+        _roster_checked = (version, time.monotonic())
+    return version
+
+
+def invalidate_librarian_rosters():
+    """Drop every cached roster (call after queryset.update() on users)."""
+    global _roster_checked
+    VersionStamp.bump(ROSTER_STAMP)
+    _roster_checked = (None, None)
+
+
+def librarian_ids(centre):
+    """Ids of the librarians at `centre` (a Centre or its id), from the cached roster."""
+    centre_id = getattr(centre, 'pk', centre)
+    if centre_id is None:
+        return []
+    key = f"librarian-roster:{_roster_version()}:{centre_id}"
+    return cache.get_or_set(
+        key,
+        lambda: list(
+            CustomUser.objects.filter(is_librarian=True, centre_id=centre_id)
+            .order_by('pk').values_list('pk', flat=True)
+        ),
+        ROSTER_TIMEOUT,
+    )
+
+
+def notify(users, notification_type, message, event=None, **related):
+    """
+    Send one notification to each of `users` (users or user ids) in a single
+    INSERT. `related` takes the Notification links: book, borrow,
+    reservation, group_id. With `event` (e.g. 'issued'), users who already
+    got this notification for that transition are skipped. Returns the
+    notifications handed to the database.
+    """
+    notifications = [
+        Notification(
+            user_id=getattr(user, 'pk', user),
+            notification_type=notification_type,
+            message=message,
+            **related,
+        )
+        for user in dict.fromkeys(getattr(user, 'pk', user) for user in users)
+    ]
+    if event is None:
+        if notifications:
+            Notification.objects.bulk_create(notifications)
+        return notifications
+
+    for notification in notifications:
+        notification.event_key = Notification.make_event_key(
+            notification.user_id, notification_type, event,
+            notification.borrow_id, notification.reservation_id,
+        )
+    return send_notifications(notifications)
+
+
+def send_notifications(notifications, batch_size=1000):
+    """
+    Write prepared Notification objects that each carry an event_key (per-row
+    messages, e.g. reminders). Ones already sent are dropped. Returns the
+    notifications handed to the database.
+    """
+    notifications = [n for n in notifications if not _seen(n.event_key)]
+    if notifications:
+        # The unique event_key makes the database drop any we haven't seen here
+        Notification.objects.bulk_create(notifications, batch_size=batch_size, ignore_conflicts=True)
+        keys = [n.event_key for n in notifications]
+        # Only once committed, so a rolled-back transition can still notify later
+        transaction.on_commit(lambda: _remember(keys))
+    return notifications
+
+
+def notify_librarians(centre, notification_type, message, **related):
+    """notify() every librarian at `centre`."""
+    return notify(librarian_ids(centre), notification_type, message, **related)
+
+
+def notify_librarians_of_borrow_request(borrow):
+    """Tell the centre's librarians about a new borrow request."""
+    return notify_librarians(
+        borrow.centre_id,
+        'borrow_request',
+        f"{borrow.user.get_full_name() or borrow.user.email} "
+        f"requested to borrow '{borrow.book.title}'",
+        book=borrow.book,
+        borrow=borrow,
+    )
+
+
+def notify_teacher_bulk_request(teacher, books, centre):
+    """
+    One grouped notification per librarian for a teacher's bulk request,
+    instead of one per librarian per book. The group_id ties together a
+    teacher's bulk requests for the day.
+    """
+    books = list(books)
+    if not books:
+        return []
+    group_id = hashlib.md5(
+        f"{teacher.id}-{timezone.now().date()}".encode()
+    ).hexdigest()
+
+    book_titles = ", ".join([f"'{b.title}'" for b in books[:3]])
+    if len(books) > 3:
+        book_titles += f", and {len(books) - 3} more"
+
+    message = (
+        f"{teacher.get_full_name() or teacher.email} requested "
+        f"{len(books)} book{'s' if len(books) != 1 else ''}: {book_titles}"
+    )
+    return notify_librarians(centre, 'teacher_bulk_request', message, group_id=group_id)
+
+
+@receiver(post_save, sender=CustomUser)
+def update_librarian_rosters(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not ROSTER_FIELDS.intersection(update_fields):
+        return  # e.g. last_login on every sign-in
+    if created and not instance.is_librarian:
+        return
+    transaction.on_commit(invalidate_librarian_rosters)
+
+
+@receiver(post_delete, sender=CustomUser)
+def remove_from_librarian_rosters(sender, instance, **kwargs):
+    if instance.is_librarian:
+        transaction.on_commit(invalidate_librarian_rosters)
@@ -0,0 +1,236 @@
+"""
+Keyset (cursor) pagination for the long list views.
+
+Instead of COUNT(*) + OFFSET, each page seeks past the last row's sort key,
+e.g. WHERE (request_date, id) < (last_request_date, last_id) for ordering
+('-request_date', '-id'), so page 500 costs the same as page 1 as long as the
+ordering is backed by an index. The cursor is a signed token carrying that key.
+
+paginate() is the entry point for views: it returns a CursorPage, or a classic
+Django Page when the request still uses ?page=N (old links/bookmarks) or the
+queryset has no stable keyset ordering (e.g. relevance-ranked search results).
+"""
+import datetime
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+
+__all__ = ['CursorPaginator', 'CursorPage', 'paginate', 'count_cache_key']
+
+CURSOR_SALT = 'library_app.cursor'
+COUNT_TIMEOUT = 120
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def count_cache_key(request, name):
+    """Cache key for a list's total: per view, user and filter parameters."""
+    params = sorted(
+        (key, value) for key, value in request.GET.items() if key not in ('cursor', 'page')
+    )
+    return f"list-count:{name}:{request.user.pk}:{urlencode(params)}"
+
+
+class CursorPage:
+    """The slice of rows for one cursor, with just enough of Page's API for the templates."""
+    is_cursor = True
+
+    def __init__(self, paginator, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.next_querystring = ''
+        self.previous_querystring = ''
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+
+class CursorPaginator:
+    """
+    Keyset paginator over `queryset` ordered by `ordering`, e.g. ('-request_date',).
+    The primary key is appended as the final tie-breaker. Pass `count_key` to
+    expose a cached total as `.count` (None otherwise; keyset pages never count).
+    """
+
+    def __init__(self, queryset, ordering, per_page, count_key=None, count_timeout=COUNT_TIMEOUT):
+        ordering = list(ordering)
+        if not any(o.lstrip('-') in ('pk', 'id') for o in ordering):
+            ordering.append('-pk' if ordering and ordering[0].startswith('-') else 'pk')
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+        self.count_key = count_key
+        self.count_timeout = count_timeout
+        self.keys = [self._resolve(o.lstrip('-'), o.startswith('-')) for o in ordering]
+        self.nulls_largest = connections[queryset.db].features.nulls_order_largest
+
+    @property
+    def count(self):
+        if not self.count_key:
+            return None
+        return cache.get_or_set(self.count_key, self.queryset.count, self.count_timeout)
+
+    def _resolve(self, path, descending):
+        model = self.queryset.model
+        parts = path.split(LOOKUP_SEP)
+        field = None
+        for part in parts:
+            field = model._meta.pk if part == 'pk' else model._meta.get_field(part)
+            if field.is_relation:
+                model = field.related_model
+        if path == 'pk':
+            path = self.queryset.model._meta.pk.name
+        return {'path': path, 'attrs': path.split(LOOKUP_SEP), 'field': field, 'descending': descending}
+
+    # ----- cursor encoding -----
+    def _key_of(self, obj):
+        if isinstance(obj, dict):  # .values() rows
+            return [obj[key['path']] for key in self.keys]
+        values = []
+        for key in self.keys:
+            value = obj
+            for attr in key['attrs']:
+                value = getattr(value, attr) if value is not None else None
+            values.append(value)
+        return values
+
+    def _encode(self, direction, values):
+        def plain(value):
+            if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+                return value.isoformat()
+            if isinstance(value, Decimal):
+                return str(value)
+            if hasattr(value, 'pk'):
+                return value.pk
+            return value
+        return signing.dumps([direction, [plain(v) for v in values]], salt=CURSOR_SALT, compress=True)
+
+    def _decode(self, token):
+        try:
+            direction, raw_values = signing.loads(token, salt=CURSOR_SALT)
+            if direction not in ('next', 'prev') or len(raw_values) != len(self.keys):
+                raise ValueError
+            values = []
+            for key, raw in zip(self.keys, raw_values):
+                field = key['field'].target_field if key['field'].is_relation else key['field']
+                values.append(None if raw is None else field.to_python(raw))
+        except (signing.BadSignature, ValidationError, ValueError, TypeError) as exc:
+            raise InvalidCursor(str(exc))
+        return direction, values
+
+    # ----- seek condition -----
+    def _after(self, key, value, descending):
+        """Rows strictly after `value` on one key, treating NULL as the DB sorts it."""
+        path, nullable = key['path'], key['field'].null
+        wants_greater = not descending
+        if value is None:
+            # NULLs sort as +inf (nulls_largest) or -inf
+            if wants_greater == self.nulls_largest:
+                return Q(pk__in=[])
+            return Q(**{f'{path}__isnull': False})
+        condition = Q(**{f'{path}__{"gt" if wants_greater else "lt"}': value})
+        if nullable and wants_greater == self.nulls_largest:
+            condition |= Q(**{f'{path}__isnull': True})
+        return condition
+
+    def _seek(self, values, reverse):
+        condition = Q(pk__in=[])
+        equal_so_far = Q()
+        for key, value in zip(self.keys, values):
+            descending = key['descending'] != reverse
+            condition |= equal_so_far & self._after(key, value, descending)
+            equal_so_far &= Q(**{f"{key['path']}__isnull": True}) if value is None else Q(**{key['path']: value})
+        return condition
+
+    def _order(self, reverse):
+        return [('-' if key['descending'] != reverse else '') + key['path'] for key in self.keys]
+
+    def iterate(self):
+        """
+        Every row, fetched per_page at a time by seeking from the previous
+        chunk, so memory stays flat even where DB drivers can't stream.
+        """
+        rows = self.queryset.order_by(*self._order(False))
+        values = None
+        while True:
+            chunk = list((rows if values is None else rows.filter(self._seek(values, False)))[:self.per_page])
+            yield from chunk
+            if len(chunk) < self.per_page:
+                return
+            values = self._key_of(chunk[-1])
+
+    def get_page(self, token=None):
+        direction, values = 'next', None
+        if token:
+            try:
+                direction, values = self._decode(token)
+            except InvalidCursor:
+                direction, values = 'next', None
+
+        reverse = direction == 'prev'
+        rows = self.queryset.order_by(*self._order(reverse))
+        if values is not None:
+            rows = rows.filter(self._seek(values, reverse))
+        rows = list(rows[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        if reverse:
+            has_next, has_previous = values is not None, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        next_cursor = self._encode('next', self._key_of(rows[-1])) if rows and has_next else None
+        previous_cursor = self._encode('prev', self._key_of(rows[0])) if rows and has_previous else None
+        return CursorPage(self, rows, has_next, has_previous, next_cursor, previous_cursor)
+
+
+def paginate(request, queryset, ordering, per_page, count_key=None):
+    """
+    Page `queryset` for a list view. Uses keyset pagination on `ordering` unless
+    the request asks for ?page=N or `ordering` is None, in which case the
+    classic Paginator is used on the queryset's existing order.
+    """
+    if ordering is None or 'page' in request.GET:
+        if ordering is not None:
+            queryset = queryset.order_by(*ordering)
+        return Paginator(queryset, per_page).get_page(request.GET.get('page'))
+
+    page = CursorPaginator(queryset, ordering, per_page, count_key=count_key).get_page(request.GET.get('cursor'))
+    params = request.GET.copy()
+    params.pop('page', None)
+    for cursor, attr in ((page.next_cursor, 'next_querystring'), (page.previous_cursor, 'previous_querystring')):
+        if cursor:
+            params['cursor'] = cursor
+            setattr(page, attr, params.urlencode())
+    return page
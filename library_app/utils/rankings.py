@@ -0,0 +1,128 @@
+"""
+"Most borrowed" leaderboards.
+
+Books are ranked by BookCirculation: issue counters per book for its
+lifetime and the last 30/90/365 days, copied next to the book's centre,
+school and grade. A top-N list is the first rows of one ordered index,
+however long the borrow history grows. The counters go up as books are
+issued (the receiver below, utils.circulation). `manage.py
+sweep_circulation_windows`, run daily, takes each day's issues back out of
+the windows it has left; it reads them off Borrow's issue_date index.
+
+Centres are ranked from the daily circulation facts (CirculationDay, one
+row per centre per day), which are already per-centre aggregates.
+
+A book moving school or centre is followed by the receiver below; a
+subject moving grade is picked up by `sweep_circulation_windows --rebuild`.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from ..models import Book, BookCirculation, Borrow, CirculationDay, Subject, SweepMark
+from .refdata import get_centre
+
+__all__ = ['top_books', 'top_centres', 'sweep_circulation_windows', 'rebuild_circulation_windows', 'RANKING_WINDOWS']
+
+RANKING_WINDOWS = tuple(BookCirculation.WINDOWS)
+SWEEP_NAME = 'circulation_windows'
+
+
+def _mark_aged(day):
+    SweepMark.advance(SWEEP_NAME, timezone.make_aware(datetime.combine(day, time.min)))
+
+
+def rebuild_circulation_windows(today=None):
+    """Recount every book's counters from Borrow. Returns the number of rows written."""
+    today = today or timezone.localdate()
+    with transaction.atomic():
+        rows = BookCirculation.rebuild(today)
+        _mark_aged(today)
+    return rows
+
+
+def sweep_circulation_windows(today=None):
+    """
+    Age the windows up to `today`, one day at a time from the last day
+    aged. Rebuilds from Borrow on the first run, or after a gap longer than
+    the widest window. Returns the number of days aged.
+    """
+    today = today or timezone.localdate()
+    mark = SweepMark.get(SWEEP_NAME)
+    last = timezone.localdate(mark) if mark else None
+    if last is None or (today - last).days > max(days for days in BookCirculation.WINDOWS.values() if days):
+        rebuild_circulation_windows(today)
+        return 0
+    aged = 0
+    day = last
+    while day < today:
+        day += timedelta(days=1)
+        with transaction.atomic():
+            BookCirculation.age(day)
+            _mark_aged(day)
+        aged += 1
+    return aged
+
+
+def top_books(window='all', centre=None, school=None, grade=None, limit=10):
+    """
+    The most issued active books over `window` ('all', '30d', '90d' or
+    '365d'), optionally within one centre, school or grade. Each book
+    carries its count as `borrow_count`.
+    """
+    rows = BookCirculation.objects.filter(window=window, issues__gt=0, book__is_active=True)
+    if centre is not None:
+        rows = rows.filter(centre=centre)
+    if school is not None:
+        rows = rows.filter(school=school)
+    if grade is not None:
+        rows = rows.filter(grade=grade)
+    ranked = list(rows.order_by('-issues').values_list('book_id', 'issues')[:limit])
+    books = Book.objects.select_related('subject', 'subject__category', 'subject__grade').in_bulk(
+        [book_id for book_id, _ in ranked]
+    )
+    top = []
+    for book_id, issues in ranked:
+        book = books.get(book_id)
+        if book is not None:
+            book.borrow_count = issues
+            top.append(book)
+    return top
+
+
+def top_centres(window='all', limit=10):
+    """
+    Centres by books issued over `window`, as (centre, issues) pairs. Sums
+    CirculationDay: at most one row per centre per day in the window.
+    """
+    rows = CirculationDay.objects.filter(centre__isnull=False)
+    days = BookCirculation.WINDOWS[window]
+    if days is not None:
+        rows = rows.filter(day__gt=timezone.localdate() - timedelta(days=days))
+    totals = rows.values('centre_id').annotate(issued=Sum('issues')).filter(issued__gt=0).order_by('-issued')[:limit]
+    ranked = []
+    for row in totals:
+        centre = get_centre(row['centre_id'])
+        if centre is not None:
+            ranked.append((centre, row['issued']))
+    return ranked
+
+
+@receiver(post_save, sender=Borrow)
+def count_issue(sender, instance, created, **kwargs):
+    if instance.status == 'issued' and (created or instance._persisted_status != 'issued'):
+        BookCirculation.record_issue(instance.book_id, instance.issue_date or timezone.now())
+
+
+@receiver(post_save, sender=Book)
+def follow_book_scope(sender, instance, created, **kwargs):
+    if created:
+        return
+    grade_id = Subject.objects.filter(pk=instance.subject_id).values_list('grade_id', flat=True).first()
+    BookCirculation.objects.filter(book_id=instance.pk).update(
+        centre_id=instance.centre_id, school_id=instance.school_id, grade_id=grade_id
+    )
@@ -0,0 +1,203 @@
+"""
+Process-level cache of the reference tables behind every dropdown and
+chained picker: centres, schools, grades, categories and subjects.
+
+The whole set is small, so it is loaded in one go (six queries) and kept in
+this process, with schools indexed by centre (plus each school's active
+grades) and subjects by (category, grade). book_form_tree() packs it all
+into the one JSON payload the book forms resolve their dropdowns from.
+
+Saving or deleting any of those rows bumps a VersionStamp row once the
+transaction commits. Reads compare that version with the one the snapshot
+was loaded under and reload on a mismatch. The version is re-read at most
+every REFDATA_CHECK_INTERVAL seconds per process, so every worker process
+sees a change within that time, whatever cache backend it runs with; the
+process that made the change sees it at once.
+
+The returned model instances are shared between requests: treat them as
+read-only, and build new objects (or dicts) to annotate.
+"""
+import threading
+import time
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from ..models import Category, Centre, Grade, School, Subject, VersionStamp
+
+__all__ = [
+    'get_centres', 'get_centre', 'get_schools', 'get_grades', 'get_categories', 'get_subjects',
+    'get_refdata_version', 'book_form_tree', 'invalidate_refdata',
+]
+
+REFDATA_CHECK_INTERVAL = 2
+REFDATA_STAMP = 'refdata'
+
+_snapshot = None
+_checked = (None, None)  # (version read, time.monotonic() it was read at)
+_lock = threading.Lock()
+
+
+class _Snapshot:
+    def __init__(self, version):
+        self.version = version
+
+        self.centres = list(Centre.objects.order_by('name'))
+        self.centres_by_id = {centre.pk: centre for centre in self.centres}
+
+        self.schools_by_centre = {}
+        for school in School.objects.order_by('name'):
+            school.centre = self.centres_by_id[school.centre_id]
+            self.schools_by_centre.setdefault(school.centre_id, []).append(school)
+        self.school_grade_ids = {}
+        active_grades = School.active_grades.through.objects.order_by('grade__order', 'grade__name')
+        for school_id, grade_id in active_grades.values_list('school_id', 'grade_id'):
+            self.school_grade_ids.setdefault(school_id, []).append(grade_id)
+
+        self.grades = list(Grade.objects.order_by('order', 'name'))
+        self.categories = list(Category.objects.order_by('name'))
+        grades_by_id = {grade.pk: grade for grade in self.grades}
+        categories_by_id = {category.pk: category for category in self.categories}
+
+        # Every (category, grade) filter the pickers send, None meaning "any"
+        self.subjects = {}
+        for subject in Subject.objects.order_by('name'):
+            subject.category = categories_by_id[subject.category_id]
+            subject.grade = grades_by_id.get(subject.grade_id)
+            for key in {
+                (None, None), (subject.category_id, None),
+                (None, subject.grade_id), (subject.category_id, subject.grade_id),
+            }:
+                self.subjects.setdefault(key, []).append(subject)
+        self.trees = {}
+
+    def is_current(self, version):
+        return self.version == version
+
+
+def _version():
+    global _checked
+    version, checked_at = _checked
+    if checked_at is None or time.monotonic() - checked_at >= REFDATA_CHECK_INTERVAL:
+        version = VersionStamp.get(REFDATA_STAMP)
+        _checked = (version, time.monotonic())
+    return version
+
+
+def _current():
+    global _snapshot
+    version = _version()
+    snapshot = _snapshot
+    if snapshot is None or not snapshot.is_current(version):
+        with _lock:
+            if _snapshot is None or not _snapshot.is_current(version):
+                _snapshot = _Snapshot(version)
+            snapshot = _snapshot
+    return snapshot
+
+
+def _pk(value):
+    """A request parameter as a primary key; None if it is not a number."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def invalidate_refdata():
+    """Make every process reload the reference data (call after queryset.update() on those tables)."""
+    global _checked
+    VersionStamp.bump(REFDATA_STAMP)
+    _checked = (None, None)
+
+
+def get_refdata_version():
+    """Version stamp of the current snapshot, e.g. for ETags."""
+    return _current().version
+
+
+def book_form_tree(centre_ids=None):
+    """
+    Everything the book add/edit dropdowns cascade through, in compact form:
+      centres:    [[id, name, [[school_id, name, [active grade ids]], ...]], ...]
+      grades:     [[id, name], ...]
+      categories: [[id, name], ...]
+      subjects:   [[id, name, category_id, grade_id], ...]
+    `centre_ids` limits the centres (and so the schools) included.
+    """
+    snapshot = _current()
+    scope = None if centre_ids is None else tuple(sorted(centre_ids))
+    tree = snapshot.trees.get(scope)
+    if tree is None:
+        tree = {
+            'version': snapshot.version,
+            'centres': [
+                [centre.pk, centre.name, [
+                    [school.pk, school.name, snapshot.school_grade_ids.get(school.pk, [])]
+                    for school in snapshot.schools_by_centre.get(centre.pk, [])
+                ]]
+                for centre in snapshot.centres
+                if scope is None or centre.pk in scope
+            ],
+            'grades': [[grade.pk, grade.name] for grade in snapshot.grades],
+            'categories': [[category.pk, category.name] for category in snapshot.categories],
+            'subjects': [
+                [subject.pk, subject.name, subject.category_id, subject.grade_id]
+                for subject in snapshot.subjects.get((None, None), [])
+            ],
+        }
+        snapshot.trees[scope] = tree
+    return tree
+
+
+def get_centres():
+    """All centres, by name."""
+    return list(_current().centres)
+
+
+def get_centre(centre_id):
+    """The centre with this id, or None."""
+    return _current().centres_by_id.get(_pk(centre_id))
+
+
+def get_schools(centre_id):
+    """The schools of a centre, by name."""
+    return list(_current().schools_by_centre.get(_pk(centre_id), []))
+
+
+def get_grades():
+    """All grades, in Grade's (order, name) order."""
+    return list(_current().grades)
+
+
+def get_categories():
+    """All categories, by name."""
+    return list(_current().categories)
+
+
+def get_subjects(category_id=None, grade_id=None):
+    """Subjects by name, optionally narrowed to a category and/or grade (blank means any)."""
+    key = []
+    for value in (category_id, grade_id):
+        if value in (None, ''):
+            key.append(None)
+        else:
+            key.append(_pk(value) or -1)  # an id that isn't a number matches nothing
+    return list(_current().subjects.get(tuple(key), []))
+
+
+@receiver([post_save, post_delete], sender=Centre)
+@receiver([post_save, post_delete], sender=School)
+@receiver([post_save, post_delete], sender=Grade)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Subject)
+def reference_data_changed(sender, **kwargs):
+    # After commit, so no process reloads the old rows under the new version
+    transaction.on_commit(invalidate_refdata)
+
+
+@receiver(m2m_changed, sender=School.active_grades.through)
+def school_grades_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(invalidate_refdata)
@@ -0,0 +1,152 @@
+"""
+Overdue and due-soon reminders, sent by `manage.py sweep_overdue` from cron.
+
+Each run only looks at loans whose due date crossed a threshold since the
+previous run. It reads two due-date ranges per table off the (status, due
+date) indexes:
+  overdue:  high_water < due <= now
+  due soon: high_water + window < due <= now + window
+Then it records `now` as the new high-water mark (SweepMark). A run's cost
+follows the number of loans that fell due, not the number of open loans. The
+first run has no mark and reminds every loan that is already overdue.
+
+The loans found overdue are also counted into the daily circulation facts
+(CirculationDay.overdues), on the day they fell due.
+
+Reminders carry an event_key that includes the due date, so overlapping or
+repeated runs never send the same reminder twice. A renewed loan gets fresh
+reminders for its new due date.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Borrow, CirculationDay, Notification, SweepMark, TeacherBookIssue
+from .notifications import send_notifications
+
+__all__ = ['sweep_reminders', 'DUE_SOON_WINDOW']
+
+SWEEP_NAME = 'overdue_reminders'
+DUE_SOON_WINDOW = timedelta(hours=24)
+SWEEP_BATCH_SIZE = 1000
+
+
+def _due_ranges(since, now, window):
+    """(overdue, due_soon) as (after, up_to) bounds; `after` None means unbounded."""
+    due_soon_after = now if since is None else max(since + window, now)
+    return (since, now), (due_soon_after, now + window)
+
+
+def _in_range(field, bounds):
+    after, up_to = bounds
+    lookups = {f'{field}__lte': up_to}
+    if after is not None:
+        lookups[f'{field}__gt'] = after
+    return lookups
+
+
+def _borrow_reminders(bounds, overdue):
+    rows = (
+        Borrow.objects.filter(status='issued', **_in_range('due_date', bounds))
+        .values_list('pk', 'user_id', 'book_id', 'book__title', 'due_date')
+    )
+    for borrow_id, user_id, book_id, title, due_date in rows.iterator(chunk_size=SWEEP_BATCH_SIZE):
+        local_due = timezone.localtime(due_date)
+        if overdue:
+            notification_type = 'overdue_reminder'
+            message = (
+                f"'{title}' was due on {local_due.strftime('%Y-%m-%d')}. "
+                "Please return it as soon as possible."
+            )
+        else:
+            notification_type = 'due_soon'
+            message = f"'{title}' is due back on {local_due.strftime('%Y-%m-%d %H:%M')}."
+        yield Notification(
+            user_id=user_id,
+            notification_type=notification_type,
+            message=message,
+            book_id=book_id,
+            borrow_id=borrow_id,
+            event_key=Notification.make_event_key(
+                user_id, notification_type, f"due:{due_date.isoformat()}", borrow_id=borrow_id
+            ),
+        )
+
+
+def _student_issue_reminders(bounds, overdue):
+    """Teachers' hand-outs to students: the reminder goes to the teacher."""
+    rows = (
+        TeacherBookIssue.objects.filter(status='issued', **_in_range('expected_return_date', bounds))
+        .values_list('pk', 'teacher_id', 'parent_borrow_id', 'book_id', 'book__title', 'student_name', 'expected_return_date')
+    )
+    for issue_id, teacher_id, borrow_id, book_id, title, student_name, due_date in rows.iterator(chunk_size=SWEEP_BATCH_SIZE):
+        local_due = timezone.localtime(due_date)
+        if overdue:
+            notification_type = 'overdue_reminder'
+            message = f"{student_name} was due to return '{title}' to you on {local_due.strftime('%Y-%m-%d')}."
+        else:
+            notification_type = 'due_soon'
+            message = f"{student_name} is due to return '{title}' to you on {local_due.strftime('%Y-%m-%d %H:%M')}."
+        yield Notification(
+            user_id=teacher_id,
+            notification_type=notification_type,
+            message=message,
+            book_id=book_id,
+            borrow_id=borrow_id,
+            event_key=Notification.make_event_key(
+                teacher_id, notification_type, f"student-issue:{issue_id}:due:{due_date.isoformat()}",
+                borrow_id=borrow_id,
+            ),
+        )
+
+
+def _record_overdues(bounds):
+    days = Counter(
+        (centre_id, timezone.localdate(due_date))
+        for centre_id, due_date in Borrow.objects.filter(status='issued', **_in_range('due_date', bounds))
+        .values_list('centre_id', 'due_date').iterator(chunk_size=SWEEP_BATCH_SIZE)
+    )
+    for (centre_id, day), count in days.items():
+        CirculationDay.bump(centre_id, day, overdues=count)
+
+
+def _send_in_batches(notifications):
+    sent = 0
+    batch = []
+    for notification in notifications:
+        batch.append(notification)
+        if len(batch) >= SWEEP_BATCH_SIZE:
+            sent += len(send_notifications(batch))
+            batch = []
+    if batch:
+        sent += len(send_notifications(batch))
+    return sent
+
+
+def sweep_reminders(now=None, window=DUE_SOON_WINDOW):
+    """
+    Send the overdue and due-soon reminders that became due since the last
+    sweep, then advance the mark. Returns {'overdue': n, 'due_soon': n}.
+    """
+    now = now or timezone.now()
+    since = SweepMark.get(SWEEP_NAME)
+    if since is not None and since >= now:
+        return {'overdue': 0, 'due_soon': 0}
+    overdue, due_soon = _due_ranges(since, now, window)
+
+    with transaction.atomic():
+        counts = {
+            'overdue': (
+                _send_in_batches(_borrow_reminders(overdue, True))
+                + _send_in_batches(_student_issue_reminders(overdue, True))
+            ),
+            'due_soon': (
+                _send_in_batches(_borrow_reminders(due_soon, False))
+                + _send_in_batches(_student_issue_reminders(due_soon, False))
+            ),
+        }
+        _record_overdues(overdue)
+        SweepMark.advance(SWEEP_NAME, now)
+    return counts
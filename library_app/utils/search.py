@@ -0,0 +1,272 @@
+"""
+Catalogue and student search.
+
+Full-text: SQLite keeps a separate FTS5 table (rowid = book.id) that the
+receivers below update on every Book save and delete. MySQL uses a FULLTEXT
+index on the book table itself, which InnoDB maintains on its own. Both are
+created by migration 0006; any other backend falls back to icontains.
+
+Fuzzy: SearchTrigram holds a posting list of (kind, trigram, object_id) for
+book titles, authors and student names, so a misspelt query only touches the
+postings of its own trigrams instead of scanning the table.
+"""
+import math
+import re
+import unicodedata
+
+from django.db import connections
+from django.db.models import Q, Count, Max, F, Case, When, Value, FloatField, ExpressionWrapper
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ..models import Book, Student, SearchTrigram
+
+__all__ = [
+    'search_books', 'fuzzy_scores', 'fuzzy_search', 'rank_expression', 'make_trigrams',
+    'index_books', 'unindex_books', 'index_students', 'unindex_students',
+    'rebuild_book_index', 'rebuild_trigram_index',
+]
+
+FTS_TABLE = 'library_app_book_fts'
+SEARCH_FIELDS = ('title', 'author', 'isbn', 'book_id', 'book_code')
+TOKEN_RE = re.compile(r'\w+')
+
+BOOK_TRIGRAM_FIELDS = {'book_title': 'title', 'book_author': 'author'}
+STUDENT_TRIGRAM_FIELDS = {'student_name': 'name'}
+
+# Share of the query's trigrams a row must contain to count as a match
+FUZZY_THRESHOLD = 0.5
+FUZZY_LIMIT = 200
+
+
+def search_books(queryset, query):
+    """
+    Narrow a Book queryset to rows matching every word of `query` (prefix match),
+    best match first. The rank is exposed as `search_rank`; callers that need a
+    different order can still call order_by() afterwards.
+
+    Falls back to trigram matching on title/author when the full-text query
+    finds nothing, so misspellings still return something useful.
+    """
+    results = _full_text_search(queryset, query)
+    if results.exists():
+        return results
+    return fuzzy_search(queryset, BOOK_TRIGRAM_FIELDS, query)
+
+
+def _full_text_search(queryset, query):
+    tokens = TOKEN_RE.findall(query)
+    if not tokens:
+        return queryset.none()
+
+    connection = connections[queryset.db]
+    book_table = Book._meta.db_table
+
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {book_table}.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+            select={'search_rank': f'bm25({FTS_TABLE})'},
+        ).order_by('search_rank')
+
+    if connection.vendor == 'mysql':
+        columns = ', '.join(f'{book_table}.{field}' for field in SEARCH_FIELDS)
+        against = ' '.join(f'+{token}*' for token in tokens)
+        match_sql = f'MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)'
+        return queryset.extra(
+            where=[match_sql],
+            params=[against],
+            select={'search_rank': match_sql},
+            select_params=[against],
+        ).order_by('-search_rank')
+
+    condition = Q()
+    for field in SEARCH_FIELDS:
+        condition |= Q(**{f'{field}__icontains': query})
+    return queryset.filter(condition)
+
+
+# ==========================================================
+# Trigram (fuzzy) search
+# ==========================================================
+def make_trigrams(text):
+    """Lower-cased, accent-stripped word trigrams, padded like pg_trgm."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    grams = set()
+    for word in TOKEN_RE.findall(text):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def fuzzy_scores(kinds, query, candidates=None, threshold=FUZZY_THRESHOLD, limit=FUZZY_LIMIT):
+    """
+    Return {object_id: score} for the best `limit` matches of `query` across the
+    given trigram kinds. The score is the share of the query's trigrams found in
+    the row; ties go to the shorter text. `candidates` (a queryset) restricts the
+    rows considered, e.g. to one centre.
+    """
+    grams = make_trigrams(query)
+    if not grams:
+        return {}
+
+    postings = SearchTrigram.objects.filter(kind__in=list(kinds), trigram__in=grams)
+    if candidates is not None:
+        postings = postings.filter(object_id__in=candidates.values('pk'))
+
+    matches = (
+        postings.values('kind', 'object_id')
+        .annotate(shared=Count('id'), gram_count=Max('gram_count'))
+        .filter(shared__gte=math.ceil(threshold * len(grams)))
+        .annotate(
+            score=ExpressionWrapper(F('shared') * 1.0 / len(grams), output_field=FloatField()),
+            similarity=ExpressionWrapper(
+                F('shared') * 1.0 / (len(grams) + F('gram_count') - F('shared')),
+                output_field=FloatField(),
+            ),
+        )
+        .order_by('-score', '-similarity')[:limit]
+    )
+
+    scores = {}
+    for row in matches:
+        scores[row['object_id']] = max(scores.get(row['object_id'], 0), row['score'])
+    return scores
+
+
+def fuzzy_search(queryset, kinds, query, **kwargs):
+    """Narrow `queryset` to fuzzy matches of `query`, best first, as `search_rank`."""
+    scores = fuzzy_scores(kinds, query, candidates=queryset, **kwargs)
+    if not scores:
+        return queryset.none()
+    return (
+        queryset.filter(pk__in=scores)
+        .annotate(search_rank=rank_expression(scores))
+        .order_by('-search_rank', 'pk')
+    )
+
+
+def rank_expression(scores, default=None):
+    """CASE expression mapping pk -> score, for annotating fuzzy_scores() results."""
+    return Case(
+        *[When(pk=pk, then=Value(score)) for pk, score in scores.items()],
+        default=Value(default),
+        output_field=FloatField(),
+    )
+
+
+def _index_trigrams(fields, objects):
+    objects = list(objects)
+    SearchTrigram.objects.filter(
+        kind__in=list(fields), object_id__in=[obj.pk for obj in objects]
+    ).delete()
+    rows = []
+    for obj in objects:
+        for kind, field in fields.items():
+            grams = make_trigrams(getattr(obj, field))
+            rows.extend(
+                SearchTrigram(kind=kind, trigram=gram, object_id=obj.pk, gram_count=len(grams))
+                for gram in grams
+            )
+    SearchTrigram.objects.bulk_create(rows, batch_size=2000)
+
+
+def index_students(students):
+    """(Re)index student names. Bulk inserts must call this themselves."""
+    _index_trigrams(STUDENT_TRIGRAM_FIELDS, students)
+
+
+def unindex_students(student_ids):
+    SearchTrigram.objects.filter(kind__in=list(STUDENT_TRIGRAM_FIELDS), object_id__in=student_ids).delete()
+
+
+def rebuild_trigram_index(batch_size=2000):
+    """Rebuild every trigram posting. Returns {kind: rows indexed}."""
+    SearchTrigram.objects.all().delete()
+    counts = {}
+    for model, fields in ((Book, BOOK_TRIGRAM_FIELDS), (Student, STUDENT_TRIGRAM_FIELDS)):
+        batch = []
+        for obj in model.objects.only(*fields.values()).iterator(chunk_size=batch_size):
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                _index_trigrams(fields, batch)
+                batch = []
+        _index_trigrams(fields, batch)
+        count = model.objects.count()
+        counts.update({kind: count for kind in fields})
+    return counts
+
+
+# ==========================================================
+# Index maintenance (MySQL FULLTEXT needs none of its own)
+# ==========================================================
+def index_books(books, using='default'):
+    """(Re)index the given Book instances (FTS5 + trigrams). Bulk inserts must call this themselves."""
+    books = list(books)
+    _index_trigrams(BOOK_TRIGRAM_FIELDS, books)
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    rows = [[book.pk] + [getattr(book, field) or '' for field in SEARCH_FIELDS] for book in books]
+    if not rows:
+        return
+    columns = ', '.join(SEARCH_FIELDS)
+    placeholders = ', '.join(['%s'] * (len(SEARCH_FIELDS) + 1))
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [[row[0]] for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES ({placeholders})', rows
+        )
+
+
+def unindex_books(book_ids, using='default'):
+    SearchTrigram.objects.filter(kind__in=list(BOOK_TRIGRAM_FIELDS), object_id__in=book_ids).delete()
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [[pk] for pk in book_ids])
+
+
+def rebuild_book_index(using='default'):
+    """Rebuild the FTS5 table from scratch. Returns the number of books indexed."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return Book.objects.using(using).count()
+    columns = ', '.join(SEARCH_FIELDS)
+    source = ', '.join(f"COALESCE({field}, '')" for field in SEARCH_FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, {columns}) '
+            f'SELECT id, {source} FROM {Book._meta.db_table}'
+        )
+        return cursor.rowcount
+
+
+@receiver(post_save, sender=Book)
+def update_book_search_index(sender, instance, update_fields=None, using='default', **kwargs):
+    # Counter-only saves don't touch the indexed columns
+    if update_fields and not set(update_fields) & set(SEARCH_FIELDS):
+        return
+    index_books([instance], using=using)
+
+
+@receiver(post_delete, sender=Book)
+def remove_book_search_index(sender, instance, using='default', **kwargs):
+    unindex_books([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Student)
+def update_student_search_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields and 'name' not in update_fields:
+        return
+    index_students([instance])
+
+
+@receiver(post_delete, sender=Student)
+def remove_student_search_index(sender, instance, **kwargs):
+    unindex_students([instance.pk])
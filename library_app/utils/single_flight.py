@@ -0,0 +1,67 @@
+"""
+Single-flight caching for expensive aggregates.
+
+When many requests miss the same cache key at once (e.g. every librarian
+opening the dashboard as the morning shift starts), only one of them
+computes the value: the first to take the key's lock with cache.add().
+The others check the cache again after 20 ms, 40 ms, 80 ms ... (at most
+FLIGHT_POLL_MAX apart) and return the value once it lands. A waiter that
+hasn't seen it after FLIGHT_WAIT seconds computes the value itself, so a
+slow or dead lock holder costs each waiter a few cache reads, not a
+worker tied up polling.
+
+The lock and the value live in the default cache, the database cache
+table shared by every worker process (settings.CACHES), so requests are
+coalesced across all Passenger workers.
+"""
+import time
+
+from django.core.cache import cache
+
+__all__ = ['single_flight', 'FLIGHT_WAIT']
+
+# Longest a computation may hold its key's lock (a crashed holder's lock lapses)
+FLIGHT_LOCK_TIMEOUT = 30
+# How long waiters wait for the holder's value before computing it themselves
+FLIGHT_WAIT = 2
+FLIGHT_POLL_FIRST = 0.02
+FLIGHT_POLL_MAX = 0.5
+
+_MISSING = object()
+
+
+def _compute_and_store(key, compute, timeout):
+    value = compute()
+    cache.set(key, value, timeout)
+    return value
+
+
+def single_flight(key, compute, timeout):
+    """
+    The value cached under `key`, or compute() cached for `timeout`
+    seconds. Concurrent misses on the same key share one compute().
+    """
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    lock_key = f'{key}:flight'
+    if cache.add(lock_key, 1, FLIGHT_LOCK_TIMEOUT):
+        try:
+            # The previous holder may have stored it since we looked
+            value = cache.get(key, _MISSING)
+            if value is _MISSING:
+                value = _compute_and_store(key, compute, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    deadline = time.monotonic() + FLIGHT_WAIT
+    pause = FLIGHT_POLL_FIRST
+    while True:
+        time.sleep(min(pause, max(deadline - time.monotonic(), 0)))
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if time.monotonic() >= deadline:
+            return _compute_and_store(key, compute, timeout)
+        pause = min(pause * 2, FLIGHT_POLL_MAX)
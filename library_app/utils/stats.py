@@ -0,0 +1,243 @@
+"""
+Dashboard statistics.
+
+The counts on the superuser and librarian dashboards are StatCounter rows,
+so a dashboard reads all of its figures in one query instead of a COUNT(*)
+per figure. Counters kept per centre (and summed system-wide):
+  books, available_books, students, borrows, active_borrows,
+  pending_requests, teacher_issues, reservations
+and system-wide only:
+  centres, users, grades, subjects
+They are moved in the same transaction as the change they count: by the
+receivers below, by CatalogueRollup.bump (books), by utils.circulation
+(status flips done with UPDATEs) and by the bulk student import.
+
+Overdue loans become overdue with the clock rather than a write, so those are
+still counted, off the (status, due_date) index. `manage.py reconcile_stats`
+recounts everything from the source tables and corrects drift, e.g. from a
+student or teacher moving centre, which the receivers don't follow. It first
+recounts each book's copy counters from its BookCopy rows, which the book
+and catalogue counts are built on.
+"""
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ..models import (
+    Book, BookCopy, Borrow, CatalogueRollup, Centre, CustomUser, Grade, Reservation, StatCounter, Student, Subject,
+    TeacherBookIssue,
+)
+
+__all__ = [
+    'CENTRE_COUNTERS', 'GLOBAL_COUNTERS', 'get_system_stats', 'get_centre_stats',
+    'reconcile_copy_counters', 'reconcile_stats',
+]
+
+CENTRE_COUNTERS = (
+    'books', 'available_books', 'students', 'borrows', 'active_borrows',
+    'pending_requests', 'teacher_issues', 'reservations',
+)
+GLOBAL_COUNTERS = ('centres', 'users', 'grades', 'subjects')
+
+
+def get_system_stats():
+    """
+    (system-wide counters, {centre_id: that centre's counters}) from one read
+    of every counter. Counters never written yet read as 0.
+    """
+    counters = StatCounter.read()
+    totals = dict.fromkeys(CENTRE_COUNTERS + GLOBAL_COUNTERS, 0)
+    totals.update(counters.pop(StatCounter.GLOBAL, {}))
+    per_centre = {
+        centre_id: {**dict.fromkeys(CENTRE_COUNTERS, 0), **values}
+        for centre_id, values in counters.items()
+    }
+    return totals, per_centre
+
+
+def get_centre_stats(centre_id):
+    """One centre's counters, in one read."""
+    return {**dict.fromkeys(CENTRE_COUNTERS, 0), **StatCounter.read(centre_id)[centre_id]}
+
+
+def _recount():
+    """{scope: {name: value}} counted from the source tables."""
+    expected = {StatCounter.GLOBAL: dict.fromkeys(CENTRE_COUNTERS + GLOBAL_COUNTERS, 0)}
+    for centre_id in Centre.objects.values_list('pk', flat=True):
+        expected[centre_id] = dict.fromkeys(CENTRE_COUNTERS, 0)
+
+    def add(rows, centre_field, **names):
+        # names: counter name -> annotation alias
+        for row in rows:
+            for scope in (StatCounter.GLOBAL, row[centre_field]):
+                if scope in expected:
+                    for name, alias in names.items():
+                        expected[scope][name] += row[alias]
+
+    add(
+        Book.objects.values('centre_id').annotate(n=Count('id'), on_shelf=Count('id', filter=Q(copies_available__gt=0))).order_by(),
+        'centre_id', books='n', available_books='on_shelf',
+    )
+    add(Student.objects.values('centre_id').annotate(n=Count('id')).order_by(), 'centre_id', students='n')
+    add(
+        Borrow.objects.values('centre_id').annotate(
+            n=Count('id'),
+            issued=Count('id', filter=Q(status='issued')),
+            requested=Count('id', filter=Q(status='requested')),
+        ).order_by(),
+        'centre_id', borrows='n', active_borrows='issued', pending_requests='requested',
+    )
+    add(
+        TeacherBookIssue.objects.values('teacher__centre_id').annotate(n=Count('id')).order_by(),
+        'teacher__centre_id', teacher_issues='n',
+    )
+    add(Reservation.objects.values('centre_id').annotate(n=Count('id')).order_by(), 'centre_id', reservations='n')
+
+    expected[StatCounter.GLOBAL].update(
+        centres=len(expected) - 1,
+        users=CustomUser.objects.count(),
+        grades=Grade.objects.count(),
+        subjects=Subject.objects.count(),
+    )
+    return expected
+
+
+def _count_copies(book_ids=None):
+    """{book_id: (copies_total, copies_available)} counted from BookCopy."""
+    copies = BookCopy.objects.all()
+    if book_ids is not None:
+        copies = copies.filter(book_id__in=book_ids)
+    return {
+        row['book_id']: (row['total'], row['on_shelf'])
+        for row in copies.values('book_id').annotate(
+            total=Count('id', filter=Q(status__in=BookCopy.IN_CIRCULATION)),
+            on_shelf=Count('id', filter=Q(status='available')),
+        ).order_by()
+    }
+
+
+def reconcile_copy_counters():
+    """
+    Recount every book's copies_total / copies_available from its copies and
+    correct the books that drifted. Their rollup rows may have drifted either
+    way, so the catalogue rollup is then rebuilt (only if anything changed).
+    Returns the corrections as (book_id, (stored), (counted)) tuples.
+    """
+    counted = _count_copies()
+    drifted = [
+        book_id
+        for book_id, total, available in Book.objects.values_list('pk', 'copies_total', 'copies_available').iterator()
+        if counted.get(book_id, (0, 0)) != (total, available)
+    ]
+    corrections = []
+    for book_id in drifted:
+        # Recheck under the book's row lock, which issues and returns take too
+        with transaction.atomic():
+            stored = Book.objects.select_for_update().filter(pk=book_id).values_list(
+                'copies_total', 'copies_available'
+            ).first()
+            if stored is None:
+                continue
+            expected = _count_copies([book_id]).get(book_id, (0, 0))
+            if stored == expected:
+                continue
+            Book.objects.filter(pk=book_id).update(copies_total=expected[0], copies_available=expected[1])
+            corrections.append((book_id, stored, expected))
+    if corrections:
+        CatalogueRollup.rebuild()
+    return corrections
+
+
+def reconcile_stats():
+    """
+    Recount every counter and correct the rows that drifted. Returns the
+    corrections as (scope, name, stored, counted) tuples.
+    """
+    corrections = []
+    with transaction.atomic():
+        # Lock the counters first, so bumps from writes we can't see yet wait
+        # for us and then apply on top of the recount
+        stored = {
+            (scope, name): (pk, value)
+            for pk, scope, name, value in StatCounter.objects.select_for_update().values_list('pk', 'scope', 'name', 'value')
+        }
+        expected = _recount()
+
+        missing = []
+        for scope, values in expected.items():
+            for name, value in values.items():
+                pk, current = stored.pop((scope, name), (None, 0))  # no row reads as 0
+                if current == value:
+                    continue
+                corrections.append((scope, name, current, value))
+                if pk is None:
+                    missing.append(StatCounter(scope=scope, name=name, value=value))
+                else:
+                    StatCounter.objects.filter(pk=pk).update(value=value)
+        StatCounter.objects.bulk_create(missing)
+        # Counters of deleted centres, or names no longer kept
+        StatCounter.objects.filter(pk__in=[pk for pk, _ in stored.values()]).delete()
+    return corrections
+
+
+@receiver(post_save, sender=Borrow)
+def count_borrow(sender, instance, created, **kwargs):
+    if created:
+        StatCounter.bump(instance.centre_id, borrows=1, **StatCounter.borrow_status_deltas(None, instance.status))
+    elif instance.status != instance._persisted_status:
+        StatCounter.bump(
+            instance.centre_id, **StatCounter.borrow_status_deltas(instance._persisted_status, instance.status)
+        )
+
+
+@receiver(post_delete, sender=Borrow)
+def uncount_borrow(sender, instance, **kwargs):
+    status = instance._persisted_status or instance.status
+    StatCounter.bump(instance.centre_id, borrows=-1, **StatCounter.borrow_status_deltas(status, None))
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Reservation)
+@receiver(post_save, sender=TeacherBookIssue)
+def count_centre_record(sender, instance, created, **kwargs):
+    if created:
+        _bump_centre_record(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=Reservation)
+@receiver(post_delete, sender=TeacherBookIssue)
+def uncount_centre_record(sender, instance, **kwargs):
+    _bump_centre_record(sender, instance, -1)
+
+
+def _bump_centre_record(model, instance, delta):
+    if model is TeacherBookIssue:
+        centre_id = CustomUser.objects.filter(pk=instance.teacher_id).values_list('centre_id', flat=True).first()
+        StatCounter.bump(centre_id, teacher_issues=delta)
+    else:
+        name = 'students' if model is Student else 'reservations'
+        StatCounter.bump(instance.centre_id, **{name: delta})
+
+
+@receiver(post_save, sender=Centre)
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=Grade)
+@receiver(post_save, sender=Subject)
+def count_global_record(sender, instance, created, **kwargs):
+    if created:
+        StatCounter.bump(None, **{_GLOBAL_NAMES[sender]: 1})
+
+
+@receiver(post_delete, sender=Centre)
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_delete, sender=Grade)
+@receiver(post_delete, sender=Subject)
+def uncount_global_record(sender, instance, **kwargs):
+    StatCounter.bump(None, **{_GLOBAL_NAMES[sender]: -1})
+    if sender is Centre:
+        StatCounter.objects.filter(scope=instance.pk).delete()
+
+
+_GLOBAL_NAMES = {Centre: 'centres', CustomUser: 'users', Grade: 'grades', Subject: 'subjects'}
@@ -0,0 +1,179 @@
+"""
+Student roster import, shared by the bulk upload view and its background job.
+
+Rows are validated in memory: child_IDs already taken are found with one
+query per table instead of an exists() per row. Each new student's initial
+password (their child_ID) is hashed in a process pool, since PBKDF2 is the
+slow part of enrolling a school. Logins and students then go in with
+batched bulk_create. bulk_create skips post_save, so the login that
+create_student_user would make is built here, and the search index,
+autocomplete and dashboard counters are updated explicitly.
+"""
+import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import openpyxl
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from ..models import CustomUser, StatCounter, Student
+from .autocomplete import refresh_autocomplete
+from .search import index_students
+
+__all__ = ['read_student_rows', 'import_students', 'hash_passwords']
+
+IMPORT_BATCH_SIZE = 500
+# Below this many passwords, starting worker processes costs more than it saves
+PARALLEL_HASH_MIN = 64
+
+
+def read_student_rows(name, data):
+    """Rows of a .csv or .xlsx roster (bytes) as dicts keyed by the header row."""
+    if name.lower().endswith('.csv'):
+        return list(csv.DictReader(io.StringIO(data.decode('utf-8-sig'))))
+    wb = openpyxl.load_workbook(io.BytesIO(data), read_only=True)
+    sheet = wb.active
+    rows = sheet.iter_rows(values_only=True)
+    headers = next(rows, None) or []
+    # Formatted-but-empty rows at the bottom of a sheet come back as all None
+    return [dict(zip(headers, row)) for row in rows if any(value not in (None, '') for value in row)]
+
+
+def hash_passwords(passwords, progress=None):
+    """
+    make_password() for each of `passwords`, in order, spread over
+    settings.PASSWORD_HASH_WORKERS processes (default: one per CPU).
+    Small batches, or hosts that can't start worker processes, hash in-process.
+    """
+    passwords = list(passwords)
+    workers = getattr(settings, 'PASSWORD_HASH_WORKERS', None) or os.cpu_count() or 1
+    hashes = []
+    if workers > 1 and len(passwords) >= PARALLEL_HASH_MIN:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunksize = max(1, len(passwords) // (workers * 4))
+                for encoded in pool.map(make_password, passwords, chunksize=chunksize):
+                    hashes.append(encoded)
+                    if progress and len(hashes) % 50 == 0:
+                        progress(len(hashes))
+            return hashes
+        except (OSError, NotImplementedError, BrokenProcessPool) as e:
+            print(f"Parallel password hashing unavailable, hashing in-process: {e}")
+            hashes = []
+
+    for password in passwords:
+        hashes.append(make_password(password))
+        if progress and len(hashes) % 50 == 0:
+            progress(len(hashes))
+    return hashes
+
+
+def _taken_ids(child_IDs):
+    """child_IDs that already belong to a student, or to any login."""
+    taken = set(Student.objects.filter(child_ID__in=child_IDs).values_list('child_ID', flat=True))
+    taken.update(CustomUser.objects.filter(login_id__in=child_IDs).values_list('login_id', flat=True))
+    return taken
+
+
+def _bulk_create(model, objects, key, batch_size):
+    """
+    bulk_create `objects` in batches. Backends without INSERT ... RETURNING
+    (MySQL) get their pks back through the unique `key`.
+    """
+    for start in range(0, len(objects), batch_size):
+        batch = objects[start:start + batch_size]
+        model.objects.bulk_create(batch)
+        if batch[0].pk is None:
+            pks = dict(
+                model.objects.filter(**{f'{key}__in': [getattr(obj, key) for obj in batch]})
+                .values_list(key, 'pk')
+            )
+            for obj in batch:
+                obj.pk = pks[getattr(obj, key)]
+                obj._state.adding = False
+
+
+def import_students(rows, centre, school, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """
+    Create a Student and its login for every valid row. The login ID and
+    initial password are the child_ID, and the password must be changed on
+    first login. Returns (created_count, errors), errors being "Row N: reason"
+    strings. `progress(done, total=None)` is told how many students are ready.
+    """
+    errors = []
+    parsed = []
+    for idx, row in enumerate(rows, start=2):
+        first_name = str(row.get('first_name', '')).strip()
+        last_name = str(row.get('last_name', '') or '').strip()
+        child_ID = str(row.get('child_ID', '')).strip()
+        grade = str(row.get('grade', '') or '').strip()
+        parsed.append((idx, first_name, last_name, child_ID, grade))
+
+    taken = _taken_ids([child_ID for _, _, _, child_ID, _ in parsed if child_ID])
+    pending = []
+    for idx, first_name, last_name, child_ID, grade in parsed:
+        if not all([first_name, child_ID]):
+            errors.append(f"Row {idx}: first_name and child_ID required")
+            continue
+
+        if child_ID in taken:
+            errors.append(f"Row {idx}: child_ID {child_ID} already exists")
+            continue
+
+        if grade and grade not in dict(Student.GRADE_CHOICES):
+            errors.append(f"Row {idx}: Invalid grade '{grade}'")
+            continue
+
+        name = f"{first_name} {last_name}".strip()
+        try:
+            Student._meta.get_field('child_ID').clean(child_ID, None)
+            Student._meta.get_field('name').clean(name, None)
+        except ValidationError as e:
+            errors.append(f"Row {idx}: {'; '.join(e.messages)}")
+            continue
+
+        taken.add(child_ID)  # a repeat further down the file is a duplicate too
+        pending.append((first_name, last_name, child_ID, name, grade or None))
+
+    if not pending:
+        return 0, errors
+    if progress:
+        progress(0, len(pending))
+
+    passwords = hash_passwords([child_ID for _, _, child_ID, _, _ in pending], progress)
+
+    with transaction.atomic():
+        # The fields create_student_user and CustomUser.save() would set
+        users = [
+            CustomUser(
+                login_id=child_ID,
+                password=password,
+                first_name=first_name,
+                last_name=last_name,
+                centre=centre,
+                is_student=True,
+                is_other=False,
+                force_password_change=True,
+            )
+            for (first_name, last_name, child_ID, _, _), password in zip(pending, passwords)
+        ]
+        _bulk_create(CustomUser, users, 'login_id', batch_size)
+
+        students = [
+            Student(child_ID=child_ID, name=name, centre=centre, school=school, grade=grade, user=user)
+            for (_, _, child_ID, name, grade), user in zip(pending, users)
+        ]
+        _bulk_create(Student, students, 'child_ID', batch_size)
+        index_students(students)
+        StatCounter.bump(centre.pk, students=len(students))
+        StatCounter.bump(None, users=len(users))
+
+    refresh_autocomplete('student', students)
+    if progress:
+        progress(len(students))
+    return len(students), errors
@@ -0,0 +1,119 @@
+"""
+Circulation trend series for the dashboard charts.
+
+Charts sum CirculationDay rows (one per centre per day) instead of
+scanning Borrow: a year of one centre's history is at most 366 rows.
+The facts are appended as circulation happens:
+  requests, and issues/returns made by Borrow.save(): the receiver below
+  issues/returns made with UPDATEs:                   utils.circulation
+  loans falling overdue:                              the overdue sweep
+`manage.py backfill_circulation` rebuilds them from Borrow for any range
+(e.g. after first deploying this, or to fold in deleted borrows).
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from ..models import Borrow, CirculationDay
+
+__all__ = ['circulation_trend', 'trend_range', 'default_period', 'TREND_RANGES', 'TREND_PERIODS']
+
+TREND_RANGES = ('6m', '12m', 'term', 'year')
+TREND_PERIODS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+# Where school terms open, as MM-DD (settings.SCHOOL_TERM_STARTS)
+DEFAULT_TERM_STARTS = ('01-06', '04-28', '08-25')
+
+
+def _month_start(day, months_back=0):
+    month = day.year * 12 + day.month - 1 - months_back
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def _term_start(today):
+    starts = sorted(
+        date(today.year, *map(int, mm_dd.split('-')))
+        for mm_dd in getattr(settings, 'SCHOOL_TERM_STARTS', DEFAULT_TERM_STARTS)
+    )
+    opened = [start for start in starts if start <= today]
+    if opened:
+        return opened[-1]
+    return starts[-1].replace(year=today.year - 1)  # still in last year's final term
+
+
+def trend_range(name, today=None):
+    """(start, end) dates of a named range: the last 6 or 12 months, this term or this year."""
+    today = today or timezone.localdate()
+    if name == '12m':
+        return _month_start(today, 11), today
+    if name == 'term':
+        return _term_start(today), today
+    if name == 'year':
+        return date(today.year, 1, 1), today
+    return _month_start(today, 5), today
+
+
+def default_period(start, end):
+    """A bucket size that keeps a chart between a handful and ~60 points."""
+    days = (end - start).days
+    if days <= 62:
+        return 'day'
+    if days <= 186:
+        return 'week'
+    return 'month'
+
+
+def _buckets(start, end, period):
+    """(bucket start, label) for every bucket from `start` to `end`."""
+    if period == 'month':
+        current = _month_start(start)
+        while current <= end:
+            yield current, current.strftime('%b %Y')
+            current = _month_start(current + timedelta(days=31))
+        return
+    step = timedelta(days=7 if period == 'week' else 1)
+    current = start - timedelta(days=start.weekday()) if period == 'week' else start
+    while current <= end:
+        yield current, current.strftime('%d %b')
+        current += step
+
+
+def circulation_trend(start, end, centre=None, period='month'):
+    """
+    Requests, issues, returns and overdues per day, week or month from
+    `start` to `end` (inclusive dates), empty buckets included. `centre`
+    narrows it to one centre. Returns
+    {'labels': [...], 'requests': [...], 'issues': [...], 'returns': [...], 'overdues': [...]}.
+    """
+    rows = CirculationDay.objects.filter(day__range=(start, end))
+    if centre is not None:
+        rows = rows.filter(centre=centre)
+    sums = {
+        row['bucket']: row
+        for row in rows.annotate(bucket=TREND_PERIODS[period]('day'))
+        .values('bucket')
+        .annotate(**{f'n_{fact}': Sum(fact) for fact in CirculationDay.FACTS})
+        .order_by()
+    }
+    trend = {'labels': [], **{fact: [] for fact in CirculationDay.FACTS}}
+    for bucket, label in _buckets(start, end, period):
+        row = sums.get(bucket, {})
+        trend['labels'].append(label)
+        for fact in CirculationDay.FACTS:
+            trend[fact].append(row.get(f'n_{fact}') or 0)
+    return trend
+
+
+@receiver(post_save, sender=Borrow)
+def record_circulation(sender, instance, created, **kwargs):
+    if created:
+        CirculationDay.bump(instance.centre_id, instance.request_date, requests=1)
+    if created or instance.status != instance._persisted_status:
+        if instance.status == 'issued':
+            CirculationDay.bump(instance.centre_id, instance.issue_date or timezone.now(), issues=1)
+        elif instance.status == 'returned':
+            CirculationDay.bump(instance.centre_id, instance.return_date or timezone.now(), returns=1)
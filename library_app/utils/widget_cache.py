@@ -0,0 +1,102 @@
+"""
+Response cache for the dashboard widgets (charts and rankings), which the
+dashboard page fetches as JSON after it has rendered, and for the other
+aggregates the dashboard and catalogue pages show (overdue and catalogue
+counts).
+
+A widget's payload is cached per (widget, role, centre): the superuser
+view covers every centre, a librarian's covers their own. Misses are
+computed once however many requests share them (utils.single_flight).
+Keys carry version stamps kept in the cache (one per centre, one for the
+system-wide view and one epoch for everything), so a change bumps the
+stamps it affects once its transaction commits and the next request
+recomputes:
+  borrows and books (receivers below, utils.circulation): their centre
+      and the system-wide view
+  centres, schools, categories, subjects (names and counts): the epoch
+Entries also expire after WIDGET_CACHE_TTL seconds, which bounds staleness
+from writes that send no signal.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ..models import Book, Borrow, Category, Centre, School, Subject
+from .single_flight import single_flight
+
+__all__ = ['cached_widget', 'cached_counts', 'invalidate_widgets', 'WIDGET_CACHE_TTL']
+
+WIDGET_CACHE_TTL = 60
+EPOCH = 'epoch'
+ALL_CENTRES = 'all'
+
+
+def _stamp_key(scope):
+    return f'dashboard:version:{scope}'
+
+
+def _stamps(scope):
+    keys = [_stamp_key(EPOCH), _stamp_key(scope)]
+    stamps = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in stamps}
+    if missing:
+        cache.set_many(missing, None)
+        stamps.update(missing)
+    return '.'.join(str(stamps[key]) for key in keys)
+
+
+def cached_widget(name, role, centre_id, build):
+    """
+    The payload of widget `name` for a role ('admin' or 'librarian') and
+    centre (None for the system-wide view), from the cache or from build().
+    """
+    scope = centre_id or ALL_CENTRES
+    key = f'dashboard:widget:{name}:{role}:{scope}:{_stamps(scope)}'
+    return single_flight(key, build, WIDGET_CACHE_TTL)
+
+
+def cached_counts(name, centre_id, build):
+    """
+    Counts `name` of one centre (None for every centre), from the cache or
+    from build(); expired with the dashboard widgets of that centre.
+    """
+    scope = centre_id or ALL_CENTRES
+    return single_flight(f'counts:{name}:{scope}:{_stamps(scope)}', build, WIDGET_CACHE_TTL)
+
+
+def _bump(scope):
+    try:
+        cache.incr(_stamp_key(scope))
+    except ValueError:
+        cache.set(_stamp_key(scope), time.time_ns(), None)
+
+
+def invalidate_widgets(centre_id=None, everything=False):
+    """
+    Expire the cached widgets of a centre (if any) and of the system-wide
+    view; with everything=True, every cached widget.
+    """
+    if everything:
+        _bump(EPOCH)
+        return
+    if centre_id:
+        _bump(centre_id)
+    _bump(ALL_CENTRES)
+
+
+@receiver([post_save, post_delete], sender=Borrow)
+@receiver([post_save, post_delete], sender=Book)
+def circulation_changed(sender, instance, **kwargs):
+    centre_id = instance.centre_id
+    transaction.on_commit(lambda: invalidate_widgets(centre_id))
+
+
+@receiver([post_save, post_delete], sender=Centre)
+@receiver([post_save, post_delete], sender=School)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Subject)
+def reference_data_changed(sender, **kwargs):
+    transaction.on_commit(lambda: invalidate_widgets(everything=True))
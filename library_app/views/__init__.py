@@ -5,3 +5,5 @@ from .borrow_views import *
 from .teacher_issues import *
 from .notifications_views import *
 from .catalogue_views import *
+from .autocomplete_views import *
+from .job_views import *
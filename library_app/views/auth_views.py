@@ -6,6 +6,8 @@ from django.contrib.auth.models import Group, Permission
 from django.db import transaction, IntegrityError
 from django.db.models import Q, Count
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
 from django.core.mail import send_mail
 from django.conf import settings
 from django.utils import timezone
@@ -17,30 +19,29 @@ from django.template.loader import render_to_string
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.sites.shortcuts import get_current_site
 from django.urls import reverse
-from ..utils import send_custom_email
+from ..utils import (
+    send_custom_email, get_centres, get_centre, get_centre_stats, get_system_stats,
+    circulation_trend, trend_range, default_period, TREND_RANGES, TREND_PERIODS,
+    top_books, top_centres, RANKING_WINDOWS, cached_widget, cached_counts,
+)
 
 
 from io import TextIOWrapper
-from datetime import timedelta
-from collections import defaultdict
+from datetime import date
+from types import SimpleNamespace
 import csv
 import openpyxl
 import random
-import json
 
-# UPDATED IMPORTS to include Grade and Subject
 from ..models import (
     Book,
     Centre,
     CustomUser,
     School,
-    Student,
     Borrow,
     Reservation,
     Notification,
     TeacherBookIssue,
-    Grade,
-    Subject
 )
 
 
@@ -121,38 +122,30 @@ def dashboard(request):
     # 1. Super-user (admin) – system-wide stats
     # ------------------------------------------------------------------
     if user.is_superuser:
-        # Centre stats: count TeacherBookIssue via teacher__centre
-        centre_stats = Centre.objects.annotate(
-            book_count=Count('books', distinct=True),
-            student_count=Count('student', distinct=True),
-            borrow_count=Count('borrows', distinct=True),
-            issue_count=Count(
-                'customuser__books_issued_to_students',
-                filter=Q(customuser__is_teacher=True),
-                distinct=True
-            )
-        ).order_by('-borrow_count')[:5]
+        # Every count but overdue comes from the maintained counters (utils.stats)
+        totals, per_centre = get_system_stats()
+        centre_stats = _centre_rows(per_centre)[:5]
 
         context.update({
-            'total_books': Book.objects.count(),
-            'total_centres': Centre.objects.count(),
-            'total_users': CustomUser.objects.count(),
-            'total_students': Student.objects.count(),
-            'total_borrows': Borrow.objects.count(),
-            'total_teacher_issues': TeacherBookIssue.objects.count(),
-            'total_reservations': Reservation.objects.count(),
+            'total_books': totals['books'],
+            'total_centres': totals['centres'],
+            'total_users': totals['users'],
+            'total_students': totals['students'],
+            'total_borrows': totals['borrows'],
+            'total_teacher_issues': totals['teacher_issues'],
+            'total_reservations': totals['reservations'],
             # NEW STATS for Grade/Subject
-            'total_grades': Grade.objects.count(),
-            'total_subjects': Subject.objects.count(),
+            'total_grades': totals['grades'],
+            'total_subjects': totals['subjects'],
 
             # Borrow stats (only from Borrow)
-            'active_borrows': Borrow.objects.filter(status='issued').count(),
-            'overdue_borrows': Borrow.objects.filter(
-                status='issued',
-                due_date__lt=timezone.now()
-            ).count(),
-            'pending_requests': Borrow.objects.filter(status='requested').count(),
-            'available_books': Book.objects.filter(available_copies=True).count(),
+            'active_borrows': totals['active_borrows'],
+            'overdue_borrows': cached_counts(
+                'overdue', None,
+                lambda: Borrow.objects.filter(status='issued', due_date__lt=timezone.now()).count(),
+            ),
+            'pending_requests': totals['pending_requests'],
+            'available_books': totals['available_books'],
 
             # Recent activity
             'recent_borrows': Borrow.objects.select_related('user', 'book', 'centre')
@@ -162,50 +155,31 @@ def dashboard(request):
             'centre_stats': centre_stats,
         })
 
-        # Charts
-        monthly_data = get_monthly_borrow_trends()
-        context.update({
-            'monthly_labels': json.dumps(monthly_data['labels']),
-            'monthly_data': json.dumps(monthly_data['data']),
-        })
-
-        category_data = get_category_distribution()
-        context.update({
-            'category_labels': json.dumps(category_data['labels']),
-            'category_data': json.dumps(category_data['data']),
-        })
-
-        centre_performance = get_centre_performance()
-        context.update({
-            'centre_labels': json.dumps(centre_performance['labels']),
-            'centre_data': json.dumps(centre_performance['borrows']),
-        })
-
-        context['top_borrowed_books'] = get_top_borrowed_books()
+        # Charts and rankings are fetched by the page (dashboard_widget)
 
     # ------------------------------------------------------------------
     # 2. Librarian – centre-specific view
     # ------------------------------------------------------------------
     elif user.is_librarian and user.centre:
         centre = user.centre
+        stats = get_centre_stats(centre.pk)
 
         context.update({
             'centre': centre,
-            'total_books': Book.objects.filter(centre=centre).count(),
-            'total_students': Student.objects.filter(centre=centre).count(),
-            'total_borrows': Borrow.objects.filter(centre=centre).count(),
-            'total_teacher_issues': TeacherBookIssue.objects.filter(
-                teacher__centre=centre
-            ).count(),
-            'total_reservations': Reservation.objects.filter(centre=centre).count(),
+            'total_books': stats['books'],
+            'total_students': stats['students'],
+            'total_borrows': stats['borrows'],
+            'total_teacher_issues': stats['teacher_issues'],
+            'total_reservations': stats['reservations'],
 
             # Borrow-specific
-            'active_borrows': Borrow.objects.filter(centre=centre, status='issued').count(),
-            'overdue_borrows': Borrow.objects.filter(
-                centre=centre, status='issued', due_date__lt=timezone.now()
-            ).count(),
-            'pending_requests': Borrow.objects.filter(centre=centre, status='requested').count(),
-            'available_books': Book.objects.filter(centre=centre, available_copies=True).count(),
+            'active_borrows': stats['active_borrows'],
+            'overdue_borrows': cached_counts(
+                'overdue', centre.pk,
+                lambda: Borrow.objects.filter(centre=centre, status='issued', due_date__lt=timezone.now()).count(),
+            ),
+            'pending_requests': stats['pending_requests'],
+            'available_books': stats['available_books'],
 
             # Action lists
             'recent_borrows': Borrow.objects.filter(centre=centre)
@@ -220,18 +194,7 @@ def dashboard(request):
             ).select_related('user', 'book').order_by('-request_date')[:5],
         })
 
-        # Centre charts
-        monthly_data = get_monthly_borrow_trends(centre=centre)
-        context.update({
-            'monthly_labels': json.dumps(monthly_data['labels']),
-            'monthly_data': json.dumps(monthly_data['data']),
-        })
-
-        category_data = get_category_distribution(centre=centre)
-        context.update({
-            'category_labels': json.dumps(category_data['labels']),
-            'category_data': json.dumps(category_data['data']),
-        })
+        # Centre charts are fetched by the page (dashboard_widget)
 
     # ------------------------------------------------------------------
     # 3. Teacher – own borrows + student issues
@@ -360,13 +323,33 @@ def get_category_distribution(centre=None):
     }
 
 
-def get_centre_performance():
+def _centre_rows(per_centre):
+    """
+    Centres with their counters as attributes (book_count, student_count,
+    borrow_count, issue_count), most borrows first
+    """
+    rows = []
+    for centre in get_centres():
+        stats = per_centre.get(centre.pk, {})
+        rows.append(SimpleNamespace(
+            pk=centre.pk,
+            name=centre.name,
+            book_count=stats.get('books', 0),
+            student_count=stats.get('students', 0),
+            borrow_count=stats.get('borrows', 0),
+            issue_count=stats.get('teacher_issues', 0),
+        ))
+    rows.sort(key=lambda row: -row.borrow_count)  # stable: ties stay by name
+    return rows
+
+
+def get_centre_performance(per_centre=None):
     """
     Top centres by number of borrows
     """
-    centres = Centre.objects.annotate(
-        borrow_count=Count('borrows')
-    ).order_by('-borrow_count')[:10]
+    if per_centre is None:
+        per_centre = get_system_stats()[1]
+    centres = _centre_rows(per_centre)[:10]
 
     return {
         'labels': [c.name for c in centres],
@@ -376,43 +359,140 @@ def get_centre_performance():
 
 def get_top_borrowed_books(limit=10):
     """
-    Top borrowed books (with title, author, subject info)
+    Top borrowed books (with title, author, subject info), from the
+    maintained issue counters (see utils.rankings)
     """
-    return Book.objects.filter(is_active=True)\
-        .annotate(borrow_count=Count('borrows'))\
-        .filter(borrow_count__gt=0)\
-        .select_related('subject', 'subject__category', 'subject__grade')\
-        .order_by('-borrow_count')[:limit]
+    return top_books('all', limit=limit)
 
 
-def get_monthly_borrow_trends(centre=None):
+@login_required
+@require_GET
+def leaderboard_data(request):
     """
-    Monthly borrow trends for last 6 months
+    "Most borrowed" rankings: ?kind=books|centres, ?window=all|30d|90d|365d,
+    ?limit (up to 50). Books can be narrowed with ?centre, ?school and
+    ?grade; librarians only see their own centre's books.
     """
-    from collections import defaultdict
-    now = timezone.now()
-    six_months_ago = now - timedelta(days=180)
-    
-    borrows = Borrow.objects.filter(request_date__gte=six_months_ago)
-    if centre:
-        borrows = borrows.filter(centre=centre)
-    
-    monthly_counts = defaultdict(int)
-    for b in borrows:
-        key = b.request_date.strftime('%Y-%m')
-        monthly_counts[key] += 1
-    
-    labels = []
-    data = []
-    current = now.replace(day=1)
-    for i in range(5, -1, -1):
-        month_date = (current - timedelta(days=30 * i))
-        key = month_date.strftime('%Y-%m')
-        label = month_date.strftime('%b %Y')
-        labels.append(label)
-        data.append(monthly_counts.get(key, 0))
-    
-    return {'labels': labels, 'data': data}
+    user = request.user
+    if not (user.is_superuser or (user.is_librarian and user.centre_id)):
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    window = request.GET.get('window', 'all')
+    kind = request.GET.get('kind', 'books')
+    if window not in RANKING_WINDOWS or kind not in ('books', 'centres'):
+        return JsonResponse({'error': 'Unknown window or kind'}, status=400)
+    try:
+        limit = min(int(request.GET.get('limit', 10)), 50)
+        scope = {
+            name: int(request.GET[name]) if request.GET.get(name) else None
+            for name in ('centre', 'school', 'grade')
+        }
+    except ValueError:
+        return JsonResponse({'error': 'limit, centre, school and grade must be numbers'}, status=400)
+
+    if kind == 'centres':
+        if not user.is_superuser:
+            return JsonResponse({'error': 'Unauthorized'}, status=403)
+        results = [
+            {'id': centre.pk, 'name': centre.name, 'issues': issues}
+            for centre, issues in top_centres(window, limit=limit)
+        ]
+    else:
+        if not user.is_superuser:
+            scope['centre'] = user.centre_id
+        results = [
+            {'id': book.pk, 'title': book.title, 'author': book.author, 'issues': book.borrow_count}
+            for book in top_books(window, limit=limit, **scope)
+        ]
+    return JsonResponse({'kind': kind, 'window': window, 'results': results})
+
+
+def _top_books_widget(centre_id):
+    if centre_id is None:
+        books = get_top_borrowed_books()
+    else:
+        books = top_books('all', centre=centre_id)
+    return [
+        {'id': book.pk, 'title': book.title, 'author': book.author, 'borrow_count': book.borrow_count}
+        for book in books
+    ]
+
+
+# name -> (builder taking the centre id or None, superuser only)
+DASHBOARD_WIDGETS = {
+    'trend': (lambda centre_id: circulation_trend(*trend_range('6m'), centre=centre_id, period='month'), False),
+    'categories': (lambda centre_id: get_category_distribution(centre=centre_id), False),
+    'top_books': (_top_books_widget, False),
+    'centres': (lambda centre_id: get_centre_performance(), True),
+}
+
+
+@login_required
+@require_GET
+def dashboard_widget(request, widget):
+    """
+    One dashboard widget's data as JSON, so the page renders at once and
+    fetches its charts in parallel. Cached per role and centre (see
+    utils.widget_cache).
+    """
+    user = request.user
+    if user.is_superuser:
+        role, centre_id = 'admin', None
+    elif user.is_librarian and user.centre_id:
+        role, centre_id = 'librarian', user.centre_id
+    else:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    if widget not in DASHBOARD_WIDGETS:
+        return JsonResponse({'error': 'Unknown widget'}, status=404)
+    build, superuser_only = DASHBOARD_WIDGETS[widget]
+    if superuser_only and role != 'admin':
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    data = cached_widget(widget, role, centre_id, lambda: build(centre_id))
+    response = JsonResponse({'widget': widget, 'data': data})
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required
+@require_GET
+def circulation_trend_data(request):
+    """
+    Trend chart data for any range: ?range=6m|12m|term|year, or
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD; optional ?period=day|week|month.
+    Superusers see every centre (or ?centre=id); librarians their own.
+    """
+    user = request.user
+    if user.is_superuser:
+        centre = None
+        if request.GET.get('centre'):
+            centre = get_centre(request.GET['centre'])
+            if centre is None:
+                return JsonResponse({'error': 'Unknown centre'}, status=404)
+    elif user.is_librarian and user.centre_id:
+        centre = user.centre_id
+    else:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+
+    if request.GET.get('start') or request.GET.get('end'):
+        try:
+            start = date.fromisoformat(request.GET.get('start', ''))
+            end = date.fromisoformat(request.GET.get('end', ''))
+        except ValueError:
+            return JsonResponse({'error': 'start and end must be YYYY-MM-DD dates'}, status=400)
+        if start > end or (end - start).days > 3660:
+            return JsonResponse({'error': 'Choose a range of up to ten years'}, status=400)
+    else:
+        range_name = request.GET.get('range', '6m')
+        if range_name not in TREND_RANGES:
+            return JsonResponse({'error': 'Unknown range'}, status=400)
+        start, end = trend_range(range_name)
+
+    period = request.GET.get('period') or default_period(start, end)
+    if period not in TREND_PERIODS:
+        return JsonResponse({'error': 'Unknown period'}, status=400)
+    if period == 'day' and (end - start).days > 366:
+        period = 'week'
+    trend = circulation_trend(start, end, centre=centre, period=period)
+    return JsonResponse({'start': start.isoformat(), 'end': end.isoformat(), 'period': period, **trend})
 
 @login_required
 def profile(request):
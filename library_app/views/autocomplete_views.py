@@ -0,0 +1,130 @@
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, Http404
+from django.views.decorators.http import require_GET
+
+from ..models import Book, Student, Catalogue
+from ..utils.autocomplete import autocomplete_ids
+
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+# Extra candidates fetched from the index to survive the DB-side filters;
+# the batch doubles until enough survive, up to AUTOCOMPLETE_MAX_CANDIDATES
+AUTOCOMPLETE_OVERSAMPLE = 5
+AUTOCOMPLETE_MAX_CANDIDATES = 5000
+
+
+def is_centre_bound(user):
+    """Librarians (but not admins) only ever search their own centre."""
+    return user.is_librarian and not (user.is_superuser or user.is_site_admin)
+
+
+def autocomplete_scope(user, requested_centre_id):
+    """Librarians only ever see their own centre; admins may pick one or search all."""
+    if is_centre_bound(user):
+        return user.centre_id
+    try:
+        return int(requested_centre_id) if requested_centre_id else None
+    except ValueError:
+        return None
+
+
+def book_choices(ids, centre_id=None, only=''):
+    books = Book.objects.filter(id__in=ids)
+    if only == 'available':
+        books = books.filter(is_active=True, copies_available__gt=0)
+    elif only == 'uncatalogued':
+        catalogued = Catalogue.objects.all()
+        if centre_id is not None:
+            catalogued = catalogued.filter(centre_id=centre_id)
+        books = books.filter(is_active=True).exclude(id__in=catalogued.values('book_id'))
+    rows = books.values(
+        'id', 'title', 'author', 'isbn', 'book_id', 'book_code',
+        'subject__category__name', 'centre__name',
+    )
+    return {
+        row['id']: {
+            'id': row['id'],
+            'label': f"{row['title']} ({row['book_id']}) - {row['centre__name'] or 'No Centre'}",
+            'title': row['title'],
+            'author': row['author'],
+            'isbn': row['isbn'],
+            'book_id': row['book_id'],
+            'book_code': row['book_code'],
+            'category': row['subject__category__name'],
+        }
+        for row in rows
+    }
+
+
+def student_choices(ids, centre_id=None, only=''):
+    students = Student.objects.filter(id__in=ids)
+    if only == 'has_account':
+        students = students.filter(user__isnull=False)
+    rows = students.values('id', 'name', 'child_ID', 'user__email', 'centre__name')
+    return {
+        row['id']: {
+            'id': row['id'],
+            'label': f"{row['name']} ({row['child_ID']}) - {row['centre__name'] or 'No Centre'}",
+            'name': row['name'],
+            'child_ID': row['child_ID'],
+            'email': row['user__email'],
+        }
+        for row in rows
+    }
+
+
+AUTOCOMPLETE_KINDS = {
+    'book': book_choices,
+    'student': student_choices,
+}
+
+
+def autocomplete_results(kind, query, centre_id=None, only='', limit=AUTOCOMPLETE_LIMIT):
+    """
+    Top `limit` matches from the in-memory index, confirmed and filtered
+    against the DB. When too few of a batch of candidates pass the filters
+    (e.g. every early match is on loan), the next, twice as large batch is
+    checked, until `limit` pass or the index has no more matches.
+    """
+    choices = {}
+    checked = 0
+    batch = limit * AUTOCOMPLETE_OVERSAMPLE
+    while True:
+        ids = autocomplete_ids(kind, query, centre_id=centre_id, limit=checked + batch)
+        if ids[checked:]:
+            choices.update(AUTOCOMPLETE_KINDS[kind](ids[checked:], centre_id=centre_id, only=only))
+        if len(choices) >= limit or len(ids) < checked + batch or len(ids) >= AUTOCOMPLETE_MAX_CANDIDATES:
+            return [choices[pk] for pk in ids if pk in choices][:limit]
+        checked = len(ids)
+        batch *= 2
+
+
+@login_required
+@require_GET
+def autocomplete(request, kind):
+    """
+    JSON prefix lookup for the book and student pickers.
+    GET params: q, centre_id (admins only), only (available | uncatalogued | has_account), limit.
+    """
+    if kind not in AUTOCOMPLETE_KINDS:
+        raise Http404("Unknown autocomplete source")
+    if not (request.user.is_superuser or request.user.is_librarian or request.user.is_site_admin):
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'results': []})
+
+    try:
+        limit = min(int(request.GET.get('limit', AUTOCOMPLETE_LIMIT)), AUTOCOMPLETE_MAX_LIMIT)
+    except ValueError:
+        limit = AUTOCOMPLETE_LIMIT
+
+    if is_centre_bound(request.user) and not request.user.centre_id:
+        return JsonResponse({'results': []})  # not assigned to a centre yet: nothing to search
+
+    centre_id = autocomplete_scope(request.user, request.GET.get('centre_id'))
+    results = autocomplete_results(
+        kind, query, centre_id=centre_id, only=request.GET.get('only', ''), limit=max(limit, 1)
+    )
+    return JsonResponse({'results': results})
@@ -4,30 +4,63 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
-from django.db.models import Q, Count
+from django.db.models import Q, Count, Sum
 from django.http import (
-    HttpResponse, JsonResponse, HttpResponseBadRequest
+    HttpResponse, JsonResponse, HttpResponseBadRequest, Http404
 )
 from django.utils import timezone
-from django.views.decorators.http import require_GET, require_http_methods
+from django.views.decorators.http import require_GET, require_http_methods, etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.vary import vary_on_cookie
 from django.template.loader import render_to_string
 from django.core.paginator import Paginator
 from django.core.exceptions import ValidationError
 import csv
-import openpyxl
-import re
-from io import TextIOWrapper
 from datetime import timedelta, datetime
 from datetime import timedelta, datetime
 
 from ..models import (
     Book, Centre, School, Category, Grade, Subject,
-    Borrow, Reservation, Notification, CustomUser
+    Borrow, Reservation, CustomUser, CatalogueRollup,
+    BookCodeSequence, book_code_prefix,
 )
+from ..utils.search import search_books
+from ..utils.pagination import paginate, count_cache_key
+from ..utils.book_import import parse_copy_count
+from ..utils.exports import filter_grade_books, write_grade_books_xlsx, XLSX_CONTENT_TYPE
+from ..utils.jobs import enqueue_job
+from ..utils.notifications import notify
+from ..utils.holds import fulfil_hold, hold_status
+from ..utils.circulation import issue_borrow, CirculationError
+from ..utils.widget_cache import cached_counts
+from ..utils.refdata import (
+    get_centre, get_centres, get_schools, get_grades, get_categories, get_subjects,
+    get_refdata_version, book_form_tree,
+)
+from .job_views import get_user_job
 
 # Permission helper
 def is_staff_user(user):
     return user.is_superuser or user.is_librarian or user.is_site_admin
+
+
+# Catalogue counts, cached per centre and computed once per cache miss (utils.widget_cache)
+def _centre_counts():
+    """({centre_id: titles}, {centre_id: schools}) across every centre."""
+    return cached_counts('centres', None, lambda: (
+        dict(CatalogueRollup.objects.values_list('centre_id').annotate(n=Sum('book_count')).order_by()),
+        dict(School.objects.values_list('centre_id').annotate(n=Count('id')).order_by()),
+    ))
+
+
+def _school_book_counts(centre_id):
+    """{school_id: titles} for the schools of one centre."""
+    return cached_counts('school_books', centre_id, lambda: dict(
+        CatalogueRollup.objects.filter(school__centre_id=centre_id)
+        .values_list('school_id').annotate(n=Sum('book_count')).order_by()
+    ))
+
+
 # =============================================================================
 # 1. MAIN ENTRY: book_list — Your Exact Flow Starts Here
 # =============================================================================
@@ -39,10 +72,13 @@ def book_list(request):
     # 1. Superuser / Site Admin → Full Centre List
     # ==================================================================
     if user.is_superuser or user.is_site_admin:
-        centres = Centre.objects.annotate(
-            school_count=Count('schools', distinct=True),
-            book_count=Count('books')
-        ).order_by('-book_count', 'name')
+        # Book counts come from the maintained rollup, not a GROUP BY over Book
+        book_counts, school_counts = _centre_counts()
+        centres = list(Centre.objects.all())
+        for centre in centres:
+            centre.school_count = school_counts.get(centre.id, 0)
+            centre.book_count = book_counts.get(centre.id) or 0
+        centres.sort(key=lambda c: (-c.book_count, c.name))
 
         total_schools = sum(c.school_count for c in centres)
         total_books   = sum(c.book_count   for c in centres)
@@ -58,15 +94,21 @@ def book_list(request):
     # 2. ALL STAFF: Librarian, Teacher, Regular Staff → School List from their centre
     # ==================================================================
     if user.centre and (user.is_librarian or user.is_teacher or getattr(user, 'is_other', False)):
-        schools = user.centre.schools.all().annotate(book_count=Count('books'))
+        centre_id = user.centre_id
+        book_counts = _school_book_counts(centre_id)
+        schools = list(user.centre.schools.all())
+        for school in schools:
+            school.book_count = book_counts.get(school.id) or 0
         
         total_books = sum(s.book_count for s in schools)
-        active_borrows = Borrow.objects.filter(centre=user.centre, status='issued').count()
-        available_books = Book.objects.filter(school__centre=user.centre, available_copies__gt=0).count()
+        active_borrows, available_books = cached_counts('shelf', centre_id, lambda: (
+            Borrow.objects.filter(centre_id=centre_id, status='issued').count(),
+            CatalogueRollup.objects.filter(school__centre_id=centre_id).aggregate(n=Sum('available_count'))['n'] or 0,
+        ))
 
         # If only one school → go directly to catalog
-        if schools.count() == 1:
-            return redirect('school_catalog', school_id=schools.first().id)
+        if len(schools) == 1:
+            return redirect('school_catalog', school_id=schools[0].id)
 
         return render(request, 'books/school_list.html', {
             'centre': user.centre,
@@ -99,8 +141,14 @@ def ajax_load_schools_modal(request):
     if not centre_id:
         return JsonResponse({'error': 'Missing centre'}, status=400)
 
-    centre = get_object_or_404(Centre, id=centre_id)
-    schools = centre.schools.annotate(book_count=Count('books')).order_by('name')
+    centre = get_centre(centre_id)
+    if centre is None:
+        raise Http404("No such centre")
+    book_counts = _school_book_counts(centre.pk)
+    schools = [
+        {'id': school.pk, 'name': school.name, 'book_count': book_counts.get(school.pk) or 0}
+        for school in get_schools(centre.pk)
+    ]
 
     html = render_to_string('books/partials/school_cards_modal.html', {
         'schools': schools
@@ -137,30 +185,36 @@ def school_catalog(request, school_id):
     if active_tab != 'other':
         selected_subject_id = request.GET.get('subject')
 
-        # All subjects that have textbooks in this school
-        textbook_subjects = Subject.objects.filter(
-            grade__isnull=False,
-            books__school=school
-        ).annotate(book_count=Count('books')).distinct().order_by('name')
+        # Textbook counts for this school, read from the maintained rollup
+        rollup = CatalogueRollup.objects.filter(school=school, grade__isnull=False, book_count__gt=0)
+
+        # All subjects that have textbooks in this school, and the grades' totals
+        subject_counts, grade_totals = cached_counts(f'school:{school.pk}:textbooks', school.centre_id, lambda: (
+            dict(rollup.values_list('subject_id').annotate(n=Sum('book_count')).order_by()),
+            dict(rollup.values_list('grade_id').annotate(n=Sum('book_count')).order_by()),
+        ))
+        textbook_subjects = list(Subject.objects.filter(id__in=subject_counts).order_by('name'))
+        for subject in textbook_subjects:
+            subject.book_count = subject_counts[subject.id]
 
         selected_subject = None
         if selected_subject_id:
             selected_subject = get_object_or_404(Subject, id=selected_subject_id, grade__isnull=False)
 
         # Grades with book counts
-        grades = Grade.objects.annotate(
-            total_books=Count(
-                'subjects__books',
-                filter=Q(subjects__books__school=school),
-                distinct=True
-            ),
-            filtered_books=Count(
-                'subjects__books',
-                filter=Q(subjects__books__school=school) &
-                       (Q(subjects=selected_subject) if selected_subject else Q()),
-                distinct=True
+        grade_filtered = grade_totals
+        if selected_subject:
+            grade_filtered = cached_counts(
+                f'school:{school.pk}:subject:{selected_subject.pk}', school.centre_id,
+                lambda: dict(
+                    rollup.filter(subject=selected_subject)
+                    .values_list('grade_id').annotate(n=Sum('book_count')).order_by()
+                ),
             )
-        ).order_by('order', 'name')
+        grades = list(Grade.objects.order_by('order', 'name'))
+        for grade in grades:
+            grade.total_books = grade_totals.get(grade.id, 0)
+            grade.filtered_books = grade_filtered.get(grade.id, 0)
 
         # Only show grades that have books in the selected subject (or all if no subject selected)
         filtered_grades = [
@@ -201,27 +255,25 @@ def school_catalog(request, school_id):
         if selected_category_id:
             books = books.filter(subject__category_id=selected_category_id)
 
-        # Search
+        # Search (ranked, best match first)
         if query:
-            books = books.filter(
-                Q(title__icontains=query) |
-                Q(author__icontains=query) |
-                Q(isbn__icontains=query) |
-                Q(book_id__icontains=query)
-            )
+            books = search_books(books, query)
 
         # Availability
         if available_only:
-            books = books.filter(available_copies__gt=0)
-
-        # Categories with book counts
-        categories = Category.objects.annotate(
-            book_count=Count(
-                'subjects__books',
-                filter=Q(subjects__books__school=school, subjects__grade__isnull=True),
-                distinct=True
-            )
-        ).exclude(book_count=0).order_by('name')
+            books = books.filter(copies_available__gt=0)
+
+        # Categories with book counts, read from the maintained rollup
+        category_counts = cached_counts(f'school:{school.pk}:categories', school.centre_id, lambda: dict(
+            CatalogueRollup.objects.filter(school=school, subject__isnull=False, grade__isnull=True)
+            .values_list('category_id').annotate(n=Sum('book_count')).order_by()
+        ))
+        categories = [
+            category for category in Category.objects.filter(id__in=category_counts).order_by('name')
+            if category_counts[category.id] > 0
+        ]
+        for category in categories:
+            category.book_count = category_counts[category.id]
 
         selected_category = None
         if selected_category_id:
@@ -256,56 +308,41 @@ def grade_book_list(request, school_id, grade_id):
         if school.centre != request.user.centre:
             return redirect('book_list')
 
-    books = Book.objects.filter(
-        school=school,
-        subject__grade=grade
-    ).select_related('subject', 'subject__category', 'added_by', 'centre')
-
     category_id = request.GET.get('category', '').strip()
     subject_id = request.GET.get('subject', '').strip()
     q = request.GET.get('q', '').strip()
     available = request.GET.get('available') == 'on'  # Changed to 'on' for checkbox
 
-    if category_id and category_id != 'all':
-        books = books.filter(subject__category_id=category_id)
-    if subject_id and subject_id != 'all':
-        books = books.filter(subject_id=subject_id)
-    if q:
-        books = books.filter(
-            Q(title__icontains=q) | Q(author__icontains=q) |
-            Q(book_id__icontains=q) | Q(isbn__icontains=q)
-        )
-    if available:
-        books = books.filter(available_copies=True)
-
-    books = books.order_by('title')
-
-    # Export Logic
+    books = filter_grade_books(school, grade, category_id, subject_id, q, available)
+
+    # Pagination (after filters, before export). Keyset pages by title;
+    # ranked search results keep the classic paginator.
+    page_obj = paginate(
+        request, books, None if q else ('title',), 20,
+        count_key=count_cache_key(request, f'grade_book_list:{school.pk}:{grade.pk}'),
+    )
+
+    # Export Logic — the current page inline, everything via a background job
     if 'export' in request.GET:
         export_type = request.GET['export']
-        if export_type == 'page':
-            books_to_export = Paginator(books, 20).get_page(request.GET.get('page')).object_list
-        elif export_type == 'all':
-            books_to_export = books
-        else:
-            books_to_export = []
-
-        if books_to_export.exists():
-            response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        if export_type == 'all' and books.exists():
+            job = enqueue_job('grade_books_export', request.user, params={
+                'school_id': school.pk,
+                'grade_id': grade.pk,
+                'category': category_id,
+                'subject': subject_id,
+                'q': q,
+                'available': available,
+            })
+            return redirect('job_status', job_id=job.pk)
+
+        page_ids = [book.pk for book in page_obj] if export_type == 'page' else []
+        if page_ids:
+            response = HttpResponse(content_type=XLSX_CONTENT_TYPE)
             response['Content-Disposition'] = f'attachment; filename="{grade.name}_books.xlsx"'
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.append(['Title', 'Author', 'ISBN', 'Status'])
-            for book in books_to_export:
-                status = 'Available' if book.available_copies else 'Borrowed'
-                ws.append([book.title, book.author, book.isbn or '', status])
-            wb.save(response)
+            write_grade_books_xlsx(books.filter(pk__in=page_ids), response, ordering=None if q else ('title',))
             return response
 
-    # Pagination (after filters, before export)
-    paginator = Paginator(books, 20)
-    page_obj = paginator.get_page(request.GET.get('page'))
-
     categories = Category.objects.filter(
         subjects__books__school=school,
         subjects__books__subject__grade=grade
@@ -340,9 +377,9 @@ def book_add(request):
         messages.error(request, "You don't have permission to add books.")
         return redirect('book_list')
 
-    centres = Centre.objects.all() if request.user.is_superuser else [request.user.centre]
-    categories = Category.objects.all().order_by('name')
-    grades = Grade.objects.all().order_by('order', 'name')
+    centres = get_centres() if request.user.is_superuser else [request.user.centre]
+    categories = get_categories()
+    grades = get_grades()
 
     if request.method == "POST":
         try:
@@ -394,40 +431,26 @@ def book_add(request):
                         return redirect('book_add')
 
                     try:
-                        reader = csv.DictReader(TextIOWrapper(csv_file.file, encoding='utf-8-sig'))
+                        header = csv_file.readline().decode('utf-8-sig')
+                        fieldnames = next(csv.reader([header]), [])
                         expected_headers = {'title', 'author', 'isbn', 'publisher', 'year_of_publication'}
-                        if not expected_headers.issubset(set(reader.fieldnames or [])):
+                        if not expected_headers.issubset(set(fieldnames)):
                             messages.error(request, "CSV missing required columns: title, author")
                             return redirect('book_add')
 
-                        for row_num, row in enumerate(reader, start=2):
-                            title = row.get('title', '').strip()
-                            author = row.get('author', '').strip()
-                            if not title or not author:
-                                errors.append(f"Row {row_num}: Missing title or author")
-                                continue
-
-                            try:
-                                book = Book(
-                                    title=title,
-                                    author=author,
-                                    isbn=row.get('isbn', '').strip(),
-                                    publisher=row.get('publisher', '').strip() or "Unknown",
-                                    year_of_publication=int(row.get('year_of_publication', 2025) or 2025),
-                                    school=school,
-                                    centre=centre,
-                                    subject=subject,
-                                    added_by=request.user,
-                                )
-                                book.full_clean()
-                                book.save()
-                                added_books.append(book)
-                            except Exception as e:
-                                errors.append(f"Row {row_num} ('{title}'): {str(e)}")
+                        # Rows are imported by a background worker (utils.jobs)
+                        csv_file.seek(0)
+                        job = enqueue_job('book_import', request.user, params={
+                            'school_id': school.pk,
+                            'subject_id': subject.pk if subject else None,
+                        }, upload=csv_file)
                     except Exception as e:
                         messages.error(request, f"CSV processing error: {str(e)}")
                         return redirect('book_add')
 
+                    messages.info(request, f"Import of {csv_file.name} queued.")
+                    return redirect('job_status', job_id=job.pk)
+
                 # ==================== SINGLE BOOK ====================
                 else:
                     title = request.POST.get('title', '').strip()
@@ -449,6 +472,7 @@ def book_add(request):
                     )
                     book.full_clean()
                     book.save()
+                    book.add_copies(parse_copy_count(request.POST.get('copies')))
                     added_books.append(book)
 
                 # === SUCCESS: Store in session + redirect ===
@@ -486,8 +510,15 @@ def book_add(request):
 
 @login_required
 def book_add_confirmation(request):
-    book_ids = request.session.get('just_added_book_ids', [])
-    count = request.session.get('just_added_count', 0)
+    from_job = 'job' in request.GET
+    if from_job:
+        # Books added by a background import (see job_status)
+        job = get_user_job(request.user, request.GET['job'], 'result_data')
+        book_ids = job.result.get('book_ids', [])
+        count = len(book_ids)
+    else:
+        book_ids = request.session.get('just_added_book_ids', [])
+        count = request.session.get('just_added_count', 0)
 
     if not book_ids:
         messages.info(request, "No books were added in this session.")
@@ -498,8 +529,9 @@ def book_add_confirmation(request):
     ).order_by('-id')
 
     # Clear session after displaying
-    del request.session['just_added_book_ids']
-    del request.session['just_added_count']
+    if not from_job:
+        del request.session['just_added_book_ids']
+        del request.session['just_added_count']
 
     # Smart page title
     if books.exists():
@@ -526,9 +558,9 @@ def sample_csv_download(request):
     response = HttpResponse(content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="sample_books_upload.csv"'
     writer = csv.writer(response)
-    writer.writerow(['title', 'author', 'isbn', 'publisher', 'year_of_publication'])
-    writer.writerow(['The Great Gatsby', 'F. Scott Fitzgerald', '978-0-7432-7356-5', 'Scribner', '1925'])
-    writer.writerow(['Mathematics Grade 10', 'John Doe', '978-1-234567-89-0', 'National Press', '2023'])
+    writer.writerow(['title', 'author', 'isbn', 'publisher', 'year_of_publication', 'copies'])
+    writer.writerow(['The Great Gatsby', 'F. Scott Fitzgerald', '978-0-7432-7356-5', 'Scribner', '1925', '1'])
+    writer.writerow(['Mathematics Grade 10', 'John Doe', '978-1-234567-89-0', 'National Press', '2023', '40'])
     return response
 
 # =============================================================================
@@ -614,15 +646,15 @@ def book_update(request, pk):
             messages.error(request, f"Update failed: {str(e)}")
 
     # ——— GET REQUEST ———
-    centres = Centre.objects.all() if request.user.is_superuser else [book.centre]
+    centres = get_centres() if request.user.is_superuser else [book.centre]
     schools = book.centre.schools.all()
 
     context = {
         'book': book,
         'centres': centres,
         'schools': schools,
-        'categories': Category.objects.all(),
-        'grades': Grade.objects.all(),
+        'categories': get_categories(),
+        'grades': get_grades(),
         'current_category': book.subject.category if book.subject else None,
         'current_grade': book.subject.grade if book.subject else None,
         'current_subject': book.subject,
@@ -658,12 +690,13 @@ def book_detail(request, pk):
 
     if request.method == 'POST' and request.user.is_student:
         action = request.POST.get('action')
-        if action == 'borrow' and book.available_copies:
+        if action == 'borrow' and book.is_available():
             if can_user_borrow(request.user):
                 Borrow.objects.create(
                     book=book, user=request.user, centre=book.centre,
                     status='requested', due_date=timezone.now() + timedelta(days=14)
                 )
+                fulfil_hold(request.user, book)
                 messages.success(request, "Borrow request sent.")
             else:
                 messages.error(request, "Borrow limit reached.")
@@ -674,7 +707,11 @@ def book_detail(request, pk):
             )
             messages.success(request, "Book reserved.")
 
-    return render(request, 'books/book_detail.html', {'book': book, 'is_staff': is_staff_user(request.user)})
+    return render(request, 'books/book_detail.html', {
+        'book': book,
+        'is_staff': is_staff_user(request.user),
+        'hold': hold_status(request.user, book),
+    })
 
 
 # =============================================================================
@@ -689,18 +726,19 @@ def borrow_approve(request, pk):
         return redirect('book_list')
 
     if request.method == 'POST':
-        with transaction.atomic():
-            if borrow.book.available_copies:
-                borrow.status = 'issued'
-                borrow.issue_date = timezone.now()
-                borrow.issued_by = request.user
-                borrow.book.available_copies = False
-                borrow.book.save()
-                borrow.save()
-                Notification.objects.create(
-                    user=borrow.user,
+        if borrow.book.is_available():
+            try:
+                issue_borrow(borrow, request.user, borrow.due_date)
+            except CirculationError as e:
+                messages.error(request, str(e))
+            else:
+                notify(
+                    [borrow.user],
                     notification_type='borrow_approved',
-                    message=f"Your request for '{borrow.book.title}' was approved."
+                    message=f"Your request for '{borrow.book.title}' was approved.",
+                    book=borrow.book,
+                    borrow=borrow,
+                    event='issued',
                 )
                 messages.success(request, "Borrow approved.")
     return render(request, 'books/borrow_approve.html', {'borrow': borrow})
@@ -712,8 +750,7 @@ def borrow_approve(request, pk):
 # AJAX: Load schools by centre
 def ajax_load_schools(request):
     centre_id = request.GET.get('centre_id')
-    schools = School.objects.filter(centre_id=centre_id).order_by('name')
-    data = [{'id': s.id, 'name': s.name} for s in schools]
+    data = [{'id': s.id, 'name': s.name} for s in get_schools(centre_id)]
     return JsonResponse({'schools': data})
 
 
@@ -722,16 +759,35 @@ def ajax_load_subjects(request):
     category_id = request.GET.get('category_id')
     grade_id = request.GET.get('grade_id')
 
-    subjects = Subject.objects.all()
-    if category_id:
-        subjects = subjects.filter(category_id=category_id)
-    if grade_id:
-        subjects = subjects.filter(grade_id=grade_id)
-
-    data = [{'id': s.id, 'name': s.name} for s in subjects.order_by('name')]
+    data = [{'id': s.id, 'name': s.name} for s in get_subjects(category_id, grade_id)]
     return JsonResponse({'subjects': data})
 
 
+def _book_form_centres(user):
+    """Ids of the centres a user can add books to, None meaning all of them."""
+    if user.is_superuser:
+        return None
+    return [user.centre_id] if user.centre_id else []
+
+
+def _book_form_tree_etag(request):
+    centre_ids = _book_form_centres(request.user)
+    scope = 'all' if centre_ids is None else '.'.join(map(str, centre_ids))
+    return f"{get_refdata_version()}-{scope}"
+
+
+# AJAX: The whole centre → school → grade / category → subject tree for the
+# book forms in one response, which the page keeps in localStorage and
+# revalidates with If-None-Match (304 until the reference data changes)
+@login_required
+@require_GET
+@cache_control(private=True, no_cache=True)
+@vary_on_cookie
+@etag(_book_form_tree_etag)
+def ajax_book_form_tree(request):
+    return JsonResponse(book_form_tree(_book_form_centres(request.user)))
+
+
 # AJAX: Get next book code preview
 def ajax_next_code(request):
     subject_id = request.GET.get('subject_id')
@@ -739,9 +795,6 @@ def ajax_next_code(request):
         return JsonResponse({'next_code': 'Select subject first'})
 
     subject = get_object_or_404(Subject, id=subject_id)
-    prefix = re.sub(r'[^A-Z]', '', subject.name.upper())[:3] or "MISC"
-
-    last = Book.objects.filter(book_code__startswith=f"{prefix}-").order_by('-book_code').first()
-    next_num = (int(last.book_code.split('-')[-1]) + 1) if last and last.book_code else 1
 
-    return JsonResponse({'next_code': f"{prefix}-{next_num:04d}"})
\ No newline at end of file
+    # One lookup on the prefix's counter; the code is only assigned when the book is saved
+    return JsonResponse({'next_code': BookCodeSequence.peek(book_code_prefix(subject.name))})
\ No newline at end of file
@@ -15,8 +15,14 @@ from ..models import (
     Student,
     can_user_borrow,
     get_user_borrow_limit,
-    Category,
 )
+from ..utils.search import search_books
+from ..utils.notifications import notify, notify_librarians_of_borrow_request, notify_teacher_bulk_request
+from ..utils.circulation import issue_borrow, issue_new_borrow, return_borrow, CirculationError
+from ..utils.holds import advance_queue, fulfil_hold
+from ..utils.refdata import get_categories
+from ..utils.pagination import paginate, count_cache_key
+from ..utils.exports import export_response, export_links, EXPORT_FORMATS, BORROW_EXPORT
 
 # ==================== USER BORROW REQUEST VIEWS ====================
 
@@ -91,7 +97,7 @@ def borrow_request(request, book_id):
     # Check if book is available
     if book.is_available():
         # Create borrow request
-        Borrow.objects.create(
+        borrow = Borrow.objects.create(
             book=book,
             user=request.user,
             centre=book.centre,
@@ -100,17 +106,8 @@ def borrow_request(request, book_id):
         )
 
         # Notify librarians
-        librarians = CustomUser.objects.filter(
-            is_librarian=True, centre=book.centre
-        )
-        for librarian in librarians:
-            Notification.objects.create(
-                user=librarian,
-                message=(
-                    f"{request.user.get_full_name() or request.user.email} "
-                    f"requested to borrow '{book.title}'"
-                ),
-            )
+        notify_librarians_of_borrow_request(borrow)
+        fulfil_hold(request.user, book)
 
         messages.success(
             request,
@@ -287,25 +284,21 @@ def teacher_book_list(request):
     category_id = request.GET.get("category", "")
     available_only = "available" in request.GET
 
-    if query:
-        books = books.filter(
-            Q(title__icontains=query)
-            | Q(author__icontains=query)
-            | Q(book_code__icontains=query)
-            | Q(isbn__icontains=query)
-        )
     if category_id:
         books = books.filter(category_id=category_id)
     if available_only:
-        books = books.filter(available_copies=True)
+        books = books.filter(copies_available__gt=0)
 
-    books = books.order_by("title")
+    if query:
+        books = search_books(books, query)
+    else:
+        books = books.order_by("title")
 
     paginator = Paginator(books, 20)  # Adjust as needed
     page_number = request.GET.get("page")
     page_obj = paginator.get_page(page_number)
 
-    categories = Category.objects.all()
+    categories = get_categories()
 
     context = {
         "page_obj": page_obj,
@@ -341,6 +334,7 @@ def bulk_borrow_request(request):
 
     created = 0
     failed = []
+    requested_books = []
     # Teachers are not limited, so no limit check
 
     for book_id in book_ids:
@@ -361,29 +355,21 @@ def bulk_borrow_request(request):
             continue
 
         if book.is_available():
-            borrow = Borrow.objects.create(
+            Borrow.objects.create(
                 book=book,
                 user=request.user,
                 centre=book.centre,
                 status="requested",
                 notes="",  # Optional: can add a field if needed
             )
-            # Notify librarians
-            librarians = CustomUser.objects.filter(
-                is_librarian=True, centre=book.centre
-            )
-            for librarian in librarians:
-                Notification.objects.create(
-                    user=librarian,
-                    message=(
-                        f"{request.user.get_full_name() or request.user.email} "
-                        f"requested to borrow '{book.title}' (bulk)"
-                    ),
-                )
+            requested_books.append(book)
             created += 1
         else:
             failed.append(f"{book.title}: Unavailable")
 
+    # One grouped notification per librarian for the whole request
+    notify_teacher_bulk_request(request.user, requested_books, request.user.centre)
+
     if created:
         messages.success(
             request,
@@ -433,7 +419,7 @@ def bulk_reserve_book(request):
             failed.append(f"{book.title}: Already reserved")
             continue
 
-        if book.available_copies:
+        if book.is_available():
             failed.append(f"{book.title}: Available - borrow instead")
             continue
 
@@ -489,18 +475,16 @@ def borrow_add(request):
                         f"when adding borrow by {request.user.email}"
                     )
                     return redirect("borrow_add")
-                borrow = Borrow.objects.create(
-                    user=student.user,
-                    book=book,
-                    centre=book.centre,
-                    status="issued",
-                    issue_date=timezone.now(),
-                    due_date=timezone.now() + timedelta(days=7),
-                    issued_by=request.user,
-                )
-                book.update_available_copies()
-                Notification.objects.create(
-                    user=student.user,
+                try:
+                    borrow = issue_new_borrow(
+                        book, student.user, request.user,
+                        due_date=timezone.now() + timedelta(days=7),
+                    )
+                except CirculationError:
+                    messages.error(request, 'Book is not available.')
+                    return redirect("borrow_add")
+                notify(
+                    [student.user],
                     message=(
                         f"Your borrow request for '{book.title}' has been "
                         f"approved! Due: {borrow.due_date.strftime('%Y-%m-%d')}"
@@ -508,6 +492,7 @@ def borrow_add(request):
                     book=book,
                     borrow=borrow,
                     notification_type="borrow_approved",
+                    event="issued",
                 )
                 messages.success(request, 'Book borrowed successfully!', extra_tags="green")
                 print(
@@ -524,9 +509,8 @@ def borrow_add(request):
         except (Student.DoesNotExist, Book.DoesNotExist):
             messages.error(request, 'Invalid student or book.')
             print(f"Invalid student ID {student_id} or book ID {book_id}")
-    students = Student.objects.all()
-    books = Book.objects.filter(available_copies=True)
-    return render(request, 'borrow/borrow_add.html', {'students': students, 'books': books})
+    # Students and available books are picked through the autocomplete endpoint
+    return render(request, 'borrow/borrow_add.html', {})
 
 # ==================== LIBRARIAN BORROW MANAGEMENT VIEWS ====================
 
@@ -650,19 +634,20 @@ def borrow_issue(request, borrow_id):
                 )
                 return redirect("borrow_issue", borrow_id=borrow_id)
 
-            # Issue the book
-            borrow.status = "issued"
-            borrow.issue_date = timezone.now()
-            borrow.due_date = due_date
-            borrow.issued_by = request.user
-            borrow.save(user=request.user)
-
-            # Update book availability
-            borrow.book.update_available_copies()
+            # Issue the book (fails cleanly if another librarian took the last copy first)
+            try:
+                issue_borrow(borrow, request.user, due_date)
+            except CirculationError as e:
+                messages.error(request, str(e))
+                print(
+                    f"Issue of borrow ID {borrow_id} by {request.user.email} "
+                    f"failed: {e}"
+                )
+                return redirect("borrow_requests_list")
 
             # Notify user
-            Notification.objects.create(
-                user=borrow.user,
+            notify(
+                [borrow.user],
                 message=(
                     f"Your request for '{borrow.book.title}' has been "
                     f"approved! Due date: "
@@ -671,6 +656,7 @@ def borrow_issue(request, borrow_id):
                 book=borrow.book,
                 borrow=borrow,
                 notification_type="borrow_approved",
+                event="issued",
             )
 
             messages.success(
@@ -734,8 +720,8 @@ def borrow_reject(request, borrow_id):
         reason = request.POST.get("reason", "No reason provided")
 
         # Notify user
-        Notification.objects.create(
-            user=borrow.user,
+        notify(
+            [borrow.user],
             message=(
                 f"Your request for '{borrow.book.title}' was rejected. "
                 f"Reason: {reason}"
@@ -743,6 +729,7 @@ def borrow_reject(request, borrow_id):
             book=borrow.book,
             borrow=borrow,
             notification_type="borrow_rejected",
+            event="rejected",
         )
 
         # Delete the request
@@ -825,7 +812,7 @@ def active_borrows_list(request):
             status="issued",
             user__is_student=True
         ).filter(centre_filter).select_related(
-            "book", "user", "issued_by", "centre", "book__category"
+            "book", "user", "issued_by", "centre", "book__subject__category"
         )
 
         if search:
@@ -840,21 +827,25 @@ def active_borrows_list(request):
         if status_filter == "overdue":
             borrows = borrows.filter(due_date__lt=timezone.now())
 
-        borrows = borrows.order_by("due_date")
+        export_format = request.GET.get("export")
+        if export_format in EXPORT_FORMATS:
+            return export_response(borrows, BORROW_EXPORT, export_format, "active_borrows", ordering=("due_date",))
 
-        paginator = Paginator(borrows, 20)
-        page_number = request.GET.get("page")
-        borrows_page = paginator.get_page(page_number)
+        borrows_page = paginate(
+            request, borrows, ("due_date",), 20,
+            count_key=count_cache_key(request, "active_borrows_list"),
+        )
 
         context = {
             "borrows": borrows_page,
             "search": search,
             "status_filter": status_filter,
             "user_type": user_type,
+            "export_links": export_links(request),
         }
         print(
             f"Librarian {request.user.email} viewed active_borrows_list (students): "
-            f"{borrows.count()} borrows"
+            f"{len(borrows_page)} borrows on page"
         )
         return render(request, "borrows/active_borrows_list.html", context)
 
@@ -894,42 +885,27 @@ def borrow_receive_return(request, borrow_id):
 
     if request.method == "POST":
         # Mark as returned
-        borrow.status = "returned"
-        borrow.return_date = timezone.now()
-        borrow.returned_to = request.user
-        borrow.save(user=request.user)
-
-        # Update book availability
-        borrow.book.update_available_copies()
-
-        # Check for pending reservations
-        pending_reservation = Reservation.objects.filter(
-            book=borrow.book, status="pending"
-        ).order_by("reservation_date").first()
-
-        if pending_reservation:
-            # Notify user with reservation
-            Notification.objects.create(
-                user=pending_reservation.user,
-                message=(
-                    f"'{borrow.book.title}' is now available! Your "
-                    "reservation is ready. Please request to borrow "
-                    "within 2 days."
-                ),
-                book=borrow.book,
-                reservation=pending_reservation,
-                notification_type="book_available",
+        try:
+            return_borrow(borrow, request.user)
+        except CirculationError as e:
+            messages.error(request, "This book is not currently issued.")
+            print(
+                f"Return of borrow ID {borrow_id} by {request.user.email} "
+                f"failed: {e}"
             )
-            pending_reservation.notified = True
-            pending_reservation.save()
+            return redirect("active_borrows_list")
+
+        # Hand the copy to the next reservation in the queue, if any
+        advance_queue(borrow.book)
 
         # Notify user
-        Notification.objects.create(
-            user=borrow.user,
+        notify(
+            [borrow.user],
             message=f"Thank you for returning '{borrow.book.title}'!",
             book=borrow.book,
             borrow=borrow,
             notification_type="book_returned",
+            event="returned",
         )
 
         messages.success(
@@ -1006,7 +982,7 @@ def all_borrows_history(request):
             "issued_by",
             "returned_to",
             "centre",
-            "book__category",
+            "book__subject__category",
         )
 
         if search:
@@ -1021,21 +997,25 @@ def all_borrows_history(request):
         if status:
             borrows = borrows.filter(status=status)
 
-        borrows = borrows.order_by("-request_date")
+        export_format = request.GET.get("export")
+        if export_format in EXPORT_FORMATS:
+            return export_response(borrows, BORROW_EXPORT, export_format, "borrow_history", ordering=("-request_date",))
 
-        paginator = Paginator(borrows, 50)
-        page_number = request.GET.get("page")
-        borrows_page = paginator.get_page(page_number)
+        borrows_page = paginate(
+            request, borrows, ("-request_date",), 50,
+            count_key=count_cache_key(request, "all_borrows_history"),
+        )
 
         context = {
             "borrows": borrows_page,
             "search": search,
             "status_filter": status,
             "user_type": user_type,
+            "export_links": export_links(request),
         }
         print(
             f"Librarian {request.user.email} viewed all_borrows_history (students): "
-            f"{borrows.count()} borrows"
+            f"{len(borrows_page)} borrows on page"
         )
         return render(request, "borrows/all_borrows_history.html", context)
 
@@ -1181,7 +1161,7 @@ def reserve_book(request, book_id):
         return redirect("book_detail", pk=book_id)
 
     # Check if the book has available copies (suggest borrowing instead)
-    if book.available_copies:
+    if book.is_available():
         messages.info(
             request,
             f"'{book.title}' is available. Consider borrowing instead.",
@@ -1237,7 +1217,6 @@ def user_borrow_details(request, user_id):
     return render(request, "borrows/user_borrow_details.html", context)
 
 @login_required
-@transaction.atomic
 def bulk_issue_borrows(request, user_id):
     if not (request.user.is_librarian or request.user.is_site_admin):
         messages.error(request, "You don't have permission to issue books.")
@@ -1271,16 +1250,15 @@ def bulk_issue_borrows(request, user_id):
             failed.append(f"{borrow.book.title}: Unavailable")
             continue
 
-        borrow.status = "issued"
-        borrow.issue_date = timezone.now()
-        borrow.due_date = due_date
-        borrow.issued_by = request.user
-        borrow.save(user=request.user)
-
-        borrow.book.update_available_copies()
+        # Each borrow is issued in its own locked transaction
+        try:
+            issue_borrow(borrow, request.user, due_date)
+        except CirculationError:
+            failed.append(f"{borrow.book.title}: Unavailable")
+            continue
 
-        Notification.objects.create(
-            user=borrow.user,
+        notify(
+            [borrow.user],
             message=(
                 f"Your request for '{borrow.book.title}' has been approved! "
                 f"Due: {due_date.strftime('%Y-%m-%d')}"
@@ -1288,6 +1266,7 @@ def bulk_issue_borrows(request, user_id):
             book=borrow.book,
             borrow=borrow,
             notification_type="borrow_approved",
+            event="issued",
         )
         issued += 1
 
@@ -1327,8 +1306,8 @@ def bulk_reject_borrows(request, user_id):
     borrows = Borrow.objects.filter(id__in=borrow_ids, status="requested")
 
     for borrow in borrows:
-        Notification.objects.create(
-            user=borrow.user,
+        notify(
+            [borrow.user],
             message=(
                 f"Your request for '{borrow.book.title}' was rejected. "
                 "Contact librarian for details."
@@ -1336,6 +1315,7 @@ def bulk_reject_borrows(request, user_id):
             book=borrow.book,
             borrow=borrow,
             notification_type="borrow_rejected",
+            event="rejected",
         )
         borrow.delete()
         rejected += 1
@@ -1469,7 +1449,6 @@ def user_reservations(request, user_id):
 
 # ==================== NEW LIBRARIAN DIRECT ISSUE VIEW ====================
 @login_required
-@transaction.atomic
 def librarian_issue_book(request):
     """
     Librarian/Admin selects a student and an available book, and issues it.
@@ -1545,31 +1524,18 @@ def librarian_issue_book(request):
                 return redirect("librarian_issue_book")
 
             # --- Atomic Request + Issue ---
+            # 1-3. Create the 'requested' record and issue it in one locked
+            # transaction; nothing is saved if the last copy went meanwhile
             request_time = timezone.now()
-            
-            # 1. Create the 'requested' record
-            borrow = Borrow.objects.create(
-                book=book,
-                user=user,
-                centre=book.centre,
-                status="requested",
+            borrow = issue_new_borrow(
+                book, user, request.user, due_date,
                 request_date=request_time,
                 notes=f"Issued directly by librarian {request.user.email}",
             )
-            
-            # 2. Immediately update to 'issued'
-            borrow.status = "issued"
-            borrow.issue_date = request_time # Use same timestamp
-            borrow.due_date = due_date
-            borrow.issued_by = request.user
-            borrow.save(user=request.user) # Pass user for history tracking
-            
-            # 3. Update book availability
-            book.update_available_copies()
 
             # 4. Notify the student
-            Notification.objects.create(
-                user=user,
+            notify(
+                [user],
                 message=(
                     f"A book, '{book.title}', has been issued to you by a librarian. "
                     f"Due date: {borrow.due_date.strftime('%Y-%m-%d')}"
@@ -1577,6 +1543,7 @@ def librarian_issue_book(request):
                 book=book,
                 borrow=borrow,
                 notification_type="borrow_approved", # Using this type for consistency
+                event="issued",
             )
             
             # --- NEW NOTIFICATION FOR ADMIN ---
@@ -1603,23 +1570,16 @@ def librarian_issue_book(request):
         except Book.DoesNotExist:
             messages.error(request, "Invalid book selected.")
             print(f"Librarian issue failed: Book ID {book_id} not found.")
+        except CirculationError as e:
+            messages.error(request, str(e))
+            print(f"Librarian issue failed: {e}")
         except Exception as e:
             messages.error(request, f"An unexpected error occurred: {e}")
             print(f"Librarian issue failed: Unexpected error: {e}")
 
-    # GET request: Prepare the form
-    students = Student.objects.select_related('user', 'centre').filter(user__isnull=False).order_by('name')
-    books = Book.objects.filter(available_copies=True).order_by('title')
-
-    if request.user.is_librarian and not request.user.is_site_admin:
-        students = students.filter(centre=request.user.centre)
-        books = books.filter(centre=request.user.centre)
-        
-    context = {
-        "students": students,
-        "books": books,
-    }
-    return render(request, "borrows/librarian_issue_book.html", context)
+    # GET request: students and books are looked up through the autocomplete
+    # endpoint as the librarian types, scoped to their centre there
+    return render(request, "borrows/librarian_issue_book.html", {})
 
 
 
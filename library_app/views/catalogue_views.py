@@ -5,6 +5,11 @@ from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db.models import Q
 from django.http import JsonResponse
 from ..models import Catalogue, Book, Centre, CustomUser
+from ..utils.search import search_books
+from ..utils.exports import export_response, export_links, EXPORT_FORMATS, CATALOGUE_EXPORT
+from .autocomplete_views import autocomplete_results
+
+SEARCH_RESULT_LIMIT = 500
 
 
 def is_authorized(user):
@@ -14,7 +19,7 @@ def is_authorized(user):
 
 @login_required
 def get_books_by_centre(request):
-    """AJAX endpoint to fetch books for a selected centre."""
+    """AJAX endpoint: uncatalogued books of a centre whose title/Book ID starts with ?q=."""
     centre_id = request.GET.get('centre_id')
     
     if not centre_id:
@@ -27,16 +32,11 @@ def get_books_by_centre(request):
         if request.user.is_librarian and not request.user.is_superuser and centre != request.user.centre:
             return JsonResponse({'error': 'Unauthorized'}, status=403)
         
-        catalogued_books = Catalogue.objects.filter(centre=centre).values_list('book_id', flat=True)
-        books = Book.objects.filter(
-            centre=centre,
-            is_active=True
-        ).exclude(
-            id__in=catalogued_books
-        ).order_by('title').values('id', 'title', 'author', 'book_code', 'category')
+        query = request.GET.get('q', '').strip()
+        books = autocomplete_results('book', query, centre_id=centre.id, only='uncatalogued') if query else []
         
         return JsonResponse({
-            'books': list(books),
+            'books': books,
             'centre_name': centre.name
         })
     except Centre.DoesNotExist:
@@ -105,18 +105,8 @@ def catalogue_add(request):
         except Exception as e:
             messages.error(request, f"Error adding book to catalogue: {str(e)}")
 
-    if request.user.is_superuser:
-        catalogued_books = Catalogue.objects.values_list('book_id', flat=True)
-        books = Book.objects.filter(is_active=True).exclude(id__in=catalogued_books).order_by('title')
-    else:
-        catalogued_books = Catalogue.objects.filter(centre=request.user.centre).values_list('book_id', flat=True)
-        books = Book.objects.filter(
-            centre=request.user.centre,
-            is_active=True
-        ).exclude(id__in=catalogued_books).order_by('title')
-
+    # Uncatalogued books are looked up through the autocomplete endpoint as the user types
     return render(request, 'catalogue/catalogue_add.html', {
-        'books': books,
         'centres': centres
     })
 
@@ -134,14 +124,22 @@ def catalogue_list(request):
     # Search functionality
     search_query = request.GET.get('search', '')
     if search_query:
+        # Full-text first, trigram fallback for misspelt titles/authors
+        book_ids = set(
+            search_books(Book.objects.filter(catalogue_entries__in=catalogues), search_query)
+            .values_list('id', flat=True)[:SEARCH_RESULT_LIMIT]
+        )
         catalogues = catalogues.filter(
-            Q(book__title__icontains=search_query) |
-            Q(book__author__icontains=search_query) |
+            Q(book_id__in=book_ids) |
             Q(shelf_number__icontains=search_query)
         )
 
     catalogues = catalogues.order_by('shelf_number')
 
+    export_format = request.GET.get('export')
+    if export_format in EXPORT_FORMATS:
+        return export_response(catalogues, CATALOGUE_EXPORT, export_format, 'catalogue', ordering=('shelf_number',))
+
     # Pagination
     items_per_page = 15
     paginator = Paginator(catalogues, items_per_page)
@@ -151,7 +149,8 @@ def catalogue_list(request):
     return render(request, 'catalogue/catalogue_list.html', {
         'page_obj': page_obj,
         'catalogues': catalogues,
-        'search_query': search_query
+        'search_query': search_query,
+        'export_links': export_links(request),
     })
 
 
@@ -29,6 +29,6 @@ def issue_book(request):
         student = get_object_or_404(Student, id=student_id) if student_id else None
         centre = get_object_or_404(Centre, id=centre_id) if centre_id else None
 
-        if book and not book.available_copies:
+        if book and not book.is_available():
             errors.append("This book is not available.")
         if student and not student
\ No newline at end of file
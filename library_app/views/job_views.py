@@ -0,0 +1,72 @@
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, HttpResponse, Http404
+from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+
+from ..models import BackgroundJob
+
+JOB_TITLES = {
+    'book_import': "Book import",
+    'student_import': "Student import",
+    'grade_books_export': "Book export",
+}
+
+
+def get_user_job(user, job_id, *deferred):
+    """A job the user may see: their own, or any for superusers and site admins."""
+    if not str(job_id).isdigit():
+        raise Http404("No such job")
+    jobs = BackgroundJob.objects.defer('input_data', *deferred)
+    if not (user.is_superuser or user.is_site_admin):
+        jobs = jobs.filter(created_by=user)
+    return get_object_or_404(jobs, pk=job_id)
+
+
+def job_payload(job):
+    payload = {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'progress_done': job.progress_done,
+        'progress_total': job.progress_total,
+        'percent': job.progress_percent,
+        'finished': job.is_finished,
+        'result': job.result,
+        'error': job.error.split('\n\n')[0] if job.error else '',
+    }
+    if job.status == 'done' and job.result_name:
+        payload['download_url'] = reverse('job_download', args=[job.pk])
+    if job.status == 'done' and job.kind == 'book_import' and job.result.get('added'):
+        payload['view_url'] = reverse('book_add_confirmation') + f'?job={job.pk}'
+    return payload
+
+
+@login_required
+def job_status(request, job_id):
+    """Progress page for a queued import/export; polls job_progress until done"""
+    job = get_user_job(request.user, job_id, 'result_data')
+    context = {
+        'job': job,
+        'job_title': JOB_TITLES.get(job.kind, job.kind),
+        'payload': job_payload(job),
+    }
+    return render(request, 'jobs/job_status.html', context)
+
+
+@login_required
+@require_GET
+def job_progress(request, job_id):
+    job = get_user_job(request.user, job_id, 'result_data')
+    return JsonResponse(job_payload(job))
+
+
+@login_required
+@require_GET
+def job_download(request, job_id):
+    job = get_user_job(request.user, job_id)
+    if job.status != 'done' or not job.result_name:
+        raise Http404("No file for this job")
+    response = HttpResponse(bytes(job.result_data), content_type=job.result_content_type)
+    response['Content-Disposition'] = f'attachment; filename="{job.result_name}"'
+    return response
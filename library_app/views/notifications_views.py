@@ -8,8 +8,8 @@ from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.db.models import Q
-from django.core.paginator import Paginator
 from ..models import Notification, CustomUser
+from ..utils.pagination import paginate, count_cache_key
 
 @login_required
 def notification_center(request):
@@ -34,6 +34,7 @@ def notification_center(request):
             'book_available',
             'reservation_fulfilled',
             'overdue_reminder',
+            'due_soon',
         ]
         if request.user.is_teacher:
             allowed_notification_types.append('teacher_bulk_request')
@@ -52,10 +53,11 @@ def notification_center(request):
     elif read_status == 'read':
         notifications = notifications.filter(is_read=True)
 
-    # Pagination
-    paginator = Paginator(notifications, 15)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination (keyset; ?page=N links still work)
+    page_obj = paginate(
+        request, notifications, ('-created_at',), 15,
+        count_key=count_cache_key(request, 'notification_center'),
+    )
 
     # Get unread count
     unread_count = Notification.objects.filter(
@@ -1,15 +1,18 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.db import transaction, IntegrityError
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.core.paginator import EmptyPage, PageNotAnInteger
 from django.db.models import Q
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from django.http import JsonResponse, HttpResponse
 from ..models import Student, Centre, CustomUser, School
-import csv
+from ..utils.search import fuzzy_scores, rank_expression, STUDENT_TRIGRAM_FIELDS
+from ..utils.pagination import paginate, count_cache_key
+from ..utils.jobs import enqueue_job
+from ..utils.exports import export_response, export_links, EXPORT_FORMATS, STUDENT_EXPORT
+from ..utils.refdata import get_schools
 import openpyxl
-from io import TextIOWrapper
 import random
 
 
@@ -25,8 +28,8 @@ def get_schools_by_centre(request):
     if not centre_id:
         return JsonResponse({'schools': []})
     try:
-        schools = School.objects.filter(centre_id=centre_id).values('id', 'name')
-        return JsonResponse({'schools': list(schools)})
+        schools = [{'id': s.id, 'name': s.name} for s in get_schools(centre_id)]
+        return JsonResponse({'schools': schools})
     except Exception as e:
         print(f"Error fetching schools for centre {centre_id}: {str(e)}")
         return JsonResponse({'schools': []}, status=500)
@@ -52,12 +55,16 @@ def manage_students(request):
     # Search functionality — now includes login ID
     query = request.GET.get('q', '').strip()
     if query:
+        # Names are matched fuzzily through the trigram index; IDs by prefix
+        name_scores = fuzzy_scores(STUDENT_TRIGRAM_FIELDS, query, candidates=students)
         students = students.filter(
-            Q(name__icontains=query) |
-            Q(child_ID__icontains=query) |
-            Q(user__login_id__icontains=query) |  # Search by login ID too
-            Q(school__name__icontains=query)
-        )
+            Q(pk__in=name_scores) |
+            Q(child_ID__istartswith=query) |
+            Q(user__login_id__istartswith=query) |  # Search by login ID too
+            Q(school__in=School.objects.filter(name__icontains=query))
+        ).annotate(
+            search_rank=rank_expression(name_scores, default=1.0)
+        ).order_by('-search_rank', 'name')
 
     # Pagination
     items_per_page_options = [10, 25, 50, 100]
@@ -69,9 +76,15 @@ def manage_students(request):
     except ValueError:
         items_per_page = 25
 
-    paginator = Paginator(students, items_per_page)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    export_format = request.GET.get('export')
+    if export_format in EXPORT_FORMATS:
+        return export_response(students, STUDENT_EXPORT, export_format, 'students', ordering=None if query else ('name',))
+
+    # Keyset pages by name; ranked search results keep the classic paginator
+    page_obj = paginate(
+        request, students, None if query else ('name',), items_per_page,
+        count_key=count_cache_key(request, 'manage_students'),
+    )
 
     # Get schools and centres for dropdowns
     if request.user.is_superuser or request.user.is_site_admin:
@@ -86,6 +99,7 @@ def manage_students(request):
 
     context = {
         'students': page_obj,
+        'export_links': export_links(request),
         'query': query,
         'items_per_page': items_per_page,
         'items_per_page_options': items_per_page_options,
@@ -185,77 +199,13 @@ def bulk_upload_students(request):
         messages.error(request, "Please upload a CSV or Excel file.")
         return redirect('manage_students')
 
-    try:
-        students_data = []
-        errors = []
-        created_count = 0
-
-        # Parse file
-        if uploaded_file.name.endswith('.csv'):
-            text_file = TextIOWrapper(uploaded_file.file, encoding='utf-8')
-            reader = csv.DictReader(text_file)
-            students_data = list(reader)
-        else:
-            wb = openpyxl.load_workbook(uploaded_file)
-            sheet = wb.active
-            headers = [cell.value for cell in sheet[1]]
-            for row in sheet.iter_rows(min_row=2, values_only=True):
-                students_data.append(dict(zip(headers, row)))
-
-        if not students_data:
-            messages.error(request, "File is empty.")
-            return redirect('manage_students')
-
-        with transaction.atomic():
-            for idx, row in enumerate(students_data, start=2):
-                first_name = str(row.get('first_name', '')).strip()
-                last_name = str(row.get('last_name', '') or '').strip()
-                child_ID = str(row.get('child_ID', '')).strip()
-                grade = str(row.get('grade', '') or '').strip()
-
-                if not all([first_name, child_ID]):
-                    errors.append(f"Row {idx}: first_name and child_ID required")
-                    continue
-
-                if Student.objects.filter(child_ID=child_ID).exists():
-                    errors.append(f"Row {idx}: child_ID {child_ID} already exists")
-                    continue
-
-                if grade and grade not in dict(Student.GRADE_CHOICES):
-                    errors.append(f"Row {idx}: Invalid grade '{grade}'")
-                    continue
-
-                try:
-                    student = Student(
-                        child_ID=child_ID,
-                        name=f"{first_name} {last_name}".strip(),
-                        centre=centre,
-                        school=school,
-                        grade=grade if grade else None
-                    )
-                    student.save()  # Creates user via signal
-
-                    # Set password = child_ID
-                    student.user.set_password(child_ID)
-                    student.user.force_password_change = True
-                    student.user.save()
-
-                    created_count += 1
-                except Exception as e:
-                    errors.append(f"Row {idx}: {str(e)}")
-
-        if created_count:
-            messages.success(request, f"{created_count} students uploaded successfully!")
-        if errors:
-            msg = "\n".join(errors[:10])
-            if len(errors) > 10:
-                msg += f"\n... and {len(errors)-10} more"
-            messages.error(request, msg)
-
-    except Exception as e:
-        messages.error(request, f"Error processing file: {str(e)}")
-
-    return redirect('manage_students')
+    # Rows are imported by a background worker (utils.jobs)
+    job = enqueue_job('student_import', request.user, params={
+        'centre_id': centre.pk,
+        'school_id': school.pk,
+    }, upload=uploaded_file)
+    messages.info(request, f"Upload of {uploaded_file.name} queued.")
+    return redirect('job_status', job_id=job.pk)
 
 @login_required
 def student_update(request, pk):
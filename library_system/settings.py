@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import django
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -92,6 +93,10 @@ if DEBUG:
             'NAME': BASE_DIR / 'db.sqlite3',
         }
     }
+    # utils.circulation.write_transaction() needs SQLite's write lock taken at
+    # BEGIN: Django >= 5.1 does that with this option, 5.0 is patched there
+    if django.VERSION >= (5, 1):
+        DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE'}
 else:
     DATABASES = {
         'default': {
@@ -179,6 +184,31 @@ LOGIN_URL = 'login_view'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'login_view'
 
+# Imports/exports are queued for `manage.py run_jobs` workers. Set BACKGROUND_JOBS_INLINE=True
+# (e.g. in development) to run them inside the request instead.
+BACKGROUND_JOBS_INLINE = os.getenv('BACKGROUND_JOBS_INLINE') == 'True'
+
+# Processes used to hash initial passwords during bulk student imports (default: one per CPU)
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '0')) or None
+
+# book_id numbers each process reserves at a time, so adding books doesn't lock
+# the BookIDSequence row per book (1 = strictly sequential, no gaps)
+BOOK_ID_BLOCK_SIZE = int(os.getenv('BOOK_ID_BLOCK_SIZE', '10'))
+
+# Days (MM-DD) the school terms open, for the dashboard's "This term" trend range
+SCHOOL_TERM_STARTS = os.getenv('SCHOOL_TERM_STARTS', '01-06,04-28,08-25').split(',')
+
+# One cache for every worker process: a database table (created by migration
+# 0019_cache_table), so version stamps, cached aggregates and the single-flight
+# locks (utils.single_flight) are shared by all of them
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.getenv('CACHE_TABLE', 'library_cache'),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '20000'))},
+    }
+}
+
 
 LOGGING = {
     'version': 1,